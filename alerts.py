@@ -0,0 +1,196 @@
+# alerts.py
+# =====================
+# watchlist 알림 규칙 엔진 (edge-trigger)
+# =====================
+# 규칙 (alert_rules, migrations/009_alert_rules.sql) 을 배열로 컴파일해 두고
+# 시세 갱신마다 전 규칙 × 전 종목을 한 번에 평가 (벡터 연산)
+#   - 조건이 거짓 → 참 으로 바뀔 때만 발송 (crossing 1회당 1번)
+#   - 값이 없는 종목 (pending / 조회 실패) 은 이전 상태 유지
+#   - 참인 (규칙, 종목) 은 active_tickers 로 저장 → 재시작해도 중복 발송 없음
+import threading
+
+import numpy as np
+
+from strategy import SELL_TARGET_RATIO
+
+# kind → (지표, 비교)
+RULE_KINDS = {
+    "RSI_BELOW": ("rsi", "lt"),             # RSI < x
+    "RSI_ABOVE": ("rsi", "gt"),             # RSI > x
+    "PRICE_OVER_AVG": ("avg_ratio", "ge"),  # 현재가 >= 평단가 × x (기본 1.10)
+    "CHANGE_PCT": ("abs_change_pct", "ge"), # |전일 대비 %| >= x
+    "RSI_DELTA": ("abs_rsi_delta", "ge"),   # |RSI - 전일 RSI| >= x
+}
+DEFAULT_THRESHOLDS = {
+    "RSI_BELOW": 30.0,
+    "RSI_ABOVE": 70.0,
+    "PRICE_OVER_AVG": SELL_TARGET_RATIO,
+    "CHANGE_PCT": 3.0,
+    "RSI_DELTA": 5.0,
+}
+METRICS = ("rsi", "price", "avg_ratio", "abs_change_pct", "abs_rsi_delta")
+OPS = ("lt", "gt", "ge")
+
+
+def _to_float(v) -> float:
+    try:
+        return float(v) if v is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class AlertEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rules: list[dict] = []
+        self.tickers: list[str] = []
+        self.state = np.zeros((0, 0), dtype=bool)   # 규칙 × 종목 (직전 조건)
+        self._seed: dict = {}
+        self._compile([])
+
+    # =====================
+    # 컴파일
+    # =====================
+    def _compile(self, rules: list[dict]):
+        self.rules = rules
+        self.rule_ids = np.array([r["id"] for r in rules], dtype=object)
+        self.metric_idx = np.array([METRICS.index(RULE_KINDS[r["kind"]][0]) for r in rules], dtype=int)
+        self.op_idx = np.array([OPS.index(RULE_KINDS[r["kind"]][1]) for r in rules], dtype=int)
+        self.thresholds = np.array(
+            [_to_float(r.get("threshold")) if r.get("threshold") is not None else DEFAULT_THRESHOLDS[r["kind"]] for r in rules],
+            dtype=float
+        )
+        self.rule_tickers = np.array([(r.get("ticker") or "").upper() for r in rules], dtype=object)
+        self.accounts = sorted({r.get("account_id") or "default" for r in rules}) or ["default"]
+        self.account_idx = np.array(
+            [self.accounts.index(r.get("account_id") or "default") for r in rules], dtype=int
+        )
+
+    def load(self, rules: list[dict]):
+        """
+        규칙 교체 (추가 / 삭제 / 수정 후)
+        직전 상태: 메모리 → 없으면 저장된 active_tickers
+        """
+        with self._lock:
+            previous = self._active_sets()
+            self._compile([r for r in rules if r.get("kind") in RULE_KINDS])
+            self._seed = {
+                r["id"]: previous.get(r["id"], set(r.get("active_tickers") or []))
+                for r in self.rules
+            }
+            self.state = self._state_matrix(self.tickers, self._seed)
+
+    def _active_sets(self) -> dict:
+        # 🔥 아직 평가 전 (종목 목록 없음) → load 때 받은 상태 그대로
+        if not self.tickers:
+            return dict(self._seed)
+        tickers = np.array(self.tickers, dtype=object)
+        return {rid: set(tickers[self.state[i]]) for i, rid in enumerate(self.rule_ids)}
+
+    def _state_matrix(self, tickers: list[str], active: dict) -> np.ndarray:
+        tickers = np.array(tickers, dtype=object)
+        state = np.zeros((len(self.rules), len(tickers)), dtype=bool)
+        for i, rid in enumerate(self.rule_ids):
+            if active.get(rid):
+                state[i] = np.isin(tickers, list(active[rid]))
+        return state
+
+    # =====================
+    # 평가
+    # =====================
+    def evaluate(self, items: list[dict], avg_prices: dict[str, dict[str, float]]) -> tuple[list[dict], dict]:
+        """
+        items      : watchlist 스냅샷 items (ticker, current_price, current_change_pct, rsi, rsi_change)
+        avg_prices : {account_id: {ticker: 평단가}} — 캐시된 잔고 스냅샷 (추가 조회 없음)
+        Returns    : (발송할 알림 목록, 상태가 바뀐 규칙 {rule_id: active_tickers})
+        """
+        with self._lock:
+            if not self.rules or not items:
+                return [], {}
+
+            tickers = [i["ticker"].upper() for i in items]
+            if tickers != self.tickers:
+                self.state = self._state_matrix(tickers, self._active_sets())
+                self.tickers = tickers
+
+            # 🔥 종목 지표 (지표 × 종목)
+            price = np.array([_to_float(i.get("current_price")) for i in items])
+            rsi = np.array([_to_float(i.get("rsi")) for i in items])
+            change = np.array([_to_float(i.get("current_change_pct")) for i in items])
+            rsi_delta = np.array([_to_float(i.get("rsi_change")) for i in items])
+            # pending / stale 항목은 값 없음 → 상태 유지
+            unknown = np.array([bool(i.get("pending") or i.get("stale")) for i in items])
+            rsi = np.where(unknown, np.nan, rsi)
+            price = np.where(unknown, np.nan, price)
+
+            avg = np.array([
+                [_to_float(avg_prices.get(a, {}).get(t)) for t in tickers]
+                for a in self.accounts
+            ])
+            avg = np.where(avg > 0, avg, np.nan)
+
+            base = np.vstack([
+                rsi,
+                price,
+                np.full_like(price, np.nan),   # avg_ratio 는 규칙 계좌별로 아래에서
+                np.where(unknown, np.nan, np.abs(change)),
+                np.where(unknown, np.nan, np.abs(rsi_delta)),
+            ])
+
+            # 🔥 규칙 × 종목 값
+            values = base[self.metric_idx]
+            is_avg = self.metric_idx == METRICS.index("avg_ratio")
+            if is_avg.any():
+                values[is_avg] = price / avg[self.account_idx[is_avg]]
+
+            thr = self.thresholds[:, None]
+            with np.errstate(invalid="ignore"):
+                cond = np.select(
+                    [self.op_idx[:, None] == 0, self.op_idx[:, None] == 1],
+                    [values < thr, values > thr],
+                    default=values >= thr
+                )
+
+            # 종목 지정 규칙은 해당 종목만
+            applies = (self.rule_tickers[:, None] == "") | (self.rule_tickers[:, None] == np.array(tickers, dtype=object)[None, :])
+            cond = np.where(np.isnan(values), self.state, cond & applies)
+
+            fired_mask = cond & ~self.state
+            changed_rows = np.flatnonzero((cond != self.state).any(axis=1))
+            self.state = cond
+
+            fired = [
+                {
+                    "rule_id": self.rule_ids[r],
+                    "kind": self.rules[r]["kind"],
+                    "ticker": tickers[t],
+                    "threshold": float(self.thresholds[r]),
+                    "value": float(values[r, t]),
+                    "user_id": self.rules[r].get("user_id"),
+                }
+                for r, t in zip(*np.nonzero(fired_mask))
+            ]
+            tickers_arr = np.array(tickers, dtype=object)
+            changed = {
+                self.rule_ids[r]: sorted(tickers_arr[cond[r]].tolist())
+                for r in changed_rows
+            }
+            return fired, changed
+
+
+def format_alert(a: dict) -> str:
+    kind = a["kind"]
+    t = a["ticker"]
+    v = a["value"]
+    x = a["threshold"]
+    if kind == "RSI_BELOW":
+        return f"🔵 {t} RSI {v:.2f} < {x:g}"
+    if kind == "RSI_ABOVE":
+        return f"🔴 {t} RSI {v:.2f} > {x:g}"
+    if kind == "PRICE_OVER_AVG":
+        return f"💰 {t} 현재가 평단가 ×{v:.3f} (기준 ×{x:g})"
+    if kind == "CHANGE_PCT":
+        return f"📈 {t} 전일 대비 {v:.2f}% (기준 {x:g}%)"
+    if kind == "RSI_DELTA":
+        return f"⚡ {t} RSI 전일 대비 {v:.2f} 변동 (기준 {x:g})"
+    return f"{t} {kind} {v}"
@@ -0,0 +1,282 @@
+# backtest.py
+# =====================
+# 반복 매수/매도 전략 백테스트 (BUY_MARKET / BUY_AVG / SELL)
+# =====================
+# build_order_preview 규칙을 일봉으로 재현
+#   - 주문 가격은 장 시작가(open) 기준 (cron 이 장 시작 후 실행)
+#   - BUY_MARKET: LOC min(평단×1.05, 현재가×1.15), 미보유면 현재가×1.15
+#   - BUY_AVG:    LOC 평단가 (보유 중일 때만)
+#   - LOC 는 종가 ≤ 지정가면 종가에 체결, 수량 = (seed/80) // 지정가
+#   - SELL: 평단×1.10 지정가 (현재가가 이미 위면 현재가), 고가 도달 시 전량 체결
+#
+# 시나리오 = (종목, 파라미터 조합), 상태 배열 (S,) 을 하루씩 NumPy 로 진행
+#
+# 사용:
+#   python backtest.py --tickers TQQQ SOXL --start 2015-01-01 --seed 10000 --slices 40 80
+import argparse
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+from market_data import download_daily_bars
+from strategy import (
+    BUY_SLICES, BUY_MARKET_AVG_RATIO, BUY_MARKET_CUR_RATIO, SELL_TARGET_RATIO
+)
+
+PARAM_COLUMNS = ("slices", "avg_ratio", "cur_ratio", "sell_ratio", "seed", "buy_market", "buy_avg")
+DEFAULT_SEED = 10000.0
+TRADING_DAYS = 252
+
+
+def build_param_grid(
+    slices=(BUY_SLICES,),
+    avg_ratio=(BUY_MARKET_AVG_RATIO,),
+    cur_ratio=(BUY_MARKET_CUR_RATIO,),
+    sell_ratio=(SELL_TARGET_RATIO,),
+    seed=(DEFAULT_SEED,),
+    buy_market=(True,),
+    buy_avg=(True,),
+) -> pd.DataFrame:
+    """파라미터 조합 전체 (카테시안 곱)"""
+    rows = itertools.product(slices, avg_ratio, cur_ratio, sell_ratio, seed, buy_market, buy_avg)
+    return pd.DataFrame(list(rows), columns=list(PARAM_COLUMNS))
+
+
+def bars_to_arrays(bars: dict[str, pd.DataFrame]) -> tuple[np.ndarray, list[str], pd.DatetimeIndex]:
+    """{field: DataFrame} → (4, T, N) 배열 [open, high, low, close]"""
+    close = bars["Close"]
+    arr = np.stack([
+        bars[f].reindex(index=close.index, columns=close.columns).to_numpy(dtype=float)
+        for f in ("Open", "High", "Low", "Close")
+    ])
+    return arr, list(close.columns), close.index
+
+
+def simulate(prices: np.ndarray, tick_idx: np.ndarray, params: dict, fee_rate: float = 0.0) -> dict:
+    """
+    prices:   (4, T, N) open/high/low/close
+    tick_idx: (S,) 시나리오별 종목 열 번호
+    params:   PARAM_COLUMNS → (S,) 배열
+    Returns:  지표 이름 → (S,) 배열
+    """
+    opens, highs, lows, closes = prices
+    T = closes.shape[0]
+    S = len(tick_idx)
+
+    slices = np.asarray(params["slices"], dtype=float)
+    avg_r = np.asarray(params["avg_ratio"], dtype=float)
+    cur_r = np.asarray(params["cur_ratio"], dtype=float)
+    sell_r = np.asarray(params["sell_ratio"], dtype=float)
+    seed = np.asarray(params["seed"], dtype=float)
+    use_market = np.asarray(params["buy_market"], dtype=bool)
+    use_avg = np.asarray(params["buy_avg"], dtype=bool)
+    slice_amount = seed / slices
+
+    # =====================
+    # 상태
+    # =====================
+    cash = seed.copy()
+    qty = np.zeros(S)
+    cost = np.zeros(S)
+    cycle_start = np.full(S, -1)
+    cycles = np.zeros(S, dtype=int)
+    cycle_days = np.zeros(S)
+    realized = np.zeros(S)
+    buys = np.zeros(S, dtype=int)
+    short_days = np.zeros(S, dtype=int)
+    peak = seed.copy()
+    max_dd = np.zeros(S)
+    max_usage = np.zeros(S)
+    usage_sum = np.zeros(S)
+    days_in = np.zeros(S, dtype=int)
+    last_close = np.full(S, np.nan)
+
+    for t in range(T):
+        o = opens[t, tick_idx]
+        h = highs[t, tick_idx]
+        c = closes[t, tick_idx]
+        valid = ~(np.isnan(o) | np.isnan(h) | np.isnan(c))
+        holding = valid & (qty > 0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg = np.where(qty > 0, cost / qty, 0.0)
+
+        # =====================
+        # SELL (평단 +10% 지정가, 이미 넘으면 현재가)
+        # =====================
+        target = np.round(avg * sell_r, 2)
+        sell_price = np.where(o > target, np.round(o, 2), target)
+        sold = holding & (h >= sell_price)
+
+        proceeds = qty * sell_price * (1 - fee_rate)
+        cash = np.where(sold, cash + proceeds, cash)
+        realized = np.where(sold, realized + proceeds - cost, realized)
+        cycles += sold
+        cycle_days = np.where(sold, cycle_days + (t - cycle_start + 1), cycle_days)
+        qty = np.where(sold, 0.0, qty)
+        cost = np.where(sold, 0.0, cost)
+        cycle_start = np.where(sold, -1, cycle_start)
+
+        # =====================
+        # BUY (LOC, 장 시작 시점 평단 기준)
+        # =====================
+        market_limit = np.where(
+            avg > 0,
+            np.round(np.minimum(avg * avg_r, o * cur_r), 2),
+            np.round(o * cur_r, 2)
+        )
+        avg_limit = np.round(avg, 2)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            q_market = np.where(use_market & valid & (c <= market_limit),
+                                np.floor(slice_amount / market_limit), 0.0)
+            q_avg = np.where(use_avg & valid & (avg > 0) & (c <= avg_limit),
+                             np.floor(slice_amount / avg_limit), 0.0)
+        q_buy = np.nan_to_num(q_market) + np.nan_to_num(q_avg)
+
+        # 🔥 현금 부족 시 살 수 있는 만큼만
+        unit = c * (1 + fee_rate)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            affordable = np.where(valid, np.floor(cash / unit), 0.0)
+        short = q_buy > affordable
+        q_buy = np.minimum(q_buy, affordable)
+        short_days += short & valid
+
+        bought = q_buy > 0
+        spend = np.where(bought, q_buy * unit, 0.0)
+        cash -= spend
+        cost += spend
+        qty += q_buy
+        buys += bought
+        cycle_start = np.where(bought & (cycle_start < 0), t, cycle_start)
+
+        # =====================
+        # 평가
+        # =====================
+        last_close = np.where(valid, c, last_close)
+        equity = cash + qty * np.nan_to_num(last_close)
+        peak = np.maximum(peak, equity)
+        max_dd = np.maximum(max_dd, 1 - equity / peak)
+
+        usage = cost / seed
+        max_usage = np.maximum(max_usage, usage)
+        in_market = qty > 0
+        usage_sum += np.where(in_market, usage, 0.0)
+        days_in += in_market
+
+    equity = cash + qty * np.nan_to_num(last_close)
+    open_days = np.where(cycle_start >= 0, T - cycle_start, 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "final_equity": equity,
+            "total_return": equity / seed - 1,
+            "realized_pnl": realized,
+            "max_drawdown": max_dd,
+            "cycles": cycles,
+            "avg_cycle_days": np.where(cycles > 0, cycle_days / cycles, np.nan),
+            "open_cycle_days": open_days,
+            "buy_days": buys,
+            "cash_short_days": short_days,
+            "max_cash_usage": max_usage,
+            "avg_cash_usage": np.where(days_in > 0, usage_sum / days_in, 0.0),
+            "days_in_market": days_in,
+        }
+
+
+def run_backtest(
+    bars: dict[str, pd.DataFrame],
+    params: pd.DataFrame | None = None,
+    fee_rate: float = 0.0
+) -> pd.DataFrame:
+    """
+    bars:   download_daily_bars 결과 (Open/High/Low/Close)
+    params: build_param_grid 결과 (없으면 현재 전략 기본값)
+    Returns: (종목 × 파라미터) 시나리오별 결과
+    """
+    if params is None:
+        params = build_param_grid()
+    prices, tickers, index = bars_to_arrays(bars)
+    return run_backtest_arrays(prices, tickers, index, params, fee_rate)
+
+
+def run_backtest_arrays(
+    prices: np.ndarray,
+    tickers: list[str],
+    index: pd.DatetimeIndex,
+    params: pd.DataFrame,
+    fee_rate: float = 0.0
+) -> pd.DataFrame:
+    tick_idx, grid = build_scenarios(len(tickers), params)
+    metrics = simulate(prices, tick_idx, grid, fee_rate)
+    return scenario_frame(prices, tickers, index, tick_idx, grid, metrics)
+
+
+def build_scenarios(n_tickers: int, params: pd.DataFrame) -> tuple[np.ndarray, dict]:
+    """(종목 × 파라미터) 시나리오 → (tick_idx, PARAM_COLUMNS → (S,) 배열)"""
+    n_params = len(params)
+    tick_idx = np.repeat(np.arange(n_tickers), n_params)
+    grid = {c: np.tile(params[c].to_numpy(), n_tickers) for c in PARAM_COLUMNS}
+    return tick_idx, grid
+
+
+def scenario_frame(
+    prices: np.ndarray,
+    tickers: list[str],
+    index: pd.DatetimeIndex,
+    tick_idx: np.ndarray,
+    grid: dict,
+    metrics: dict
+) -> pd.DataFrame:
+    # 🔥 종목별 실제 데이터 구간으로 연환산
+    valid_days = (~np.isnan(prices[3])).sum(axis=0)[tick_idx]
+    years = np.maximum(valid_days / TRADING_DAYS, 1e-9)
+    with np.errstate(invalid="ignore"):
+        cagr = np.power(np.maximum(1 + metrics["total_return"], 0), 1 / years) - 1
+
+    out = pd.DataFrame({
+        "ticker": np.asarray(tickers, dtype=object)[tick_idx],
+        **grid,
+        **metrics,
+        "cagr": cagr,
+    })
+    out.attrs["start"] = index[0].date().isoformat() if len(index) else None
+    out.attrs["end"] = index[-1].date().isoformat() if len(index) else None
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="repeat strategy backtest")
+    parser.add_argument("--tickers", nargs="+", required=True)
+    parser.add_argument("--start", required=True)
+    parser.add_argument("--end")
+    parser.add_argument("--seed", nargs="+", type=float, default=[DEFAULT_SEED])
+    parser.add_argument("--slices", nargs="+", type=float, default=[BUY_SLICES])
+    parser.add_argument("--avg-ratio", nargs="+", type=float, default=[BUY_MARKET_AVG_RATIO])
+    parser.add_argument("--cur-ratio", nargs="+", type=float, default=[BUY_MARKET_CUR_RATIO])
+    parser.add_argument("--sell-ratio", nargs="+", type=float, default=[SELL_TARGET_RATIO])
+    parser.add_argument("--fee", type=float, default=0.0)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    bars = download_daily_bars(args.tickers, args.start, args.end)
+    grid = build_param_grid(
+        slices=args.slices,
+        avg_ratio=args.avg_ratio,
+        cur_ratio=args.cur_ratio,
+        sell_ratio=args.sell_ratio,
+        seed=args.seed,
+    )
+
+    t0 = time.time()
+    result = run_backtest(bars, grid, fee_rate=args.fee)
+    elapsed = time.time() - t0
+
+    print(f"{len(result)} scenarios in {elapsed:.2f}s")
+    print(
+        result.sort_values("cagr", ascending=False)
+        .head(args.top)
+        .to_string(index=False, float_format=lambda v: f"{v:.4f}")
+    )
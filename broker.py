@@ -0,0 +1,509 @@
+# broker.py
+# =====================
+# 브로커 백엔드 선택 — BROKER_BACKEND=kis (기본) | sim
+# =====================
+# main.py / order_ledger.py 는 kis_api 함수 대신 broker.xxx 호출
+#   kis : kis_api 그대로 (실계좌)
+#   sim : 메모리 시뮬레이터 (부하 테스트 / dry-run / paper 모드)
+#         - 계좌별 현금 · 보유 종목 · 주문 내역
+#         - 매수 LOC(34) / 지정가(00) 는 장 마감 종가로 체결 판정 (settle_close)
+#         - 호출 지연, KIS 초당 호출 제한 오류 (EGW00201), 응답 불명 주문 재현
+#
+# 시뮬레이터 환경 변수
+#   SIM_CASH=100000  SIM_LATENCY_MS=80  SIM_SERVER_RATE=20  SIM_UNKNOWN_RATE=0
+#   SIM_STATE_FILE=/tmp/mume_sim.json   (paper 모드: 재시작해도 상태 유지)
+#
+# 부하 테스트: python broker.py loadtest --orders 500 --workers 16
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+import pytz
+
+import kis_api
+from tracing import span
+from kis_api import (
+    DEFAULT_ACCOUNT, BALANCE_CACHE_TTL, BUYING_POWER_CACHE_TTL, KIS_RATE_PER_SEC,
+    PRIORITY_ORDER, PRIORITY_POSITION, PRIORITY_UI, PRIORITY_NAMES,
+    KISBusyError, KISOrderUnknownError, RateLimiter, KIS_UI_MAX_WAIT
+)
+
+kst_tz = pytz.timezone("Asia/Seoul")
+
+
+# =====================
+# KIS (실계좌)
+# =====================
+class KISBroker:
+    name = "kis"
+
+    def __init__(self):
+        if not kis_api.ACCOUNTS:
+            raise RuntimeError("KIS account not set (KIS_APP_KEY / KIS_APP_SECRET / KIS_ACCOUNT_NO)")
+
+    list_accounts = staticmethod(kis_api.list_accounts)
+    get_access_token = staticmethod(kis_api.get_access_token)
+    get_kis_exchange_code = staticmethod(kis_api.get_kis_exchange_code)
+    get_overseas_balance = staticmethod(kis_api.get_overseas_balance)
+    peek_overseas_balance = staticmethod(kis_api.peek_overseas_balance)
+    get_overseas_avg_price = staticmethod(kis_api.get_overseas_avg_price)
+    get_buying_power = staticmethod(kis_api.get_buying_power)
+    invalidate_balance_cache = staticmethod(kis_api.invalidate_balance_cache)
+    invalidate_buying_power_cache = staticmethod(kis_api.invalidate_buying_power_cache)
+    order_overseas_stock = staticmethod(kis_api.order_overseas_stock)
+    inquire_overseas_orders = staticmethod(kis_api.inquire_overseas_orders)
+    scheduler_status = staticmethod(kis_api.scheduler_status)
+
+
+# =====================
+# 시뮬레이터
+# =====================
+class SimAccount:
+    def __init__(self, account_id: str, cash: float, rate: float):
+        self.id = account_id
+        self.cash = cash
+        self.reserved = 0.0          # 🔥 미체결 매수 주문 금액 (매수 가능 금액에서 제외)
+        self.positions = {}          # ticker → {"qty", "avg_price", "sellable_qty"}
+        self.orders = []             # _parse_order_row 모양 + "ord_dvsn"
+        self.limiter = RateLimiter(rate)
+
+    def to_dict(self) -> dict:
+        return {
+            "cash": self.cash,
+            "reserved": self.reserved,
+            "positions": self.positions,
+            "orders": self.orders,
+        }
+
+    def load(self, data: dict):
+        self.cash = data["cash"]
+        self.reserved = data["reserved"]
+        self.positions = data["positions"]
+        self.orders = data["orders"]
+
+
+class SimBroker:
+    """
+    kis_api 와 같은 함수 / 응답 모양 (main.py, order_ledger 그대로 사용)
+    """
+    name = "sim"
+
+    def __init__(
+        self,
+        accounts=None,
+        cash: float = 100_000,
+        latency: float = 0.08,
+        server_rate: float = 20,
+        unknown_rate: float = 0.0,
+        state_file: str | None = None,
+        seed: int | None = None
+    ):
+        accounts = accounts or kis_api.list_accounts() or [DEFAULT_ACCOUNT]
+        self.accounts = {
+            a: SimAccount(a, cash, float(os.getenv("KIS_RATE", KIS_RATE_PER_SEC)))
+            for a in accounts
+        }
+        self.latency = latency
+        self.unknown_rate = unknown_rate
+        self.state_file = state_file
+        self.marks = {}              # ticker → 마지막 종가 (평가용)
+        self.counters = {"calls": 0, "rate_limited": 0, "unknown": 0, "orders": 0, "fills": 0}
+        # 🔥 KIS 서버 쪽 초당 제한 (클라이언트 스케줄러를 넘기면 EGW00201)
+        self._server = {a: {"tokens": server_rate, "at": time.monotonic()} for a in accounts}
+        self._server_rate = server_rate
+        self._lock = threading.RLock()
+        self._odno = 0
+        self._random = random.Random(seed)
+        if state_file and os.path.exists(state_file):
+            self._load()
+
+    # ---------------------
+    # 상태 저장 (paper 모드)
+    # ---------------------
+    def _load(self):
+        with open(self.state_file) as f:
+            data = json.load(f)
+        for a, state in data["accounts"].items():
+            if a in self.accounts:
+                self.accounts[a].load(state)
+        self.marks = data.get("marks", {})
+        self._odno = data.get("odno", 0)
+
+    def _save(self):
+        if not self.state_file:
+            return
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "accounts": {a: acct.to_dict() for a, acct in self.accounts.items()},
+                "marks": self.marks,
+                "odno": self._odno,
+            }, f)
+        os.replace(tmp, self.state_file)
+
+    # ---------------------
+    # 호출 공통 (스케줄러 → 지연 → 서버 제한)
+    # ---------------------
+    def _account(self, account) -> SimAccount:
+        try:
+            return self.accounts[account or DEFAULT_ACCOUNT]
+        except KeyError:
+            raise ValueError(f"unknown KIS account: {account}")
+
+    def _call(self, acct: SimAccount, priority: int):
+        timeout = KIS_UI_MAX_WAIT if priority >= PRIORITY_UI else None
+        with span("KIS wait", "kis", priority=PRIORITY_NAMES[priority]):
+            acquired = acct.limiter.acquire(priority, timeout=timeout)
+        if not acquired:
+            raise KISBusyError(f"KIS 호출 예산 부족 ({acct.id}, {PRIORITY_NAMES[priority]})")
+
+        if self.latency:
+            with span("KIS sim", "kis", account=acct.id):
+                time.sleep(self.latency * self._random.uniform(0.5, 1.5))
+
+        with self._lock:
+            self.counters["calls"] += 1
+            server = self._server[acct.id]
+            now = time.monotonic()
+            server["tokens"] = min(self._server_rate, server["tokens"] + (now - server["at"]) * self._server_rate)
+            server["at"] = now
+            if server["tokens"] < 1:
+                self.counters["rate_limited"] += 1
+                raise RuntimeError("KIS 오류: {'rt_cd': '1', 'msg_cd': 'EGW00201', 'msg1': '초당 거래건수를 초과하였습니다.'}")
+            server["tokens"] -= 1
+
+    # ---------------------
+    # 계좌 / 토큰 / 거래소
+    # ---------------------
+    def list_accounts(self) -> list[str]:
+        return list(self.accounts)
+
+    def get_access_token(self, min_ttl: float = 0, account=None):
+        return f"sim-token-{self._account(account).id}"
+
+    def get_kis_exchange_code(self, ticker: str, account=None) -> str:
+        return "NASD"
+
+    def invalidate_balance_cache(self, account=None):
+        pass
+
+    def invalidate_buying_power_cache(self, account=None):
+        pass
+
+    def scheduler_status(self) -> dict:
+        return {
+            a: {**acct.limiter.status(), "sim": dict(self.counters)}
+            for a, acct in self.accounts.items()
+        }
+
+    # ---------------------
+    # 잔고 / 매수 가능 금액
+    # ---------------------
+    def get_overseas_balance(self, max_age: float = BALANCE_CACHE_TTL, account=None, priority=PRIORITY_POSITION) -> dict:
+        acct = self._account(account)
+        self._call(acct, priority)
+        return self._balance(acct)
+
+    def peek_overseas_balance(self, account=None) -> dict:
+        return self._balance(self._account(account))
+
+    def _balance(self, acct: SimAccount) -> dict:
+        with self._lock:
+            positions = {}
+            total_cost = 0.0
+            eval_pnl = 0.0
+            for t, p in acct.positions.items():
+                if p["qty"] <= 0:
+                    continue
+                mark = self.marks.get(t, p["avg_price"])
+                cost = p["qty"] * p["avg_price"]
+                value = p["qty"] * mark
+                total_cost += cost
+                eval_pnl += value - cost
+                positions[t] = {
+                    "found": True,
+                    "ticker": t,
+                    "name": t,
+                    "avg_price": round(p["avg_price"], 4),
+                    "qty": p["qty"],
+                    "sellable_qty": p["sellable_qty"],
+                    "total_cost": round(cost, 2),
+                    "kis_price": mark,
+                    "kis_eval_amount": round(value, 2),
+                    "kis_pnl": round(value - cost, 2),
+                    "excg": "NASD",
+                }
+            return {
+                "positions": positions,
+                "totals": {
+                    "total_cost": round(total_cost, 2),
+                    "realized_pnl": 0.0,
+                    "total_pnl": round(eval_pnl, 2),
+                    "total_pnl_pct": round(eval_pnl / total_cost * 100, 2) if total_cost else 0.0,
+                    "eval_pnl": round(eval_pnl, 2),
+                },
+                "fetched_at": time.time()
+            }
+
+    def get_overseas_avg_price(self, ticker: str, max_age: float = 0, account=None, priority=PRIORITY_POSITION):
+        pos = self.get_overseas_balance(account=account, priority=priority)["positions"].get(ticker.upper())
+        if pos:
+            return {
+                "found": True,
+                "avg_price": pos["avg_price"],
+                "qty": pos["qty"],
+                "sellable_qty": pos["sellable_qty"],
+                "total_cost": pos["total_cost"],
+                "excg": pos["excg"],
+            }
+        return {"found": False, "avg_price": 0, "qty": 0, "sellable_qty": 0, "total_cost": 0, "excg": None}
+
+    def get_buying_power(self, tickers=None, max_age=BUYING_POWER_CACHE_TTL, account=None, priority=PRIORITY_POSITION) -> dict:
+        acct = self._account(account)
+        self._call(acct, priority)
+        with self._lock:
+            amount = round(acct.cash - acct.reserved, 2)
+        return {
+            "buying_power": amount,
+            "by_exchange": {
+                "NASD": {"ticker": "AAPL", "buying_power": amount, "max_qty": None, "error": None}
+            },
+            "fetched_at": time.time()
+        }
+
+    # ---------------------
+    # 주문
+    # ---------------------
+    def order_overseas_stock(self, ticker: str, price: float, qty: int, side: str, account=None):
+        acct = self._account(account)
+        self._call(acct, PRIORITY_ORDER)
+        ticker = ticker.upper()
+        is_buy = side == "buy"
+        amount = round(price * qty, 2)
+
+        with self._lock:
+            if qty <= 0:
+                raise RuntimeError("KIS 주문 실패: {'rt_cd': '1', 'msg1': '주문수량 오류'}")
+            if is_buy and amount > acct.cash - acct.reserved:
+                raise RuntimeError("KIS 주문 실패: {'rt_cd': '1', 'msg1': '주문가능금액을 초과 하였습니다'}")
+            pos = acct.positions.get(ticker)
+            if not is_buy and (not pos or pos["sellable_qty"] < qty):
+                raise RuntimeError("KIS 주문 실패: {'rt_cd': '1', 'msg1': '주문가능수량을 초과 하였습니다'}")
+
+            self._odno += 1
+            odno = f"{self._odno:010d}"
+            now = datetime.now(kst_tz)
+            acct.orders.append({
+                "odno": odno,
+                "orgn_odno": "",
+                "order_date": now.strftime("%Y%m%d"),
+                "order_time": now.strftime("%H%M%S"),
+                "ticker": ticker,
+                "side": side,
+                "qty": int(qty),
+                "price": round(float(price), 2),
+                "filled_qty": 0,
+                "filled_price": 0.0,
+                "filled_amount": 0.0,
+                "unfilled_qty": int(qty),
+                "status": "접수",
+                "reject_reason": "",
+                "excg": "NASD",
+                "ord_dvsn": "34" if is_buy else "00",
+            })
+            if is_buy:
+                acct.reserved += amount
+            else:
+                pos["sellable_qty"] -= qty
+            self.counters["orders"] += 1
+            self._save()
+
+            # 🔥 접수는 됐는데 응답 유실 (order_ledger 대조 경로 재현)
+            if self._random.random() < self.unknown_rate:
+                self.counters["unknown"] += 1
+                raise KISOrderUnknownError("KIS 주문 응답 불명: simulated read timeout")
+
+        return {
+            "rt_cd": "0",
+            "msg_cd": "APBK0013",
+            "msg1": "주문 전송 완료 되었습니다.",
+            "output": {"KRX_FWDG_ORD_ORGNO": "", "ODNO": odno, "ORD_TMD": now.strftime("%H%M%S")}
+        }
+
+    def inquire_overseas_orders(self, start_date: str, end_date: str, ticker: str = "%", max_pages: int = 20, account=None, priority=PRIORITY_ORDER) -> list[dict]:
+        acct = self._account(account)
+        self._call(acct, priority)
+        ticker = ticker.upper()
+        with self._lock:
+            return [
+                {k: v for k, v in o.items() if k != "ord_dvsn"}
+                for o in reversed(acct.orders)
+                if start_date <= o["order_date"] <= end_date
+                and (ticker == "%" or o["ticker"] == ticker)
+            ]
+
+    # ---------------------
+    # 장 마감 체결 판정
+    # ---------------------
+    def settle_close(self, closes: dict[str, float]) -> dict:
+        """
+        미체결 주문을 종가로 체결 / 만료
+          LOC 매수 : 종가 <= 지정가 → 종가 체결
+          지정가   : 매수 종가 <= 지정가, 매도 종가 >= 지정가 → 지정가 체결
+          나머지   : 당일 주문 만료 (예약 금액 / 매도 수량 복구)
+        """
+        filled = 0
+        expired = 0
+        with self._lock:
+            for t, px in closes.items():
+                if px:
+                    self.marks[t.upper()] = float(px)
+            for acct in self.accounts.values():
+                for o in acct.orders:
+                    if o["unfilled_qty"] <= 0 or o["status"] != "접수":
+                        continue
+                    close = closes.get(o["ticker"])
+                    if close is None:
+                        continue
+                    close = float(close)
+                    is_buy = o["side"] == "buy"
+                    if is_buy:
+                        hit = close <= o["price"]
+                        fill_price = close if o["ord_dvsn"] == "34" else o["price"]
+                    else:
+                        hit = close >= o["price"]
+                        fill_price = o["price"]
+
+                    qty = o["unfilled_qty"]
+                    pos = acct.positions.setdefault(o["ticker"], {"qty": 0, "avg_price": 0.0, "sellable_qty": 0})
+                    if is_buy:
+                        acct.reserved = max(0.0, acct.reserved - qty * o["price"])
+                    if not hit:
+                        if not is_buy:
+                            pos["sellable_qty"] += qty
+                        o["status"] = "거부"
+                        o["reject_reason"] = "미체결 만료"
+                        expired += 1
+                        continue
+
+                    amount = round(qty * fill_price, 2)
+                    if is_buy:
+                        total = pos["qty"] * pos["avg_price"] + amount
+                        pos["qty"] += qty
+                        pos["sellable_qty"] += qty
+                        pos["avg_price"] = total / pos["qty"]
+                        acct.cash -= amount
+                    else:
+                        pos["qty"] -= qty
+                        acct.cash += amount
+                        if pos["qty"] <= 0:
+                            acct.positions.pop(o["ticker"], None)
+                    o.update({
+                        "filled_qty": qty,
+                        "filled_price": fill_price,
+                        "filled_amount": amount,
+                        "unfilled_qty": 0,
+                        "status": "완료",
+                    })
+                    filled += 1
+            self.counters["fills"] += filled
+            self._save()
+        return {"filled": filled, "expired": expired}
+
+    def open_tickers(self) -> list[str]:
+        with self._lock:
+            return sorted({
+                o["ticker"]
+                for acct in self.accounts.values()
+                for o in acct.orders
+                if o["unfilled_qty"] > 0 and o["status"] == "접수"
+            })
+
+    def deposit(self, ticker: str, qty: int, avg_price: float, account=None):
+        """테스트용 초기 보유 종목"""
+        acct = self._account(account)
+        with self._lock:
+            acct.positions[ticker.upper()] = {"qty": qty, "avg_price": avg_price, "sellable_qty": qty}
+            self._save()
+
+
+def _make_broker():
+    backend = os.getenv("BROKER_BACKEND", "kis")
+    if backend == "kis":
+        return KISBroker()
+    if backend == "sim":
+        return SimBroker(
+            cash=float(os.getenv("SIM_CASH", "100000")),
+            latency=float(os.getenv("SIM_LATENCY_MS", "80")) / 1000,
+            server_rate=float(os.getenv("SIM_SERVER_RATE", "20")),
+            unknown_rate=float(os.getenv("SIM_UNKNOWN_RATE", "0")),
+            state_file=os.getenv("SIM_STATE_FILE"),
+        )
+    raise RuntimeError(f"unknown BROKER_BACKEND: {backend}")
+
+broker = _make_broker()
+
+
+if __name__ == "__main__":
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(description="broker simulator")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    lt = sub.add_parser("loadtest", help="시뮬레이터로 주문 경로 부하 테스트")
+    lt.add_argument("--orders", type=int, default=500)
+    lt.add_argument("--workers", type=int, default=16)
+    lt.add_argument("--latency-ms", type=float, default=80)
+    lt.add_argument("--server-rate", type=float, default=20)
+    lt.add_argument("--unknown-rate", type=float, default=0.0)
+    lt.add_argument("--ui-workers", type=int, default=4, help="동시에 잔고를 조회하는 화면 부하")
+    args = parser.parse_args()
+
+    sim = SimBroker(
+        cash=1e9,
+        latency=args.latency_ms / 1000,
+        server_rate=args.server_rate,
+        unknown_rate=args.unknown_rate,
+        seed=1
+    )
+    tickers = ["SOXL", "TQQQ", "TECL", "FNGU"]
+    latencies = []
+    errors = {}
+    stop = threading.Event()
+
+    def one(i):
+        t = tickers[i % len(tickers)]
+        started = time.monotonic()
+        try:
+            sim.get_overseas_avg_price(t, account=DEFAULT_ACCOUNT, priority=PRIORITY_ORDER)
+            sim.order_overseas_stock(t, 10.0, 1, "buy", account=DEFAULT_ACCOUNT)
+        except Exception as e:
+            key = type(e).__name__
+            errors[key] = errors.get(key, 0) + 1
+        latencies.append(time.monotonic() - started)
+
+    def ui_load():
+        while not stop.is_set():
+            try:
+                sim.get_overseas_balance(account=DEFAULT_ACCOUNT, priority=PRIORITY_UI)
+            except KISBusyError:
+                time.sleep(0.05)
+
+    ui_threads = [threading.Thread(target=ui_load, daemon=True) for _ in range(args.ui_workers)]
+    for th in ui_threads:
+        th.start()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(one, range(args.orders)))
+    elapsed = time.monotonic() - started
+    stop.set()
+
+    latencies.sort()
+    print(f"orders: {args.orders} in {elapsed:.1f}s → {args.orders / elapsed * 60:.0f}/min")
+    print(f"latency p50 {latencies[len(latencies) // 2] * 1000:.0f}ms  p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.0f}ms")
+    print("errors:", errors)
+    print("scheduler:", json.dumps(sim.scheduler_status(), ensure_ascii=False))
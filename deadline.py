@@ -0,0 +1,61 @@
+# deadline.py
+# =====================
+# 요청 단위 마감 시간 (deadline budget)
+# =====================
+# 엔드포인트에서 Deadline(초) 하나 만들어 upstream 호출까지 전달
+#   - HTTP timeout = deadline.timeout(기존 timeout)  → 남은 시간보다 오래 기다리지 않음
+#   - 여러 종목 병렬 = run_within(...)                → 마감까지 끝난 것만 결과, 나머지 pending
+# 마감 지난 작업은 백그라운드에서 끝까지 돌고 (스레드 강제 종료 불가) 결과만 버림
+import time
+from concurrent.futures import wait
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def elapsed(self) -> float:
+        return self.budget - (self.expires_at - time.monotonic())
+
+    def timeout(self, cap: float | None = None) -> float:
+        """upstream timeout 인자용: min(cap, 남은 시간), 이미 지났으면 DeadlineExceeded"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"deadline {self.budget}s exceeded")
+        return remaining if cap is None else min(cap, remaining)
+
+
+def run_within(deadline: Deadline, executor, fn, keys) -> tuple[dict, list, dict]:
+    """
+    keys 마다 fn(key) 병렬 실행, deadline 까지 기다림
+    Returns: (results {key: 값}, pending [key], errors {key: 예외})
+    """
+    futures = {executor.submit(fn, key): key for key in keys}
+    done, not_done = wait(futures, timeout=deadline.remaining())
+
+    results = {}
+    errors = {}
+    for f in done:
+        key = futures[f]
+        try:
+            results[key] = f.result()
+        except Exception as e:
+            errors[key] = e
+
+    pending = []
+    for f in not_done:
+        # 🔥 아직 시작 안 한 작업은 취소 (실행 중인 것은 끝까지 감)
+        f.cancel()
+        pending.append(futures[f])
+    return results, pending, errors
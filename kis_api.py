@@ -2,28 +2,191 @@
 import requests
 import os
 import time
+import threading
 import yfinance as yf
 
+from tracing import span
+
 BASE_URL = "https://openapi.koreainvestment.com:9443"
 
-APP_KEY = os.getenv("KIS_APP_KEY")
-APP_SECRET = os.getenv("KIS_APP_SECRET")
-ACCOUNT_NO = os.getenv("KIS_ACCOUNT_NO")  # 12345678-01
+DEFAULT_ACCOUNT = "default"
+KIS_RATE_PER_SEC = 15   # 🔥 KIS 실계좌 앱키당 초당 20건 제한 → 여유 두고 15
+
+# =====================
+# 앱키당 호출 스케줄러 (우선순위 token bucket)
+# =====================
+# 같은 앱키를 쓰는 모든 호출 (cron 주문 / 미리보기 / 화면 조회) 이 예산 하나를 나눠 씀
+#   ORDER    : 주문 전송 · 주문 내역 확인 · cron 주문 경로 잔고
+#   POSITION : 미리보기 / 즉시 주문 수량 확인, warmup
+#   UI       : 화면 조회 (평단가, 포트폴리오, 매수 가능 금액)
+# - 상위 우선순위가 기다리는 중이면 하위는 토큰을 가져가지 못함
+# - UI 는 버킷 일부 (UI_RESERVE) 를 남겨둬야 하고 최대 KIS_UI_MAX_WAIT 초만 대기
+#   → 초과 시 KISBusyError (호출 측은 캐시 반환)
+PRIORITY_ORDER = 0
+PRIORITY_POSITION = 1
+PRIORITY_UI = 2
+PRIORITY_NAMES = ("order", "position", "ui")
+UI_RESERVE = 0.3        # 🔥 UI 가 못 쓰는 버킷 비율 (주문 burst 용)
+KIS_UI_MAX_WAIT = 1.0   # 초
+
+class KISBusyError(RuntimeError):
+    """상위 우선순위 호출로 예산 부족 → 하위 호출 거절 (캐시 사용)"""
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiting = [0] * len(PRIORITY_NAMES)
+        self._granted = [0] * len(PRIORITY_NAMES)
+        self._rejected = [0] * len(PRIORITY_NAMES)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def _floor(self, priority: int) -> float:
+        # 🔥 이 우선순위가 쓰고 난 뒤 남아 있어야 하는 토큰
+        return self.capacity * UI_RESERVE if priority >= PRIORITY_UI else 0.0
+
+    def congested(self, priority: int) -> bool:
+        """지금 요청하면 기다려야 하는지 (하위 우선순위 캐시 우선 판단용)"""
+        with self._cond:
+            self._refill()
+            return (
+                any(self._waiting[:priority])
+                or self._tokens < 1 + self._floor(priority)
+            )
+
+    def acquire(self, priority: int = PRIORITY_ORDER, timeout: float | None = None) -> bool:
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    need = 1 + self._floor(priority)
+                    if not any(self._waiting[:priority]) and self._tokens >= need:
+                        self._tokens -= 1
+                        self._granted[priority] += 1
+                        return True
+                    wait = max((need - self._tokens) / self.rate, 0.01)
+                    if end is not None:
+                        remaining = end - time.monotonic()
+                        if remaining <= 0:
+                            self._rejected[priority] += 1
+                            return False
+                        wait = min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._waiting[priority] -= 1
+                # 🔥 대기열 변화 → 다른 우선순위 재확인
+                self._cond.notify_all()
+
+    def status(self) -> dict:
+        with self._cond:
+            self._refill()
+            return {
+                "tokens": round(self._tokens, 2),
+                "capacity": self.capacity,
+                "rate": self.rate,
+                "waiting": dict(zip(PRIORITY_NAMES, self._waiting)),
+                "granted": dict(zip(PRIORITY_NAMES, self._granted)),
+                "rejected": dict(zip(PRIORITY_NAMES, self._rejected)),
+            }
+
+# =====================
+# 계좌 (앱키 + 계좌번호 + 계좌별 토큰/캐시/속도 제한)
+# =====================
+class KISAccount:
+    def __init__(self, account_id: str, app_key: str, app_secret: str, account_no: str, rate: float = KIS_RATE_PER_SEC):
+        if not account_no or "-" not in account_no:
+            raise RuntimeError(f"KIS account '{account_id}': account no must be like '12345678-01'")
+
+        self.id = account_id
+        self.app_key = app_key
+        self.app_secret = app_secret
+        self.cano, self.acnt = account_no.split("-")
+
+        self.limiter = RateLimiter(rate)
+        self.token_cache = {
+            "access_token": None,
+            "expire_at": 0
+        }
+        self.token_lock = threading.Lock()
+        self.exchange_cache = {}
+        self.balance_cache = {
+            "data": None,
+            "fetched_at": 0
+        }
+        self.buying_power_cache = {
+            "data": None,
+            "fetched_at": 0
+        }
+        self.buying_power_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"KISAccount({self.id!r}, {self.cano}-{self.acnt})"
+
+def _load_accounts() -> dict:
+    """
+    기본 계좌: KIS_APP_KEY / KIS_APP_SECRET / KIS_ACCOUNT_NO
+    추가 계좌: KIS_ACCOUNTS="family,corp"
+        → KIS_FAMILY_APP_KEY / KIS_FAMILY_APP_SECRET / KIS_FAMILY_ACCOUNT_NO (/ KIS_FAMILY_RATE)
+    KIS 환경 변수가 하나도 없으면 빈 목록 (BROKER_BACKEND=sim)
+    """
+    default_env = ("KIS_APP_KEY", "KIS_APP_SECRET", "KIS_ACCOUNT_NO")
+    if not os.getenv("KIS_ACCOUNTS") and not any(os.getenv(k) for k in default_env):
+        return {}
+
+    accounts = {
+        DEFAULT_ACCOUNT: KISAccount(
+            DEFAULT_ACCOUNT,
+            os.getenv("KIS_APP_KEY"),
+            os.getenv("KIS_APP_SECRET"),
+            os.getenv("KIS_ACCOUNT_NO"),  # 12345678-01
+            float(os.getenv("KIS_RATE", KIS_RATE_PER_SEC))
+        )
+    }
+
+    for account_id in filter(None, (a.strip() for a in os.getenv("KIS_ACCOUNTS", "").split(","))):
+        prefix = f"KIS_{account_id.upper()}_"
+        accounts[account_id] = KISAccount(
+            account_id,
+            os.getenv(prefix + "APP_KEY"),
+            os.getenv(prefix + "APP_SECRET"),
+            os.getenv(prefix + "ACCOUNT_NO"),
+            float(os.getenv(prefix + "RATE", KIS_RATE_PER_SEC))
+        )
+
+    return accounts
 
-if not ACCOUNT_NO or "-" not in ACCOUNT_NO:
-    raise RuntimeError("KIS_ACCOUNT_NO must be like '12345678-01'")
+ACCOUNTS = _load_accounts()
 
-CANO, ACNT = ACCOUNT_NO.split("-")
+def get_account(account: "str | KISAccount | None" = None) -> KISAccount:
+    if isinstance(account, KISAccount):
+        return account
+    try:
+        return ACCOUNTS[account or DEFAULT_ACCOUNT]
+    except KeyError:
+        raise ValueError(f"unknown KIS account: {account}")
 
-_token_cache = {
-    "access_token": None,
-    "expire_at": 0
-}
-_exchange_cache = {}
+def list_accounts() -> list[str]:
+    return list(ACCOUNTS)
 
-def get_kis_exchange_code(ticker: str) -> str:
-    if ticker in _exchange_cache:
-        return _exchange_cache[ticker]
+def scheduler_status() -> dict:
+    return {account_id: acct.limiter.status() for account_id, acct in ACCOUNTS.items()}
+
+def get_kis_exchange_code(ticker: str, account=None) -> str:
+    cache = get_account(account).exchange_cache
+    if ticker in cache:
+        return cache[ticker]
     info = yf.Ticker(ticker).fast_info
     exchange = info.get("exchange", "")
     if exchange in ("NMS", "NASDAQ"):
@@ -36,45 +199,63 @@ def get_kis_exchange_code(ticker: str) -> str:
     else:
         code = "NASD"  # 안전 fallback
 
-    _exchange_cache[ticker] = code
+    cache[ticker] = code
     return code
      
 # =====================
 # Access Token
 # =====================
-def get_access_token():
-    now = time.time()
+def get_access_token(min_ttl: float = 0, account=None):
+    """
+    min_ttl: 남은 유효시간이 이보다 짧으면 미리 재발급 (장 시작 전 warmup 용)
+    """
+    acct = get_account(account)
+    token_cache = acct.token_cache
 
-    if _token_cache["access_token"] and now < _token_cache["expire_at"]:
-        return _token_cache["access_token"]
+    # 🔥 같은 계좌 동시 재발급 방지 (KIS 토큰 발급은 분당 1회 제한)
+    with acct.token_lock:
+        now = time.time()
 
-    url = f"{BASE_URL}/oauth2/tokenP"
+        if token_cache["access_token"] and now + min_ttl < token_cache["expire_at"]:
+            return token_cache["access_token"]
 
-    headers = {
-        "Content-Type": "application/json"
-    }
+        url = f"{BASE_URL}/oauth2/tokenP"
 
-    body = {
-        "grant_type": "client_credentials",
-        "appkey": APP_KEY,
-        "appsecret": APP_SECRET
-    }
+        headers = {
+            "Content-Type": "application/json"
+        }
 
-    res = requests.post(url, headers=headers, json=body)  # 🔥 headers 추가
-    res.raise_for_status()
+        body = {
+            "grant_type": "client_credentials",
+            "appkey": acct.app_key,
+            "appsecret": acct.app_secret
+        }
 
-    j = res.json()
+        with span("KIS tokenP", "kis", account=acct.id):
+            res = requests.post(url, headers=headers, json=body)  # 🔥 headers 추가
+        res.raise_for_status()
 
-    _token_cache["access_token"] = j["access_token"]
-    _token_cache["expire_at"] = now + j["expires_in"] - 60
+        j = res.json()
 
-    return j["access_token"]
+        token_cache["access_token"] = j["access_token"]
+        token_cache["expire_at"] = now + j["expires_in"] - 60
+
+        return j["access_token"]
 
 # =====================
 # 🔥 공통 KIS 요청 함수 (자동 토큰 재발급 + 1회 재시도)
 # =====================
-def _kis_request(method, url, headers=None, params=None, json=None):
-    token = get_access_token()
+KIS_TIMEOUT = 10  # 초
+
+def _kis_acquire(acct: KISAccount, priority: int):
+    # 🔥 UI 는 오래 기다리지 않고 거절 (호출 측에서 캐시 반환)
+    timeout = KIS_UI_MAX_WAIT if priority >= PRIORITY_UI else None
+    if not acct.limiter.acquire(priority, timeout=timeout):
+        raise KISBusyError(f"KIS 호출 예산 부족 ({acct.id}, {PRIORITY_NAMES[priority]})")
+
+def _kis_request(method, url, headers=None, params=None, json=None, timeout=KIS_TIMEOUT, account=None, priority=PRIORITY_POSITION):
+    acct = get_account(account)
+    token = get_access_token(account=acct)
 
     if headers is None:
         headers = {}
@@ -84,108 +265,222 @@ def _kis_request(method, url, headers=None, params=None, json=None):
         "authorization": f"Bearer {token}"
     }
 
-    res = requests.request(
-        method=method,
-        url=url,
-        headers=headers,
-        params=params,
-        json=json
-    )
+    # 🔥 앱키 단위 속도 제한 (우선순위)
+    endpoint = url.rsplit("/", 1)[-1]
+    with span("KIS wait", "kis", priority=PRIORITY_NAMES[priority]):
+        _kis_acquire(acct, priority)
+    with span(f"KIS {endpoint}", "kis", account=acct.id, tr_id=headers.get("tr_id")):
+        res = requests.request(
+            method=method,
+            url=url,
+            headers=headers,
+            params=params,
+            json=json,
+            timeout=timeout
+        )
 
     # 🔥 401이면 토큰 만료 → 강제 재발급 후 1회 재시도
     if res.status_code == 401:
-        print("🔥 KIS 토큰 만료 → 재발급 후 재시도")
+        print(f"🔥 KIS 토큰 만료 ({acct.id}) → 재발급 후 재시도")
 
-        _token_cache["access_token"] = None
-        token = get_access_token()
+        acct.token_cache["access_token"] = None
+        token = get_access_token(account=acct)
 
         headers["authorization"] = f"Bearer {token}"
 
-        res = requests.request(
-            method=method,
-            url=url,
-            headers=headers,
-            params=params,
-            json=json
-        )
+        with span("KIS wait", "kis", priority=PRIORITY_NAMES[priority]):
+            _kis_acquire(acct, priority)
+        with span(f"KIS {endpoint}", "kis", account=acct.id, tr_id=headers.get("tr_id"), retry=True):
+            res = requests.request(
+                method=method,
+                url=url,
+                headers=headers,
+                params=params,
+                json=json,
+                timeout=timeout
+            )
 
     res.raise_for_status()
     return res
     
 # =====================
-# 해외주식 평단가 조회
+# 해외주식 잔고 스냅샷 (전체 보유 종목 1회 조회)
 # =====================
-def get_overseas_avg_price(ticker: str):
-    excg_cd = get_kis_exchange_code(ticker)
+BALANCE_CACHE_TTL = 15  # 초
+
+def _to_float(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _parse_balance_position(item: dict) -> dict:
+    return {
+        "found": True,
+        "ticker": item.get("ovrs_pdno", "").upper(),
+        "name": item.get("ovrs_item_name"),
+        "avg_price": _to_float(item.get("pchs_avg_pric")),
+        "qty": int(_to_float(item.get("ovrs_cblc_qty"))),
+        "sellable_qty": int(_to_float(item.get("ord_psbl_qty"))),  # 🔥 실제 매도 가능 수량
+        "total_cost": _to_float(item.get("frcr_pchs_amt1")),
+        "kis_price": _to_float(item.get("now_pric2")),
+        "kis_eval_amount": _to_float(item.get("ovrs_stck_evlu_amt")),
+        "kis_pnl": _to_float(item.get("frcr_evlu_pfls_amt")),
+        "excg": item.get("ovrs_excg_cd"),
+    }
+
+def _parse_balance_totals(output2) -> dict:
+    # 🔥 output2 는 dict 또는 [dict] 로 내려옴
+    if isinstance(output2, list):
+        output2 = output2[0] if output2 else {}
+    output2 = output2 or {}
+
+    return {
+        "total_cost": _to_float(output2.get("frcr_pchs_amt1")),
+        "realized_pnl": _to_float(output2.get("ovrs_rlzt_pfls_amt")),
+        "total_pnl": _to_float(output2.get("ovrs_tot_pfls")),
+        "total_pnl_pct": _to_float(output2.get("tot_pftrt")),
+        "eval_pnl": _to_float(output2.get("tot_evlu_pfls_amt")),
+    }
+
+def get_overseas_balance(max_age: float = BALANCE_CACHE_TTL, account=None, priority=PRIORITY_POSITION) -> dict:
+    """
+    inquire-balance 한 번으로 전체 보유 종목(output1) + 합계(output2) 파싱
+    max_age 초 이내 스냅샷이 있으면 재사용 (0 이면 항상 실시간 조회)
+    UI 우선순위: 예산이 밀려 있으면 오래된 스냅샷이라도 반환
+    """
+    acct = get_account(account)
+    balance_cache = acct.balance_cache
+    cached = balance_cache["data"]
+    if cached and time.time() - balance_cache["fetched_at"] < max_age:
+        return cached
+    if cached and priority >= PRIORITY_UI and acct.limiter.congested(priority):
+        return cached
+
+    try:
+        return _fetch_balance(acct, priority)
+    except KISBusyError:
+        if cached:
+            return cached
+        raise
+
+def _fetch_balance(acct: KISAccount, priority: int) -> dict:
+    balance_cache = acct.balance_cache
 
     url = f"{BASE_URL}/uapi/overseas-stock/v1/trading/inquire-balance"
 
     headers = {
-        "appkey": APP_KEY,
-        "appsecret": APP_SECRET,
+        "appkey": acct.app_key,
+        "appsecret": acct.app_secret,
         "tr_id": "TTTS3012R",
         "custtype": "P"
     }
 
     params = {
-        "CANO": CANO,
-        "ACNT_PRDT_CD": ACNT,
+        "CANO": acct.cano,
+        "ACNT_PRDT_CD": acct.acnt,
         "TR_CRCY_CD": "USD",
-        "OVRS_EXCG_CD": excg_cd,
+        "OVRS_EXCG_CD": "NASD",   # 🔥 NASD = 미국 전체 (NYSE/AMEX 포함)
         "CTX_AREA_FK200": "",
         "CTX_AREA_NK200": ""
     }
 
-    # 🔥 네트워크 일시 오류 대비 재시도 1회
-    for i in range(2):
-        try:
-            # 🔥 _kis_request 내부에서
-            # 1) 토큰 자동 발급
-            # 2) 401 발생 시 자동 재발급 후 재시도
-            res = _kis_request(
-                method="GET",
-                url=url,
-                headers=headers,
-                params=params
-            )
+    items = []
+    output2 = None
 
-            data = res.json()
-            print("KIS RAW:", data)
+    # 🔥 연속 조회 (보유 종목이 많으면 tr_cont=M/F 로 다음 페이지)
+    for page in range(10):
+        # 🔥 네트워크 일시 오류 대비 재시도 1회
+        for i in range(2):
+            try:
+                res = _kis_request(
+                    method="GET",
+                    url=url,
+                    headers=headers,
+                    params=params,
+                    account=acct,
+                    priority=priority
+                )
 
-            break  # 🔥 성공 시 루프 탈출
+                data = res.json()
 
-        except Exception as e:
-            print("KIS balance 조회 실패:", e)
-            time.sleep(1)
+                break  # 🔥 성공 시 루프 탈출
 
-    else:
-        # 🔥 2회 모두 실패 시
-        raise RuntimeError("KIS 잔고 조회 2회 실패")
+            except KISBusyError:
+                raise
+
+            except Exception as e:
+                print("KIS balance 조회 실패:", e)
+                time.sleep(1)
+
+        else:
+            # 🔥 2회 모두 실패 시
+            raise RuntimeError("KIS 잔고 조회 2회 실패")
+
+        items.extend(data.get("output1") or [])
+        output2 = output2 or data.get("output2")
+
+        if res.headers.get("tr_cont") not in ("M", "F"):
+            break
+
+        headers = {**headers, "tr_cont": "N"}
+        params = {
+            **params,
+            "CTX_AREA_FK200": data.get("ctx_area_fk200", ""),
+            "CTX_AREA_NK200": data.get("ctx_area_nk200", "")
+        }
 
     # ==============================
     # ✅ 종목별 보유 내역 파싱
     # ==============================
-
-    items = data.get("output1") or []
-    target = ticker.upper()
+    positions = {}
 
     for item in items:
-        ovrs_pdno = item.get("ovrs_pdno", "").upper()
-        qty = float(item.get("ovrs_cblc_qty", 0))
-        sellable = float(item.get("ord_psbl_qty", 0))  # 🔥 실제 매도 가능 수량
-
-        if qty <= 0:
+        pos = _parse_balance_position(item)
+        if pos["qty"] <= 0:
             continue
+        positions[pos["ticker"]] = pos
 
-        if ovrs_pdno == target:
-            return {
-                "found": True,
-                "avg_price": float(item.get("pchs_avg_pric", 0)),
-                "qty": int(qty),
-                "sellable_qty": int(sellable),
-                "total_cost": float(item.get("frcr_pchs_amt1", 0)),
-                "excg": item.get("ovrs_excg_cd"),
-            }
+        # 🔥 보유 종목 거래소 코드는 잔고에서 바로 캐시 (yfinance 조회 생략)
+        if pos["excg"] in ("NASD", "NYSE", "AMEX"):
+            acct.exchange_cache.setdefault(pos["ticker"], pos["excg"])
+
+    snapshot = {
+        "positions": positions,
+        "totals": _parse_balance_totals(output2),
+        "fetched_at": time.time()
+    }
+
+    balance_cache["data"] = snapshot
+    balance_cache["fetched_at"] = snapshot["fetched_at"]
+
+    return snapshot
+
+def peek_overseas_balance(account=None) -> dict | None:
+    """캐시된 잔고 스냅샷만 (없으면 None, KIS 호출 없음)"""
+    return get_account(account).balance_cache["data"]
+
+def invalidate_balance_cache(account=None):
+    balance_cache = get_account(account).balance_cache
+    balance_cache["data"] = None
+    balance_cache["fetched_at"] = 0
+
+# =====================
+# 해외주식 평단가 조회
+# =====================
+def get_overseas_avg_price(ticker: str, max_age: float = 0, account=None, priority=PRIORITY_POSITION):
+    snapshot = get_overseas_balance(max_age=max_age, account=account, priority=priority)
+
+    pos = snapshot["positions"].get(ticker.upper())
+    if pos:
+        return {
+            "found": True,
+            "avg_price": pos["avg_price"],
+            "qty": pos["qty"],
+            "sellable_qty": pos["sellable_qty"],
+            "total_cost": pos["total_cost"],
+            "excg": pos["excg"],
+        }
 
     # 🔥 해당 종목 미보유
     return {
@@ -197,22 +492,24 @@ def get_overseas_avg_price(ticker: str):
         "excg": None
     }
 
-def get_overseas_buying_power(ticker="AAPL", price="1"):
+def _request_psamount(ticker: str, price: str, exchange: str, account=None, priority=PRIORITY_POSITION) -> dict:
+    """inquire-psamount 1회 → 응답 JSON (네트워크 2회 실패 시 RuntimeError)"""
+    acct = get_account(account)
     url = f"{BASE_URL}/uapi/overseas-stock/v1/trading/inquire-psamount"
 
     headers = {
         # 🔥 authorization 제거 ( _kis_request 내부에서 자동 추가 )
         "Content-Type": "application/json; charset=utf-8",
-        "appkey": APP_KEY,
-        "appsecret": APP_SECRET,
+        "appkey": acct.app_key,
+        "appsecret": acct.app_secret,
         "tr_id": "TTTS3007R",   # 🔥 실계좌
         "custtype": "P"
     }
 
     params = {
-        "CANO": CANO,
-        "ACNT_PRDT_CD": ACNT,
-        "OVRS_EXCG_CD": "NASD",     # 🔥 나스닥 기준
+        "CANO": acct.cano,
+        "ACNT_PRDT_CD": acct.acnt,
+        "OVRS_EXCG_CD": exchange,
         "OVRS_ORD_UNPR": price,     # 🔥 외부에서 받은 price 사용
         "ITEM_CD": ticker           # 🔥 외부에서 받은 ticker 사용
     }
@@ -227,12 +524,17 @@ def get_overseas_buying_power(ticker="AAPL", price="1"):
                 method="GET",
                 url=url,
                 headers=headers,
-                params=params
+                params=params,
+                account=acct,
+                priority=priority
             )
 
             data = res.json()
             break  # 🔥 성공 시 루프 탈출
 
+        except KISBusyError:
+            raise
+
         except Exception as e:
             print("KIS 매수 가능 금액 조회 실패:", e)
             time.sleep(1)
@@ -241,6 +543,11 @@ def get_overseas_buying_power(ticker="AAPL", price="1"):
         # 🔥 2회 모두 실패
         raise RuntimeError("KIS 매수 가능 금액 조회 2회 실패")
 
+    return data
+
+def get_overseas_buying_power(ticker="AAPL", price="1", exchange="NASD", account=None, priority=PRIORITY_POSITION):
+    data = _request_psamount(ticker, price, exchange, account=account, priority=priority)
+
     # ==============================
     # ✅ 응답 코드 확인
     # ==============================
@@ -254,20 +561,115 @@ def get_overseas_buying_power(ticker="AAPL", price="1"):
 
     return buying_power
 
+# =====================
+# 거래소별 매수 가능 금액 (짧은 TTL 캐시, 주문 후 무효화)
+# =====================
+BUYING_POWER_CACHE_TTL = 30  # 초
+DEFAULT_PROBE = {"NASD": "AAPL"}
+
+def _probe_tickers(acct: KISAccount, tickers=None) -> dict:
+    """
+    거래소별 조회용 종목 1개씩
+    tickers 없으면 거래소 코드 캐시 (보유 종목 + 예약 종목 조회분) 사용
+    """
+    probes = {}
+    if tickers is not None:
+        for t in tickers:
+            t = t.upper()
+            probes.setdefault(get_kis_exchange_code(t, account=acct), t)
+    else:
+        for t, excg in sorted(acct.exchange_cache.items()):
+            probes.setdefault(excg, t)
+    return probes or dict(DEFAULT_PROBE)
+
+def get_buying_power(tickers=None, max_age=BUYING_POWER_CACHE_TTL, account=None, priority=PRIORITY_POSITION) -> dict:
+    """
+    Returns: {
+        "buying_power": 거래소별 최소값 (USD 주문 가능 금액),
+        "by_exchange": {EXCG: {"ticker", "buying_power", "max_qty", "error"}},
+        "fetched_at"
+    }
+    """
+    acct = get_account(account)
+    buying_power_cache = acct.buying_power_cache
+
+    with acct.buying_power_lock:
+        cached = buying_power_cache["data"]
+        if (
+            cached
+            and max_age > 0
+            and time.time() - buying_power_cache["fetched_at"] < max_age
+            and (tickers is None or {get_kis_exchange_code(t.upper(), account=acct) for t in tickers} <= cached["by_exchange"].keys())
+        ):
+            return cached
+        # 🔥 UI: 예산이 밀려 있으면 오래된 값이라도 반환
+        if cached and priority >= PRIORITY_UI and acct.limiter.congested(priority):
+            return cached
+
+        by_exchange = {}
+        for excg, ticker in _probe_tickers(acct, tickers).items():
+            try:
+                data = _request_psamount(ticker, "1", excg, account=acct, priority=priority)
+                if data.get("rt_cd") != "0":
+                    raise RuntimeError(data.get("msg1") or "KIS 오류")
+                output = data.get("output") or {}
+                by_exchange[excg] = {
+                    "ticker": ticker,
+                    "buying_power": _to_float(output.get("ovrs_ord_psbl_amt")),
+                    "max_qty": _to_float(output.get("max_ord_psbl_qty")),
+                    "error": None
+                }
+            except KISBusyError:
+                if cached:
+                    return cached
+                raise
+            except Exception as e:
+                by_exchange[excg] = {
+                    "ticker": ticker,
+                    "buying_power": None,
+                    "max_qty": None,
+                    "error": str(e)
+                }
+
+        amounts = [v["buying_power"] for v in by_exchange.values() if v["buying_power"] is not None]
+        if not amounts:
+            raise RuntimeError("KIS 매수 가능 금액 조회 실패")
+
+        snapshot = {
+            "buying_power": min(amounts),
+            "by_exchange": by_exchange,
+            "fetched_at": time.time()
+        }
+        buying_power_cache["data"] = snapshot
+        buying_power_cache["fetched_at"] = snapshot["fetched_at"]
+        return snapshot
+
+def invalidate_buying_power_cache(account=None):
+    buying_power_cache = get_account(account).buying_power_cache
+    buying_power_cache["data"] = None
+    buying_power_cache["fetched_at"] = 0
+
 # =====================
 # 해외주식 주문
 # =====================
+class KISOrderUnknownError(RuntimeError):
+    """
+    주문 요청이 KIS 에 도달했을 수 있는 오류 (응답 타임아웃 등)
+    → 재전송 전에 반드시 주문 내역 조회로 확인해야 함
+    """
+
 def order_overseas_stock(
     ticker: str,
     price: float,
     qty: int,
-    side: str   # "buy" | "sell"
+    side: str,  # "buy" | "sell"
+    account=None
 ):
-    CANO, ACNT = ACCOUNT_NO.split("-")
+    acct = get_account(account)
     is_buy = side == "buy"
 
     # 🔥 거래소 코드 자동 판별
-    excg_cd = get_kis_exchange_code(ticker)
+    excg_cd = get_kis_exchange_code(ticker, account=acct)
 
     # 🔥 미국 실계좌 TR_ID
     tr_id = "TTTT1002U" if is_buy else "TTTT1006U"
@@ -276,16 +678,16 @@ def order_overseas_stock(
 
     headers = {
         # 🔥 authorization 제거 (_kis_request 내부에서 자동 추가)
-        "appkey": APP_KEY,
-        "appsecret": APP_SECRET,
+        "appkey": acct.app_key,
+        "appsecret": acct.app_secret,
         "tr_id": tr_id,
         "custtype": "P",
         "Content-Type": "application/json"
     }
 
     body = {
-        "CANO": CANO,
-        "ACNT_PRDT_CD": ACNT,
+        "CANO": acct.cano,
+        "ACNT_PRDT_CD": acct.acnt,
         "OVRS_EXCG_CD": excg_cd,
         "PDNO": ticker,
         "ORD_QTY": str(qty),
@@ -301,7 +703,7 @@ def order_overseas_stock(
         "ORD_SVR_DVSN_CD": "0"
     }
 
-    # 🔥 네트워크 일시 오류 대비 재시도 1회
+    # 🔥 연결 자체가 안 된 경우만 재시도 (주문이 전송됐을 수 있으면 재시도 금지)
     for i in range(2):
         try:
             # 🔥 내부에서:
@@ -311,46 +713,165 @@ def order_overseas_stock(
                 method="POST",
                 url=url,
                 headers=headers,
-                json=body
+                json=body,
+                account=acct,
+                priority=PRIORITY_ORDER
             )
 
-            print("===== KIS ORDER DEBUG =====")
-            print("STATUS:", res.status_code)
-            print("URL:", url)
-            print("HEADERS:", headers)
-            print("BODY:", body)
+        except requests.exceptions.ConnectTimeout as e:
+            print("KIS 연결 실패 (미전송):", e)
+            time.sleep(1)
+            continue
 
+        except requests.exceptions.HTTPError as e:
+            # 🔥 KIS 업무 오류는 HTTP 500 + rt_cd 로 내려오기도 함 → 미체결 확정
             try:
-                resp_json = res.json()
-                print("RESPONSE JSON:", resp_json)
+                resp_json = e.response.json()
             except Exception:
                 resp_json = None
-                print("RESPONSE TEXT:", res.text)
+            if resp_json and resp_json.get("rt_cd"):
+                raise RuntimeError(f"KIS 주문 실패: {resp_json}")
+            raise KISOrderUnknownError(f"KIS 주문 응답 불명: {e}")
 
-            print("==========================")
+        except requests.exceptions.RequestException as e:
+            # 🔥 ReadTimeout / 연결 끊김 → 주문 접수 여부 알 수 없음
+            print("KIS 네트워크 오류:", e)
+            raise KISOrderUnknownError(f"KIS 주문 응답 불명: {e}")
 
-            # 🔥 KIS 업무 오류 코드 체크
-            if not resp_json or resp_json.get("rt_cd") != "0":
-                raise RuntimeError(
-                    f"KIS 주문 실패: {resp_json}"
-                )
+        print("===== KIS ORDER DEBUG =====")
+        print("STATUS:", res.status_code)
+        print("URL:", url)
+        print("HEADERS:", headers)
+        print("BODY:", body)
 
-            return resp_json  # 🔥 정상 주문 성공
+        try:
+            resp_json = res.json()
+            print("RESPONSE JSON:", resp_json)
+        except Exception:
+            resp_json = None
+            print("RESPONSE TEXT:", res.text)
 
-        except requests.exceptions.RequestException as e:
-            print("KIS 네트워크 오류:", e)
-            time.sleep(1)
+        print("==========================")
 
-        except Exception as e:
-            print("KIS 주문 로직 오류:", e)
-            time.sleep(1)
+        if resp_json is None:
+            raise KISOrderUnknownError(f"KIS 주문 응답 파싱 실패: {res.text}")
+
+        # 🔥 KIS 업무 오류 코드 체크
+        if resp_json.get("rt_cd") != "0":
+            raise RuntimeError(
+                f"KIS 주문 실패: {resp_json}"
+            )
 
-    # 🔥 2회 모두 실패
+        return resp_json  # 🔥 정상 주문 성공
+
+    # 🔥 2회 모두 연결 실패 (주문 미전송 확정)
     raise RuntimeError("KIS 주문 2회 실패")
 
+# =====================
+# 해외주식 주문체결내역 조회
+# =====================
+def _parse_order_row(item: dict) -> dict:
+    return {
+        "odno": item.get("odno"),
+        "orgn_odno": item.get("orgn_odno"),
+        "order_date": item.get("ord_dt"),
+        "order_time": item.get("ord_tmd"),
+        "ticker": (item.get("pdno") or "").upper(),
+        "side": "sell" if item.get("sll_buy_dvsn_cd") == "01" else "buy",
+        "qty": int(_to_float(item.get("ft_ord_qty"))),
+        "price": _to_float(item.get("ft_ord_unpr3")),
+        "filled_qty": int(_to_float(item.get("ft_ccld_qty"))),
+        "filled_price": _to_float(item.get("ft_ccld_unpr3")),
+        "filled_amount": _to_float(item.get("ft_ccld_amt3")),
+        "unfilled_qty": int(_to_float(item.get("nccs_qty"))),
+        "status": item.get("prcs_stat_name"),
+        "reject_reason": item.get("rjct_rson"),
+        "excg": item.get("ovrs_excg_cd"),
+    }
+
+def inquire_overseas_orders(
+    start_date: str,
+    end_date: str,
+    ticker: str = "%",
+    max_pages: int = 20,
+    account=None,
+    priority=PRIORITY_ORDER
+) -> list[dict]:
+    """
+    해외주식 주문체결내역 (start_date ~ end_date, YYYYMMDD 한국 날짜)
+    연속 조회로 전체 페이지 수집
+    """
+    acct = get_account(account)
+    url = f"{BASE_URL}/uapi/overseas-stock/v1/trading/inquire-ccnld"
+
+    headers = {
+        "appkey": acct.app_key,
+        "appsecret": acct.app_secret,
+        "tr_id": "TTTS3035R",
+        "custtype": "P"
+    }
+
+    params = {
+        "CANO": acct.cano,
+        "ACNT_PRDT_CD": acct.acnt,
+        "PDNO": ticker,
+        "ORD_STRT_DT": start_date,
+        "ORD_END_DT": end_date,
+        "SLL_BUY_DVSN": "00",      # 전체
+        "CCLD_NCCS_DVSN": "00",    # 체결 + 미체결
+        "OVRS_EXCG_CD": "%",
+        "SORT_SQN": "DS",
+        "ORD_DT": "",
+        "ORD_GNO_BRNO": "",
+        "ODNO": "",
+        "CTX_AREA_NK200": "",
+        "CTX_AREA_FK200": ""
+    }
+
+    rows = []
+
+    for page in range(max_pages):
+        # 🔥 네트워크 일시 오류 대비 재시도 1회
+        for i in range(2):
+            try:
+                res = _kis_request(
+                    method="GET",
+                    url=url,
+                    headers=headers,
+                    params=params,
+                    account=acct,
+                    priority=priority
+                )
+                data = res.json()
+                break
+
+            except Exception as e:
+                print("KIS 주문내역 조회 실패:", e)
+                time.sleep(1)
+
+        else:
+            raise RuntimeError("KIS 주문내역 조회 2회 실패")
+
+        if data.get("rt_cd") != "0":
+            raise RuntimeError(f"KIS 주문내역 조회 오류: {data.get('msg1')}")
+
+        rows.extend(_parse_order_row(item) for item in data.get("output") or [])
+
+        if res.headers.get("tr_cont") not in ("M", "F"):
+            break
+
+        headers = {**headers, "tr_cont": "N"}
+        params = {
+            **params,
+            "CTX_AREA_FK200": data.get("ctx_area_fk200", ""),
+            "CTX_AREA_NK200": data.get("ctx_area_nk200", "")
+        }
+
+    return rows
+
 
-def sell_all_overseas_stock(ticker: str, price: float):
-    info = get_overseas_avg_price(ticker)
+def sell_all_overseas_stock(ticker: str, price: float, account=None):
+    info = get_overseas_avg_price(ticker, account=account, priority=PRIORITY_ORDER)
 
     if not info["found"] or info["sellable_qty"] <= 0:
         return {"error": "매도 가능 수량 없음"}
@@ -359,5 +880,6 @@ def sell_all_overseas_stock(ticker: str, price: float):
         ticker=ticker,
         price=price,
         qty=info["sellable_qty"],
-        side="sell"
+        side="sell",
+        account=account
     )
@@ -0,0 +1,303 @@
+# leases.py
+# =====================
+# 여러 replica 용 lease (이름 단위 잠금 + leader 선출)
+# =====================
+# app_leases 테이블 / try_acquire_lease · release_lease RPC (migrations/006_app_leases.sql)
+#   - lease 는 ttl 초 뒤 만료 → 잡고 있던 프로세스가 죽어도 다른 노드가 이어받음
+#   - 잡고 있는 동안 ttl/3 마다 연장, token 은 holder 가 바뀔 때마다 증가 (fencing)
+#
+# backend: SupabaseLeaseBackend (RPC) | PostgresLeaseBackend (psycopg, 로컬 테스트)
+#
+# 로컬 2 프로세스 확인:
+#   psql mume_check -f migrations/006_app_leases.sql
+#   python leases.py --dsn postgresql://localhost/mume_check demo    # 터미널 1
+#   python leases.py --dsn postgresql://localhost/mume_check demo    # 터미널 2
+#   → 한쪽만 LEADER, leader 프로세스 종료 시 ttl 안에 다른 쪽이 LEADER
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from uuid import uuid4
+
+DEFAULT_TTL = 30  # 초
+
+# 🔥 프로세스마다 고유 (같은 호스트 replica 구분)
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+
+
+class LeaseError(RuntimeError):
+    """lease 저장소 오류 (획득 여부를 알 수 없음 → 호출 측은 실행하지 않음)"""
+
+
+# =====================
+# backend
+# =====================
+class SupabaseLeaseBackend:
+    def __init__(self, db):
+        self.db = db
+
+    def try_acquire(self, name: str, holder: str, ttl: float) -> dict:
+        try:
+            rows = self.db.rpc("try_acquire_lease", {
+                "p_name": name,
+                "p_holder": holder,
+                "p_ttl_seconds": ttl
+            }).execute().data or []
+        except Exception as e:
+            raise LeaseError(f"try_acquire_lease 실패: {e}")
+        if not rows:
+            raise LeaseError("try_acquire_lease 응답 없음")
+        return rows[0]
+
+    def release(self, name: str, holder: str) -> bool:
+        try:
+            return bool(self.db.rpc("release_lease", {
+                "p_name": name,
+                "p_holder": holder
+            }).execute().data)
+        except Exception as e:
+            print("release_lease error:", name, e)
+            return False
+
+
+class PostgresLeaseBackend:
+    """로컬 Postgres 직접 연결 (psycopg v3 또는 psycopg2)"""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        try:
+            import psycopg
+            return psycopg.connect(self.dsn, autocommit=True)
+        except ImportError:
+            import psycopg2
+            conn = psycopg2.connect(self.dsn)
+            conn.autocommit = True
+            return conn
+
+    def _call(self, sql: str, params: tuple):
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                cur = self._conn.cursor()
+                cur.execute(sql, params)
+                row = cur.fetchone()
+                cur.close()
+                return row
+            except Exception as e:
+                # 🔥 끊긴 연결은 버리고 다음 호출에서 재연결
+                try:
+                    if self._conn is not None:
+                        self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+                raise LeaseError(str(e))
+
+    def try_acquire(self, name: str, holder: str, ttl: float) -> dict:
+        row = self._call(
+            "select acquired, holder, token, expires_at from try_acquire_lease(%s, %s, %s)",
+            (name, holder, ttl)
+        )
+        if row is None:
+            raise LeaseError("try_acquire_lease 응답 없음")
+        acquired, current, token, expires_at = row
+        return {
+            "acquired": acquired,
+            "holder": current,
+            "token": token,
+            "expires_at": expires_at.isoformat() if expires_at else None
+        }
+
+    def release(self, name: str, holder: str) -> bool:
+        try:
+            row = self._call("select release_lease(%s, %s)", (name, holder))
+        except LeaseError as e:
+            print("release_lease error:", name, e)
+            return False
+        return bool(row and row[0])
+
+
+# =====================
+# 이름 단위 잠금
+# =====================
+class Lease:
+    """
+    잡은 동안 백그라운드에서 ttl/3 마다 연장
+    연장 실패 (다른 노드가 가져감 / 저장소 오류) → lost 표시
+    """
+
+    def __init__(self, backend, name: str, ttl: float = DEFAULT_TTL, holder: str = NODE_ID):
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder
+        self.token = None
+        self.current_holder = None
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self) -> bool:
+        r = self.backend.try_acquire(self.name, self.holder, self.ttl)
+        self.current_holder = r["holder"]
+        if not r["acquired"]:
+            return False
+        self.token = r["token"]
+        self.lost = False
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._renew_loop,
+            name=f"lease-{self.name}",
+            daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                r = self.backend.try_acquire(self.name, self.holder, self.ttl)
+            except LeaseError as e:
+                print("lease renew error:", self.name, e)
+                continue
+            if not r["acquired"] or r["token"] != self.token:
+                print(f"⚠ lease lost: {self.name} → {r['holder']}")
+                self.lost = True
+                return
+
+    def release(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+        if not self.lost:
+            self.backend.release(self.name, self.holder)
+
+
+@contextmanager
+def named_lock(backend, name: str, ttl: float = DEFAULT_TTL, holder: str = NODE_ID):
+    """
+    with named_lock(backend, "cron:save") as lease:
+        if lease is None: ...   # 다른 노드가 실행 중
+    backend 오류는 LeaseError 로 전파
+    """
+    lease = Lease(backend, name, ttl, holder)
+    if not lease.acquire():
+        yield None
+        return
+    try:
+        yield lease
+    finally:
+        lease.release()
+
+
+# =====================
+# leader 선출
+# =====================
+class LeaderElector:
+    """
+    "leader" lease 를 계속 잡으려 시도 → 잡은 노드만 is_leader()
+    ttl 안에 연장 못 하면 (프로세스 종료 / 저장소 오류) 다른 노드가 이어받음
+    """
+
+    def __init__(self, backend, name: str = "leader", ttl: float = DEFAULT_TTL, holder: str = NODE_ID):
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder
+        self.token = None
+        self.current_holder = None
+        self._leader_until = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_leader(self) -> bool:
+        # 🔥 마지막 연장 성공 후 ttl 이 지나면 스스로 leader 아님 (저장소 단절 대비)
+        return time.monotonic() < self._leader_until
+
+    def status(self) -> dict:
+        return {
+            "node": self.holder,
+            "leader": self.is_leader(),
+            "holder": self.current_holder,
+            "token": self.token,
+        }
+
+    def _tick(self):
+        started = time.monotonic()
+        try:
+            r = self.backend.try_acquire(self.name, self.holder, self.ttl)
+        except LeaseError as e:
+            print("leader election error:", e)
+            return
+        self.current_holder = r["holder"]
+        if r["acquired"]:
+            if not self.is_leader():
+                print(f"👑 leader: {self.holder} (token {r['token']})")
+            self.token = r["token"]
+            self._leader_until = started + self.ttl
+        else:
+            self._leader_until = 0.0
+
+    def _loop(self):
+        while True:
+            self._tick()
+            if self._stop.wait(self.ttl / 3):
+                return
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+        if self.is_leader():
+            self.backend.release(self.name, self.holder)
+        self._leader_until = 0.0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="lease / leader election demo")
+    parser.add_argument("--dsn", default=os.getenv("CHECK_DATABASE_URL", "postgresql://localhost/mume_check"))
+    parser.add_argument("--ttl", type=float, default=6)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("demo", help="leader 선출 상태 출력")
+    lock_p = sub.add_parser("lock", help="named lock 잡고 N초 작업")
+    lock_p.add_argument("name")
+    lock_p.add_argument("--hold", type=float, default=10)
+    args = parser.parse_args()
+
+    backend = PostgresLeaseBackend(args.dsn)
+
+    if args.cmd == "demo":
+        elector = LeaderElector(backend, ttl=args.ttl)
+        elector.start()
+        try:
+            while True:
+                s = elector.status()
+                print(f"{s['node']}  {'LEADER' if s['leader'] else 'follower'}  holder={s['holder']} token={s['token']}")
+                time.sleep(1)
+        except KeyboardInterrupt:
+            elector.stop()
+    else:
+        with named_lock(backend, args.name, ttl=args.ttl) as lease:
+            if lease is None:
+                print(f"{NODE_ID}: '{args.name}' 사용 중 → 건너뜀")
+            else:
+                print(f"{NODE_ID}: '{args.name}' 획득 (token {lease.token}), {args.hold}s 작업")
+                time.sleep(args.hold)
+                print("lost" if lease.lost else "done")
@@ -1,6 +1,6 @@
 from datetime import date, datetime, timedelta, timezone, UTC
 from fastapi import FastAPI, HTTPException, Query, Request, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordBearer
@@ -12,15 +12,33 @@ from bs4 import BeautifulSoup
 from supabase import create_client, ClientOptions
 import pytz
 import json
+import base64
 import os
 import yfinance as yf
 import pandas as pd
-from kis_api import order_overseas_stock, get_overseas_avg_price, get_overseas_buying_power
+from kis_api import BALANCE_CACHE_TTL, DEFAULT_ACCOUNT, KISBusyError, PRIORITY_ORDER, PRIORITY_POSITION, PRIORITY_UI
+from broker import broker
 from uuid import UUID, uuid4
-from market_time import is_us_market_open, is_us_premarket, is_us_postmarket, next_market_open, get_next_trading_day, get_next_n_trading_days
+from order_ledger import OrderPendingError, submit_order, recheck_unresolved
+from notifier import notifier
+from functools import partial
+from rsi_backfill import backfill_rsi_history
+from price_stream import QuoteStream
+from alerts import AlertEngine, RULE_KINDS, format_alert
+from deadline import Deadline, DeadlineExceeded, run_within
+from leases import Lease, LeaseError, LeaderElector, SupabaseLeaseBackend, PostgresLeaseBackend, NODE_ID
+import tracing
+from tracing import span, trace_run
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED, TimeoutError as FutureTimeout
+from market_time import is_us_market_open, is_us_premarket, is_us_postmarket, next_market_open, get_next_trading_day, get_next_n_trading_days, get_session_bounds
 from alpaca.data.historical import StockHistoricalDataClient
 from alpaca.data.requests import StockLatestTradeRequest, StockSnapshotRequest
 import pandas_market_calendars as mcal
+from strategy import (
+    BUY_SLICES, BUY_MARKET_AVG_RATIO, BUY_MARKET_CUR_RATIO, SELL_TARGET_RATIO,
+    evaluate_orders
+)
 
 # =====================
 # ENV
@@ -46,6 +64,18 @@ alpaca_data = StockHistoricalDataClient(
     ALPACA_API_KEY,
     ALPACA_SECRET_KEY
 )
+ALPACA_DATA_FEED = os.getenv("ALPACA_DATA_FEED", "iex")
+# 🔥 실시간 체결 스트림 (선택) — ALPACA_STREAM_ENABLED=1
+quote_stream = None
+if os.getenv("ALPACA_STREAM_ENABLED") == "1":
+    quote_stream = QuoteStream(
+        ALPACA_API_KEY,
+        ALPACA_SECRET_KEY,
+        feed=ALPACA_DATA_FEED,
+        url_override=os.getenv("ALPACA_STREAM_URL"),
+        stale_after=float(os.getenv("ALPACA_STREAM_STALE_SECONDS", "60"))
+    )
+STREAM_SYMBOLS_REFRESH = 5 * 60  # 초
 # =====================
 # Supabase clients
 # =====================
@@ -66,10 +96,51 @@ def get_user_supabase(token: str):
         )
     )
 # =====================
+# 🔥 replica 간 cron 단일 실행 (선택) — LEASE_BACKEND=supabase | postgres
+# =====================
+# none     : 잠금 없음 (단일 인스턴스, 기존 동작)
+# supabase : app_leases RPC (migrations/006_app_leases.sql)
+# postgres : LEASE_DATABASE_URL 직접 연결
+# CRON_LEADER_ONLY=1 : replica 마다 스케줄러가 있을 때 leader 노드만 cron 실행
+LEASE_MODE = os.getenv("LEASE_BACKEND", "none")
+if LEASE_MODE == "supabase":
+    lease_backend = SupabaseLeaseBackend(supabase_admin)
+elif LEASE_MODE == "postgres":
+    if not os.getenv("LEASE_DATABASE_URL"):
+        raise RuntimeError("LEASE_DATABASE_URL not set")
+    lease_backend = PostgresLeaseBackend(os.getenv("LEASE_DATABASE_URL"))
+elif LEASE_MODE == "none":
+    lease_backend = None
+else:
+    raise RuntimeError(f"unknown LEASE_BACKEND: {LEASE_MODE}")
+CRON_LOCK_TTL = float(os.getenv("CRON_LOCK_TTL", "30"))  # 초 (실행 중 ttl/3 마다 연장)
+CRON_LEADER_ONLY = os.getenv("CRON_LEADER_ONLY") == "1"
+leader = LeaderElector(lease_backend, ttl=CRON_LOCK_TTL) if lease_backend else None
+# =====================
 # FastAPI
 # =====================
 app = FastAPI()
 ORDER_CACHE: dict[str, dict] = {}
+PORTFOLIO_CACHE: dict[str, dict] = {}   # account → {"data", "built_at"}
+PORTFOLIO_CACHE_TTL = 10  # 초
+# 🔥 엔드포인트 내부 upstream 병렬 호출용 (KIS / DB 동시 조회)
+API_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="api")
+CLOSE_CACHE: dict[tuple[str, date], pd.Series] = {}
+QUOTE_CACHE: dict[str, tuple[dict, float]] = {}   # ticker → (quote, 조회 시각)
+QUOTE_CACHE_TTL = 5  # 초
+WARMUP_LEAD_MINUTES = 10
+WARMUP_STATE = {"session": None, "result": None}
+CRON_BALANCE_MAX_AGE = 60          # 🔥 같은 tick 의 BUY 주문끼리 잔고 스냅샷 공유 (초)
+CRON_WARMUP_REUSE_MINUTES = 5      # 🔥 장 시작 후 이 시간까지만 warmup 잔고 스냅샷 재사용
+# 🔥 cron 재시도 간격 (초) — 주문 원장이 중복 전송을 막으므로 짧게
+CRON_RETRY_PENDING = 15      # 응답 불명 주문 확인 중 (retry_count 안 씀)
+CRON_RETRY_RATE_LIMIT = 60   # KIS 초당 호출 제한
+CRON_RETRY_ERROR = 15        # 일시 오류 (최대 3회)
+# 🔥 초당 호출 제한 오류 표시 (HTTP 429 / KIS EGW00201 초당 거래건수 초과 — 실계좌·sim 공통)
+RATE_LIMIT_MARKERS = ("Too Many Requests", "EGW00201", "초당 거래건수")
+RSI_HISTORY_CACHE = {"rows": {}, "loaded_at": 0}
+# 🔥 cron_save 저장 시 즉시 무효화 (같은 프로세스만) → 다른 worker 는 TTL 안에 반영
+RSI_HISTORY_CACHE_TTL = 15 * 60
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
@@ -82,30 +153,68 @@ ny_tz = pytz.timezone("US/Eastern")
 # ==========================================================
 
 def send_telegram_message(text: str):
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    chat_id = os.getenv("TELEGRAM_CHAT_ID")
+    # 🔥 큐에 넣고 바로 반환 (전송/재시도는 백그라운드 워커)
+    notifier.send(text)
 
-    if not token or not chat_id:
-        print("⚠️ Telegram env not set")
-        return
+@app.on_event("shutdown")
+def flush_notifications():
+    notifier.join(timeout=5)
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
+@app.on_event("startup")
+def start_leader_election():
+    if leader is not None:
+        leader.start()
 
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "HTML"
-    }
+@app.on_event("shutdown")
+def stop_leader_election():
+    # 🔥 정상 종료 시 바로 해제 → 다른 노드가 ttl 기다리지 않고 이어받음
+    if leader is not None:
+        leader.stop()
 
+def run_exclusive(name: str, fn, *args, **kwargs):
+    """
+    cron 작업을 replica 중 한 곳에서만 실행 (lease "cron:{name}")
+    다른 노드가 실행 중 / leader 아님 / lease 저장소 오류 → 실행하지 않고 skipped 반환
+    """
+    if lease_backend is None:
+        return fn(*args, **kwargs)
+
+    if CRON_LEADER_ONLY and not leader.is_leader():
+        return {"status": "skipped", "reason": "not leader", "leader": leader.current_holder}
+
+    lease = Lease(lease_backend, f"cron:{name}", ttl=CRON_LOCK_TTL)
     try:
-        r = requests.post(url, json=payload, timeout=10)
-        if r.status_code != 200:
-            print("❌ Telegram send failed:", r.text)
-    except Exception as e:
-        print("❌ Telegram exception:", e)
+        acquired = lease.acquire()
+    except LeaseError as e:
+        # 🔥 fail closed: 잠금 상태를 모르면 중복 주문보다 이번 회차 건너뛰기
+        print("cron lease error:", name, e)
+        return {"status": "skipped", "reason": "lease error"}
+    if not acquired:
+        print(f"⏭ cron {name}: {lease.current_holder} 실행 중")
+        return {"status": "skipped", "reason": "locked", "holder": lease.current_holder}
+
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        lease.release()
+        if lease.lost:
+            print(f"⚠ cron {name}: 실행 중 lease 상실")
 
 @app.post("/cron/execute-reservations")
-def cron_execute_reservations(request: Request):
+def cron_execute_reservations(
+    request: Request,
+    dry_run: bool = Query(False),
+    session_date: date | None = Query(None),
+    trace: bool = Query(False)
+):
+
+    # ==========================================================
+    # 🧪 dry-run: 주문 없이 다음 정규장 예상 주문/필요 현금만 계산
+    # ==========================================================
+    if dry_run:
+        if request.headers.get("X-CRON-KEY") != os.getenv("CRON_SECRET"):
+            raise HTTPException(status_code=403, detail="Forbidden")
+        return project_session_orders(base_date=session_date)
 
     # ==========================================================
     # 🔒 1️⃣ 미국 장 열렸는지 체크
@@ -120,224 +229,444 @@ def cron_execute_reservations(request: Request):
     if request.headers.get("X-CRON-KEY") != os.getenv("CRON_SECRET"):
         raise HTTPException(status_code=403, detail="Forbidden")
 
+    # 🔥 ?trace=true (또는 CRON_TRACE=1) → 실행 timeline 파일 (/cron/traces)
+    return run_exclusive("execute-reservations", run_reservation_cron, trace=trace or None)
+
+def run_reservation_cron(trace: bool | None = None):
+    with trace_run("execute-reservations", enabled=trace) as run:
+        result = _run_reservation_cron()
+        if run is not None:
+            run.args["status"] = result.get("status")
+            result["trace_id"] = run.id
+        return result
+
+def _run_reservation_cron():
     now = datetime.now(timezone.utc)
 
     # ==========================================================
     # 🔥 3️⃣ 실행 대상 조회
     # ==========================================================
-    res = (
-        supabase_admin
-        .table("queued_orders")
-        .select("*")
-        .eq("status", "PENDING")
-        .lte("execute_after", now.isoformat())
-        .order("repeat_index")
-        .execute()
-    )
+    with span("select"):
+        res = (
+            supabase_admin
+            .table("queued_orders")
+            .select("*")
+            .eq("status", "PENDING")
+            .lte("execute_after", now.isoformat())
+            .order("repeat_index")
+            .execute()
+        )
 
     # ==========================================================
     # 🔥 4️⃣ 주문 처리 루프
     # ==========================================================
-    for o in res.data or []:
+    # 🔥 텔레그램은 실행 1회분을 digest 로 묶어 백그라운드 전송
+    tg_batch = notifier.batch("📦 예약 주문 실행 결과")
 
-        kis_res = None   # 🔥 반드시 초기화 (UnboundLocalError 방지)
+    try:
+        # 🔥 계좌(앱키)별 속도 제한이 따로 → 계좌 단위 병렬 실행
+        by_account = group_orders_by_account(res.data or [])
+        if len(by_account) <= 1:
+            for orders in by_account.values():
+                process_reservation_orders(orders, now, tg_batch)
+        else:
+            with ThreadPoolExecutor(
+                max_workers=len(by_account),
+                thread_name_prefix="cron-account"
+            ) as pool:
+                futures = {
+                    pool.submit(tracing.bind(process_reservation_orders), orders, now, tg_batch): account
+                    for account, orders in by_account.items()
+                }
+                for f in as_completed(futures):
+                    try:
+                        f.result()
+                    except Exception as e:
+                        print("account run error:", futures[f], e)
+    finally:
+        with span("telegram enqueue"):
+            tg_batch.flush()
+
+    # 🧹 끝난 주문 정리는 /cron/archive-orders (별도 스케줄)
+    return {"status": "ok"}
 
-        try:
-            # --------------------------------------------------
-            # 🔥 선점 (RUNNING)
-            # --------------------------------------------------
-            lock = (
-                supabase_admin
-                .table("queued_orders")
-                .update({"status": "RUNNING"})
-                .eq("id", o["id"])
-                .eq("status", "PENDING")
-                .execute()
-            )
-            if not lock.data:
-                continue
+def order_account(o: dict) -> str:
+    return o.get("account_id") or DEFAULT_ACCOUNT
 
-            # --------------------------------------------------
-            # 🔥 그룹 순서 보장
-            # --------------------------------------------------
-            lower_running = (
-                supabase_admin
-                .table("queued_orders")
-                .select("id")
-                .eq("repeat_group", o["repeat_group"])
-                .lt("repeat_index", o["repeat_index"])
-                .in_("status", ["PENDING", "RUNNING"])
-                .execute()
-            )
-            if lower_running.data:
-                supabase_admin.table("queued_orders").update({
-                    "status": "PENDING"
-                }).eq("id", o["id"]).execute()
-                continue
+def resolve_account(account_id: str | None) -> str:
+    """요청의 계좌 id 검증 (없으면 기본 계좌)"""
+    account_id = account_id or DEFAULT_ACCOUNT
+    if account_id not in broker.list_accounts():
+        raise HTTPException(400, f"알 수 없는 계좌: {account_id}")
+    return account_id
 
-            # ==================================================
-            # 🟢 실제 주문 로직
-            # ==================================================
-            pos = get_overseas_avg_price(o["ticker"])
-            if not pos.get("found"):
-                raise RuntimeError("보유 종목 없음")
-
-            avg_price = float(pos.get("avg_price", 0))
-            sellable_qty = float(pos.get("sellable_qty", 0))
-            current_price = resolve_prices(o["ticker"])["base_price"]
-
-            preview = build_order_preview({
-                "side": o["side"],
-                "avg_price": avg_price,
-                "current_price": current_price,
-                "seed": o["seed"],
-                "ticker": o["ticker"],
-                "qty_owned": pos.get("sellable_qty")
-            })
+def group_orders_by_account(orders: list[dict]) -> dict[str, list[dict]]:
+    """계좌별 주문 목록 (각 목록 안의 repeat_index 순서 유지)"""
+    groups = {}
+    for o in orders:
+        groups.setdefault(order_account(o), []).append(o)
+    return groups
 
-            side = "buy" if o["side"].startswith("BUY") else "sell"
+def cron_balance_max_age(side: str, now: datetime) -> float:
+    """
+    주문 수량 계산용 잔고 스냅샷 허용 나이 (초)
+    SELL → 항상 실시간 (매도 가능 수량은 장 중 체결로 바뀜)
+    BUY  → 장 시작 직후 첫 tick 만 warmup 스냅샷 (장 전이라 평단가 그대로), 이후엔 짧게
+    """
+    if side.startswith("SELL"):
+        return 0
+    warm = WARMUP_STATE["result"]
+    if warm and WARMUP_STATE["session"] == now.astimezone(ny_tz).date():
+        opened = datetime.fromisoformat(warm["session_open"])
+        if now < opened + timedelta(minutes=CRON_WARMUP_REUSE_MINUTES):
+            # warmup 은 장 시작 WARMUP_LEAD_MINUTES 전부터 → 그 이후 스냅샷만
+            return (now - opened).total_seconds() + WARMUP_LEAD_MINUTES * 60
+    return CRON_BALANCE_MAX_AGE
+
+def process_reservation_orders(orders: list[dict], now: datetime, tg_batch):
+    for o in orders:
+
+        with span(f"order {o['id']}", "order", ticker=o["ticker"], side=o["side"], account=order_account(o)):
+            kis_res = None   # 🔥 반드시 초기화 (UnboundLocalError 방지)
 
-            if side == "sell":
-                if sellable_qty <= 0:
-                    raise RuntimeError("매도 가능 수량 없음")
-                order_qty = int(sellable_qty)
-            else:
-                order_qty = preview["qty"]
-
-            if order_qty <= 0:
-                raise RuntimeError("주문 수량 0")
-
-            # --------------------------------------------------
-            # 🔥 KIS 주문 실행
-            # --------------------------------------------------
-            kis_res = order_overseas_stock(
-                ticker=o["ticker"],
-                price=preview["price"],
-                qty=order_qty,
-                side=side
-            )
+            try:
+                # --------------------------------------------------
+                # 🔥 선점 (RUNNING)
+                # --------------------------------------------------
+                with span("claim"):
+                    lock = (
+                        supabase_admin
+                        .table("queued_orders")
+                        .update({"status": "RUNNING"})
+                        .eq("id", o["id"])
+                        .eq("status", "PENDING")
+                        .execute()
+                    )
+                if not lock.data:
+                    continue
 
-            if not kis_res or kis_res.get("rt_cd") != "0":
-                raise RuntimeError(
-                    f"[KIS] {kis_res.get('msg_cd')} - {kis_res.get('msg1')}"
-                )
+                # --------------------------------------------------
+                # 🔥 그룹 순서 보장
+                # --------------------------------------------------
+                with span("group check"):
+                    lower_running = (
+                        supabase_admin
+                        .table("queued_orders")
+                        .select("id")
+                        .eq("repeat_group", o["repeat_group"])
+                        .lt("repeat_index", o["repeat_index"])
+                        .in_("status", ["PENDING", "RUNNING"])
+                        .execute()
+                    )
+                if lower_running.data:
+                    supabase_admin.table("queued_orders").update({
+                        "status": "PENDING"
+                    }).eq("id", o["id"]).execute()
+                    continue
 
-            # ==================================================
-            # ✅ 주문 성공 처리
-            # ==================================================
-            supabase_admin.table("queued_orders").update({
-                "status": "DONE",
-                "executed_at": now.isoformat(),
-                "error": None
-            }).eq("id", o["id"]).execute()
-
-            # --------------------------------------------------
-            # 🔥 성공 텔레그램 (별도 보호)
-            # --------------------------------------------------
-            try:
-                send_order_success_telegram(
+                # ==================================================
+                # 🟢 실제 주문 로직
+                # ==================================================
+                # 🔥 SELL 은 실시간 잔고, BUY 는 최근 스냅샷 재사용 (SELL 주문 후 무효화)
+                account = order_account(o)
+                with span("position"):
+                    pos = broker.get_overseas_avg_price(
+                        o["ticker"],
+                        max_age=cron_balance_max_age(o["side"], now),
+                        account=account,
+                        priority=PRIORITY_ORDER
+                    )
+                if not pos.get("found"):
+                    raise RuntimeError("보유 종목 없음")
+
+                avg_price = float(pos.get("avg_price", 0))
+                sellable_qty = float(pos.get("sellable_qty", 0))
+                with span("price"):
+                    current_price = resolve_prices(o["ticker"])["base_price"]
+
+                preview = build_order_preview({
+                    "side": o["side"],
+                    "avg_price": avg_price,
+                    "current_price": current_price,
+                    "seed": o["seed"],
+                    "ticker": o["ticker"],
+                    "qty_owned": pos.get("sellable_qty")
+                })
+
+                side = "buy" if o["side"].startswith("BUY") else "sell"
+
+                if side == "sell":
+                    if sellable_qty <= 0:
+                        raise RuntimeError("매도 가능 수량 없음")
+                    order_qty = int(sellable_qty)
+                else:
+                    order_qty = preview["qty"]
+
+                if order_qty <= 0:
+                    raise RuntimeError("주문 수량 0")
+
+                # --------------------------------------------------
+                # 🔥 KIS 주문 실행 (원장 기준 멱등 → 재시도해도 중복 체결 없음)
+                # --------------------------------------------------
+                with span("submit", qty=order_qty, price=preview["price"]):
+                    kis_res = submit_order(
+                        supabase_admin,
+                        order_ref=o["id"],
+                        ticker=o["ticker"],
+                        price=preview["price"],
+                        qty=order_qty,
+                        side=side,
+                        attempt=o.get("retry_count") or 0,
+                        account=account
+                    )
+
+                if not kis_res or kis_res.get("rt_cd") != "0":
+                    raise RuntimeError(
+                        f"[KIS] {kis_res.get('msg_cd')} - {kis_res.get('msg1')}"
+                    )
+
+                # 🔥 매도 주문 → 매도 가능 수량 변경
+                if side == "sell":
+                    broker.invalidate_balance_cache(account)
+                # 🔥 주문 접수 → 매수 가능 금액 변경
+                broker.invalidate_buying_power_cache(account)
+
+                # ==================================================
+                # ✅ 주문 성공 처리
+                # ==================================================
+                # 🔥 체결 여부는 장 마감 후 /cron/reconcile-fills 가 odno 로 대조
+                with span("mark done"):
+                    supabase_admin.table("queued_orders").update({
+                        "status": "DONE",
+                        "executed_at": now.isoformat(),
+                        "error": None,
+                        "odno": (kis_res.get("output") or {}).get("ODNO"),
+                        "order_price": preview["price"],
+                        "order_qty": order_qty
+                    }).eq("id", o["id"]).execute()
+
+                # --------------------------------------------------
+                # 🔥 성공 텔레그램 (회차 조회/전송은 워커에서)
+                # --------------------------------------------------
+                tg_batch.add(partial(
+                    format_order_success_message,
                     order=o,
                     executed_price=preview["price"],
                     executed_qty=order_qty,
                     executed_at=now,
                     kis_msg=kis_res.get("msg1") if isinstance(kis_res, dict) else None,
                     db=supabase_admin
-                )
-            except Exception as tg_err:
-                print("⚠ 성공 텔레그램 전송 실패:", tg_err)
+                ))
 
-        except Exception as e:
+            except Exception as e:
 
-            error_msg = str(e)
-            current_retry = o.get("retry_count", 0)
-            now_utc = datetime.now(timezone.utc)
+                error_msg = str(e)
+                current_retry = o.get("retry_count", 0)
+                now_utc = datetime.now(timezone.utc)
 
-            # ==================================================
-            # 🔥 0️⃣ Rate Limit → 15분 뒤 재시도
-            # ==================================================
-            if "Too Many Requests" in error_msg or "rate" in error_msg.lower():
-                retry_time = now_utc + timedelta(minutes=15)
+                # ==================================================
+                # 🔥 응답 불명 주문 확인 중 → 잠시 뒤 같은 주문으로 (원장이 대조 후 판단)
+                # ==================================================
+                if isinstance(e, OrderPendingError):
+                    retry_time = now_utc + timedelta(seconds=CRON_RETRY_PENDING)
 
-                supabase_admin.table("queued_orders").update({
-                    "execute_after": retry_time.isoformat(),
-                    "status": "PENDING",
-                    "retry_count": current_retry + 1,
-                    "error": error_msg
-                }).eq("id", o["id"]).execute()
+                    with span("reschedule", error=error_msg):
+                        supabase_admin.table("queued_orders").update({
+                            "execute_after": retry_time.isoformat(),
+                            "status": "PENDING",
+                            "error": error_msg
+                        }).eq("id", o["id"]).execute()
 
-                continue
+                    continue
 
-            # ==================================================
-            # 🔥 1️⃣ 일시 오류 → 30초 재시도 (최대 3회)
-            # ==================================================
-            if current_retry < 3:
-                retry_time = now_utc + timedelta(seconds=30)
+                # ==================================================
+                # 🔥 0️⃣ Rate Limit → 1분 뒤 재시도
+                # ==================================================
+                if any(m in error_msg for m in RATE_LIMIT_MARKERS) or "rate" in error_msg.lower():
+                    retry_time = now_utc + timedelta(seconds=CRON_RETRY_RATE_LIMIT)
 
-                supabase_admin.table("queued_orders").update({
-                    "execute_after": retry_time.isoformat(),
-                    "retry_count": current_retry + 1,
-                    "status": "PENDING",
-                    "error": error_msg
-                }).eq("id", o["id"]).execute()
+                    with span("reschedule", error=error_msg):
+                        supabase_admin.table("queued_orders").update({
+                            "execute_after": retry_time.isoformat(),
+                            "status": "PENDING",
+                            "retry_count": current_retry + 1,
+                            "error": error_msg
+                        }).eq("id", o["id"]).execute()
 
-                continue
+                    continue
 
-            # ==================================================
-            # 🔥 2️⃣ 3회 초과 → 다음 거래일로 이월
-            # ==================================================
-            next_date = datetime.now(ny_tz).date() + timedelta(days=1)
+                # ==================================================
+                # 🔥 1️⃣ 일시 오류 → 15초 재시도 (최대 3회)
+                # ==================================================
+                if current_retry < 3:
+                    retry_time = now_utc + timedelta(seconds=CRON_RETRY_ERROR)
 
-            original_dt = datetime.fromisoformat(
-                o["execute_after"]
-            ).astimezone(ny_tz)
+                    with span("reschedule", error=error_msg):
+                        supabase_admin.table("queued_orders").update({
+                            "execute_after": retry_time.isoformat(),
+                            "retry_count": current_retry + 1,
+                            "status": "PENDING",
+                            "error": error_msg
+                        }).eq("id", o["id"]).execute()
 
-            minutes_from_open = int(
-                (original_dt - next_market_open(original_dt.date()))
-                .total_seconds() / 60
-            )
+                    continue
 
-            next_execute = calculate_execute_at_from_market_open(
-                execute_after_minutes=minutes_from_open,
-                base_date=next_date
-            )
+                # ==================================================
+                # 🔥 2️⃣ 3회 초과 → 다음 거래일로 이월
+                # ==================================================
+                next_date = datetime.now(ny_tz).date() + timedelta(days=1)
 
-            supabase_admin.table("queued_orders").update({
-                "execute_after": next_execute.astimezone(timezone.utc).isoformat(),
-                "error": error_msg,
-                "status": "PENDING",
-                "retry_count": current_retry + 1
-            }).eq("id", o["id"]).execute()
-
-            supabase_admin.rpc("shift_group_forward", {
-                "p_repeat_group": o["repeat_group"],
-                "p_repeat_index": o["repeat_index"]
-            }).execute()
-
-            # --------------------------------------------------
-            # 🔥 실패 텔레그램 (보호)
-            # --------------------------------------------------
-            try:
-                send_order_fail_telegram(
+                original_dt = datetime.fromisoformat(
+                    o["execute_after"]
+                ).astimezone(ny_tz)
+
+                minutes_from_open = int(
+                    (original_dt - next_market_open(original_dt.date()))
+                    .total_seconds() / 60
+                )
+
+                next_execute = calculate_execute_at_from_market_open(
+                    execute_after_minutes=minutes_from_open,
+                    base_date=next_date
+                )
+
+                with span("reschedule", error=error_msg):
+                    supabase_admin.table("queued_orders").update({
+                        "execute_after": next_execute.astimezone(timezone.utc).isoformat(),
+                        "error": error_msg,
+                        "status": "PENDING",
+                        "retry_count": current_retry + 1
+                    }).eq("id", o["id"]).execute()
+
+                    supabase_admin.rpc("shift_group_forward", {
+                        "p_repeat_group": o["repeat_group"],
+                        "p_repeat_index": o["repeat_index"]
+                    }).execute()
+
+                # --------------------------------------------------
+                # 🔥 실패 텔레그램 (회차 조회/전송은 워커에서)
+                # --------------------------------------------------
+                tg_batch.add(partial(
+                    format_order_fail_message,
                     order=o,
                     error_msg=error_msg,
                     db=supabase_admin,
                     kis_msg=kis_res.get("msg1") if isinstance(kis_res, dict) else None
-                )
-            except Exception as tg_err:
-                print("⚠ 실패 텔레그램 전송 실패:", tg_err)
+                ))
 
         # ------------------------------------------------------
         # 🔥 주문 간 rate limit 보호
         # ------------------------------------------------------
-        time.sleep(1.2)
+        with span("sleep"):
+            time.sleep(1.2)
 
-    # ==========================================================
-    # 🧹 정리
-    # ==========================================================
-    supabase_admin.rpc("cleanup_queued_orders").execute()
 
-    return {"status": "ok"}
+# ==========================================================
+# 🔍 cron 실행 timeline (tracing.py, Perfetto 로 열기)
+# ==========================================================
+@app.get("/cron/traces")
+def cron_traces(request: Request, limit: int = Query(20, ge=1, le=200)):
+    if request.headers.get("X-CRON-KEY") != os.getenv("CRON_SECRET"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {
+        "enabled": tracing.TRACE_ENABLED,
+        "keep": tracing.TRACE_KEEP,
+        "runs": tracing.list_runs(limit)
+    }
+
+@app.get("/cron/traces/{run_id}")
+def cron_trace_file(run_id: str, request: Request):
+    if request.headers.get("X-CRON-KEY") != os.getenv("CRON_SECRET"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    path = tracing.trace_path(run_id)
+    if path is None:
+        raise HTTPException(404, "trace 없음 (보관 기간 지남?)")
+    return FileResponse(path, media_type="application/json", filename=f"{run_id}.json")
+
+
+# ==========================================================
+# 🔥 장 시작 전 warmup (cron 실행 경로 선행 로드)
+# ==========================================================
+@app.post("/cron/warmup")
+def cron_warmup(request: Request, force: bool = Query(False)):
+    if request.headers.get("X-CRON-KEY") != os.getenv("CRON_SECRET"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    bounds = get_session_bounds()
+    if bounds is None:
+        return {"status": "no session"}
+    session_open, session_close = bounds
+    session_day = session_open.tz_convert(ny_tz).date()
+
+    now = datetime.now(timezone.utc)
+    if not force:
+        if now < session_open - timedelta(minutes=WARMUP_LEAD_MINUTES):
+            return {"status": "too early", "session_open": session_open.isoformat()}
+        if WARMUP_STATE["session"] == session_day:
+            return {"status": "already warm", **WARMUP_STATE["result"]}
+
+    return {"status": "ok", **run_warmup(session_open, session_close)}
+
+def run_warmup(session_open, session_close) -> dict:
+    timings = {}
+    errors = {}
+
+    def step(name, fn):
+        t0 = time.time()
+        try:
+            return fn()
+        except Exception as e:
+            print("warmup error:", name, e)
+            errors[name] = str(e)
+        finally:
+            timings[name] = round(time.time() - t0, 3)
 
+    # 1️⃣ 해당 정규장에 실행될 PENDING 주문 종목
+    rows = step("orders", lambda: (
+        supabase_admin
+        .table("queued_orders")
+        .select("*")
+        .eq("status", "PENDING")
+        .lte("execute_after", session_close.isoformat())
+        .execute()
+        .data
+    )) or []
+    tickers = sorted({r["ticker"].upper() for r in rows})
+    by_account = {
+        account: sorted({o["ticker"].upper() for o in orders})
+        for account, orders in group_orders_by_account(rows).items()
+    }
+
+    ttl = (session_close - datetime.now(timezone.utc)).total_seconds()
+    for account, account_tickers in by_account.items():
+        # 2️⃣ KIS 토큰 (장 마감까지 유효하도록 미리 재발급)
+        step(f"token:{account}", lambda: broker.get_access_token(min_ttl=max(ttl, 0), account=account))
+
+        # 3️⃣ 잔고 스냅샷 (보유 종목 거래소 코드도 함께 캐시)
+        step(f"balance:{account}", lambda: broker.get_overseas_balance(max_age=0, account=account))
+
+        # 4️⃣ 나머지 거래소 코드
+        step(f"exchange:{account}", lambda: [
+            broker.get_kis_exchange_code(t, account=account) for t in account_tickers
+        ])
+
+    # 5️⃣ 완료 일봉 종가 (뉴욕 날짜 단위 캐시 → 장 중 yfinance fallback 시 재사용)
+    #    실시간 시세는 QUOTE_CACHE_TTL 이 짧아 장 전에 받아 둬도 소용없음
+    step("closes", lambda: [get_completed_closes(t) for t in tickers])
+
+    session_day = session_open.tz_convert(ny_tz).date()
+    result = {
+        "session_open": session_open.isoformat(),
+        "tickers": tickers,
+        "accounts": by_account,
+        "timings": timings,
+        "errors": errors,
+    }
+    # 🔥 실패 단계가 있으면 다음 호출에서 다시 시도
+    if not errors:
+        WARMUP_STATE["session"] = session_day
+        WARMUP_STATE["result"] = result
+    return result
 
 # =====================
 # Auth utils
@@ -408,9 +737,12 @@ def login(data: dict):
 # =====================
 # 🔥 repeat_group 전체 개수 계산 (공통)
 # =====================
-def get_repeat_total(db, repeat_group: str) -> int:
+def get_repeat_total(db, repeat_group: str, repeat_total: int | None = None) -> int:
     if not repeat_group:
         return 1
+    # 🔥 완료 회차는 order_history 로 이관되므로 저장된 총 회차 우선
+    if repeat_total:
+        return repeat_total
         
     res = (
         db
@@ -443,50 +775,256 @@ def get_yahoo_quote(ticker: str) -> dict:
         }
     except Exception:
         return {"regular": None, "pre": None, "post": None}
-def get_realtime_price(ticker: str) -> dict:
+def get_stream_price(ticker: str) -> float | None:
+    # 🔥 스트림 최신 체결가 (없거나 오래됐으면 None → REST)
+    if quote_stream is None:
+        return None
+    return quote_stream.get(ticker)
+
+def refresh_stream_symbols():
+    """watchlist + PENDING 주문 종목으로 스트림 구독 갱신"""
+    if quote_stream is None:
+        return
+    try:
+        watch = supabase_admin.table("watchlist").select("ticker").execute().data or []
+        pending = (
+            supabase_admin
+            .table("queued_orders")
+            .select("ticker")
+            .eq("status", "PENDING")
+            .execute()
+        ).data or []
+        quote_stream.set_symbols({r["ticker"] for r in watch + pending})
+    except Exception as e:
+        print("stream symbols refresh error:", e)
+
+def stream_symbols_loop():
+    while True:
+        refresh_stream_symbols()
+        time.sleep(STREAM_SYMBOLS_REFRESH)
+
+@app.on_event("startup")
+def start_quote_stream():
+    if quote_stream is None:
+        return
+    threading.Thread(
+        target=stream_symbols_loop,
+        name="stream-symbols",
+        daemon=True
+    ).start()
+
+@app.on_event("shutdown")
+def stop_quote_stream():
+    if quote_stream is not None:
+        quote_stream.stop()
+
+@app.get("/api/stream/status")
+def stream_status(user: str = Depends(get_current_user)):
+    breakers = {name: b.state() for name, b in PRICE_BREAKERS.items()}
+    if quote_stream is None:
+        return {"enabled": False, "breakers": breakers}
+    return {"enabled": True, "breakers": breakers, **quote_stream.status()}
+
+@app.get("/api/leader")
+def leader_status(user: str = Depends(get_current_user)):
+    if leader is None:
+        return {"enabled": False, "node": NODE_ID}
+    return {"enabled": True, "backend": LEASE_MODE, "leader_only": CRON_LEADER_ONLY, **leader.status()}
+
+# =====================
+# 가격 소스 circuit breaker
+# =====================
+class CircuitBreaker:
     """
-    Alpaca 우선 → Yahoo fallback
+    연속 실패 threshold 회 → cooldown 초 동안 차단
+    cooldown 후 1회 시험 호출 허용 (성공 시 복구)
     """
-    regular = pre = post = None
-    # =====================
-    # Alpaca
-    # =====================
+    def __init__(self, name: str, threshold: int = 3, cooldown: float = 60):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.failures < self.threshold:
+                return True
+            if time.time() - self.opened_at >= self.cooldown:
+                # 🔥 half-open: 다음 1회만 통과
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.failures == self.threshold:
+                    print(f"⚠ {self.name} circuit open")
+                self.opened_at = time.time()
+
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return "closed"
+        if time.time() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+PRICE_BREAKERS = {
+    "alpaca": CircuitBreaker("alpaca"),
+    "yahoo": CircuitBreaker("yahoo"),
+}
+PRICE_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="price")
+PRICE_HEDGE_DELAY = 0.4   # 🔥 Alpaca 응답 없으면 이 시점에 Yahoo 동시 요청
+PRICE_DEADLINE = 3.0      # 🔥 가격 조회 전체 마감 (초)
+
+def call_price_source(name: str, fn, allowed: bool = False):
+    """
+    breaker 확인 → 호출 → 결과로 breaker 갱신 (실패/빈 값은 None)
+    allowed=True: 호출 측에서 이미 allow() 통과 (half-open 시험 호출 1회를 두 번 쓰지 않게)
+    """
+    breaker = PRICE_BREAKERS[name]
+    if not allowed and not breaker.allow():
+        return None
     try:
-        trade = alpaca_data.get_stock_latest_trade(
-            StockLatestTradeRequest(symbol_or_symbols=ticker)
+        with span(name, "price"):
+            result = fn()
+    except Exception as e:
+        print(f"{name} price error:", e)
+        result = None
+    breaker.record(result is not None)
+    return result
+
+def fetch_alpaca_last_trade(ticker: str) -> dict | None:
+    trade = alpaca_data.get_stock_latest_trade(
+        StockLatestTradeRequest(symbol_or_symbols=ticker)
+    )
+    price = float(trade[ticker].price)
+    return {"last": price} if price > 0 else None
+
+def fetch_yahoo_last(ticker: str) -> dict | None:
+    y = get_yahoo_quote(ticker)
+    if all(v is None for v in y.values()):
+        return None
+    return {"last": y["regular"], **y}
+
+def hedged_last_price(ticker: str, deadline: float = PRICE_DEADLINE) -> dict | None:
+    """
+    Alpaca 먼저 → PRICE_HEDGE_DELAY 안에 답 없으면 Yahoo 동시 요청
+    deadline 안에 먼저 온 유효한 값 사용
+    """
+    end = time.time() + deadline
+    pending = set()
+
+    if PRICE_BREAKERS["alpaca"].allow():
+        pending.add(PRICE_EXECUTOR.submit(
+            call_price_source, "alpaca", partial(fetch_alpaca_last_trade, ticker), allowed=True
+        ))
+        done, _ = wait(pending, timeout=PRICE_HEDGE_DELAY)
+        for f in done:
+            pending.discard(f)
+            if f.result():
+                return {**f.result(), "source": "alpaca"}
+
+    if PRICE_BREAKERS["yahoo"].allow():
+        yahoo = PRICE_EXECUTOR.submit(
+            call_price_source, "yahoo", partial(fetch_yahoo_last, ticker), allowed=True
         )
-        regular = float(trade[ticker].price)
-    except Exception:
-        pass
+        yahoo.source = "yahoo"
+        pending.add(yahoo)
+
+    while pending:
+        remaining = end - time.time()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for f in done:
+            if f.result():
+                return {**f.result(), "source": getattr(f, "source", "alpaca")}
+
+    return None
+
+def get_realtime_price(ticker: str, deadline: Deadline | None = None) -> dict:
+    """
+    최신 체결가 (정규장 기준, 시간외 표시는 하지 않음 — resolve_prices 참고)
+    Alpaca 지연/실패 시 Yahoo 와 경쟁 (circuit breaker 적용)
+    """
+    quote = hedged_last_price(
+        ticker,
+        deadline.timeout(PRICE_DEADLINE) if deadline else PRICE_DEADLINE
+    )
+    if not quote:
+        return {"regular": None}
+    return {"regular": quote.get("regular") or quote["last"]}
+
+def get_yahoo_quotes(tickers: list[str], deadline: Deadline | None = None) -> dict[str, float | None]:
+    """
+    여러 종목 정규장 가격 1회 조회
+    Returns: {ticker: regularMarketPrice | None}
+    """
+    result = {t: None for t in tickers}
+    if not tickers:
+        return result
+    url = "https://query1.finance.yahoo.com/v7/finance/quote"
+    params = {"symbols": ",".join(tickers)}
     try:
-        snap = alpaca_data.get_stock_snapshot(
-            StockSnapshotRequest(symbol_or_symbols=ticker)
-        )
-        s = snap[ticker]
-        if s.pre_market_trade:
-            pre = float(s.pre_market_trade.price)
-        if s.post_market_trade:
-            post = float(s.post_market_trade.price)
+        r = requests.get(url, params=params, timeout=deadline.timeout(3) if deadline else 3)
+        r.raise_for_status()
+        for q in r.json()["quoteResponse"]["result"]:
+            symbol = q.get("symbol", "").upper()
+            if symbol in result:
+                result[symbol] = q.get("regularMarketPrice")
     except Exception:
         pass
-    # =====================
-    # Yahoo fallback
-    # =====================
-    if pre is None or post is None:
-        y = get_yahoo_quote(ticker)
-        pre = pre or y["pre"]
-        post = post or y["post"]
-        regular = regular or y["regular"]
-    return {
-        "regular": regular,
-        "pre": pre,
-        "post": post,
-    }
+    return result
+
+def get_realtime_prices(tickers: list[str], deadline: Deadline | None = None) -> dict[str, float | None]:
+    """
+    여러 종목 최신 체결가 일괄 조회
+    Alpaca 1회 → 빠진 종목만 Yahoo 1회 fallback
+    """
+    tickers = [t.upper() for t in tickers]
+    # 🔥 스트림에 신선한 값 있으면 REST 생략
+    prices = {t: get_stream_price(t) for t in tickers}
+    rest = [t for t, v in prices.items() if v is None]
+    if not rest:
+        return prices
+    trades = call_price_source("alpaca", lambda: alpaca_data.get_stock_latest_trade(
+        StockLatestTradeRequest(symbol_or_symbols=rest)
+    ) or None)
+    for t in rest:
+        if trades and t in trades:
+            prices[t] = float(trades[t].price)
+    missing = [t for t, v in prices.items() if v is None]
+    if missing:
+        yahoo = call_price_source(
+            "yahoo",
+            lambda: {k: v for k, v in get_yahoo_quotes(missing, deadline).items() if v is not None} or None
+        )
+        for t, v in (yahoo or {}).items():
+            prices[t] = v
+    return prices
     
+PHASE_CACHE = {"phase": None, "at": 0}
+PHASE_CACHE_TTL = 15  # 초
+
 def get_market_phase(now=None):
     """
     Returns: REGULAR | PRE | POST | CLOSE
     """
+    if now is None:
+        # 🔥 가격 조회마다 거래소 일정 3회 계산 방지
+        if time.time() - PHASE_CACHE["at"] < PHASE_CACHE_TTL:
+            return PHASE_CACHE["phase"]
+        phase = get_market_phase(datetime.now(ny_tz))
+        PHASE_CACHE["phase"] = phase
+        PHASE_CACHE["at"] = time.time()
+        return phase
     if is_us_market_open(now):
         return "REGULAR"
     if is_us_premarket(now):
@@ -494,14 +1032,24 @@ def get_market_phase(now=None):
     if is_us_postmarket(now):
         return "POST"
     return "CLOSE"
-def resolve_prices(ticker: str):
-    closes = get_yf_daily_closes(ticker, period="5d")
-    close_price = closes[-1]
-    prev_close = closes[-2]
-    realtime = get_realtime_price(ticker)
+def is_session_started(now=None) -> bool:
+    """오늘이 거래일이고 정규장이 이미 시작됐는지"""
+    if now is None:
+        now = datetime.now(ny_tz)
+    schedule = nyse.schedule(start_date=now.date(), end_date=now.date())
+    if schedule.empty:
+        return False
+    return now >= schedule.iloc[0]["market_open"]
+
+def resolve_prices(ticker: str, quote: dict | None = None, deadline: Deadline | None = None):
+    # 🔥 Alpaca snapshot 1회 (일괄 조회 캐시) → 실패 시 yfinance fallback
+    if quote is None:
+        quote = get_quotes([ticker], deadline)[ticker.upper()]
     phase = get_market_phase()
+    close_price = quote["close_price"]
+    prev_close = quote["prev_close"]
     # 기준가 (항상 정규장 기준)
-    base_price = realtime["regular"] or close_price
+    base_price = quote["last"] or close_price
     if phase == "REGULAR":
         display_price = base_price
         price_source = "REGULAR"
@@ -520,21 +1068,174 @@ def resolve_prices(ticker: str):
         "after_change": None,
         "after_change_pct": None,
     }
-def get_yf_daily_closes(ticker: str, period="6mo") -> list[float]:
-    df = yf.download(
-        ticker,
-        period=period,
-        interval="1d",
-        progress=False,
-        threads=False
-    )
+def get_yf_daily_close_series(ticker: str, period="6mo", deadline: Deadline | None = None) -> pd.Series:
+    with span("yf.download", "yfinance", ticker=ticker, period=period):
+        df = yf.download(
+            ticker,
+            period=period,
+            interval="1d",
+            progress=False,
+            threads=False,
+            timeout=deadline.timeout(10) if deadline else 10
+        )
     if df is None or df.empty:
         raise ValueError("No yfinance data")
     close = df["Close"]
     if isinstance(close, pd.DataFrame):
         close = close.iloc[:, 0]
-    return close.astype(float).tolist()
+    return close.astype(float).dropna()
+def get_yf_daily_closes(ticker: str, period="6mo", deadline: Deadline | None = None) -> list[float]:
+    return get_yf_daily_close_series(ticker, period, deadline).tolist()
+def get_completed_closes(ticker: str, deadline: Deadline | None = None) -> pd.Series:
+    """
+    오늘(뉴욕) 이전에 끝난 일봉 종가만 반환, 뉴욕 날짜 단위로 캐시
+    """
+    today = datetime.now(ny_tz).date()
+    key = (ticker.upper(), today)
+    cached = CLOSE_CACHE.get(key)
+    if cached is not None:
+        return cached
+    close = get_yf_daily_close_series(ticker, period="5d", deadline=deadline)
+    close = close[close.index.date < today]
+    if len(close) < 2:
+        raise ValueError("No completed daily closes")
+    # 🔥 지난 날짜 캐시 정리
+    for k in [k for k in CLOSE_CACHE if k[1] != today]:
+        CLOSE_CACHE.pop(k, None)
+    CLOSE_CACHE[key] = close
+    return close
+# =====================
+# 통합 시세 (Alpaca snapshot 일괄 조회)
+# =====================
+def quote_from_snapshot(ticker: str, snap, today: date, session_started: bool) -> dict | None:
+    """
+    snapshot.daily_bar = 최신 일봉 (장 시작 후면 오늘 진행 중 일봉)
+    snapshot.previous_daily_bar = 그 직전 일봉
+    → 완료 일봉 기준 close_price / prev_close 를 yfinance 없이 계산
+    """
+    if snap is None or snap.daily_bar is None or snap.previous_daily_bar is None:
+        return None
+    bar_day = snap.daily_bar.timestamp.astimezone(ny_tz).date()
+    last = float(snap.latest_trade.price) if snap.latest_trade else None
+
+    if bar_day < today:
+        # 오늘 일봉 없음 → daily_bar 가 마지막 완료 일봉
+        completed_last = float(snap.daily_bar.close)
+        completed_prev = float(snap.previous_daily_bar.close)
+    elif session_started:
+        # 오늘 일봉 진행 중 → previous_daily_bar 가 마지막 완료 일봉
+        completed_last = float(snap.previous_daily_bar.close)
+        completed_prev = None
+    else:
+        # 장 시작 전인데 오늘 일봉 → 완료 일봉 2개를 알 수 없음
+        return None
+
+    if session_started:
+        # 오늘 장 시작 이후 → 전일 종가 = 마지막 완료 일봉
+        prev_close = completed_last
+        close_price = completed_last if last else float(snap.daily_bar.close)
+    else:
+        close_price = completed_last
+        prev_close = completed_prev
+
+    return {
+        "ticker": ticker,
+        "last": last,
+        "close_price": close_price,
+        "prev_close": prev_close,
+        "source": "alpaca",
+    }
+
+def quote_from_fallback(ticker: str, session_started: bool, deadline: Deadline | None = None) -> dict:
+    """snapshot 없을 때: yfinance 완료 일봉 + 최신 체결가 (기존 경로)"""
+    completed = get_completed_closes(ticker, deadline)
+    last = get_realtime_price(ticker, deadline=deadline)["regular"]
+    if session_started:
+        prev_close = float(completed.iloc[-1])
+        if last:
+            close_price = prev_close
+        else:
+            close_price = get_yf_daily_closes(ticker, period="5d", deadline=deadline)[-1]
+    else:
+        close_price = float(completed.iloc[-1])
+        prev_close = float(completed.iloc[-2])
+    return {
+        "ticker": ticker,
+        "last": last,
+        "close_price": close_price,
+        "prev_close": prev_close,
+        "source": "yfinance",
+    }
+
+def get_quotes(tickers: list[str], deadline: Deadline | None = None) -> dict[str, dict]:
+    """
+    종목별 통합 시세 {last, close_price, prev_close, source}
+    snapshot 1회 (최근 QUOTE_CACHE_TTL 초 내 조회분은 재사용)
+    → 빠진 종목만 yfinance fallback
+    deadline 지정 시 fallback 은 병렬, 마감까지 못 받은 종목은 결과에서 빠짐
+    """
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    now_ts = time.time()
+    quotes = {}
+    for t in tickers:
+        cached = QUOTE_CACHE.get(t)
+        if cached and now_ts - cached[1] < QUOTE_CACHE_TTL:
+            quotes[t] = dict(cached[0])
+
+    missing = [t for t in tickers if t not in quotes]
+    if missing:
+        today = datetime.now(ny_tz).date()
+        started = is_session_started()
+        snaps = call_price_source("alpaca", lambda: alpaca_data.get_stock_snapshot(
+            StockSnapshotRequest(symbol_or_symbols=missing, feed=ALPACA_DATA_FEED)
+        ) or None) or {}
+
+        fallback = []
+        for t in missing:
+            q = None
+            try:
+                q = quote_from_snapshot(t, snaps.get(t), today, started)
+            except Exception as e:
+                print("snapshot quote error:", t, e)
+            if q is None:
+                fallback.append(t)
+                continue
+            QUOTE_CACHE[t] = (q, now_ts)
+            quotes[t] = dict(q)
+
+        if deadline is None:
+            fetched, errors = {}, {}
+            for t in fallback:
+                try:
+                    fetched[t] = quote_from_fallback(t, started)
+                except Exception as e:
+                    errors[t] = e
+        else:
+            fetched, late, errors = run_within(
+                deadline, PRICE_EXECUTOR,
+                partial(quote_from_fallback, session_started=started, deadline=deadline),
+                fallback
+            )
+            if late:
+                print("fallback quote deadline:", late)
+        for t, e in errors.items():
+            print("fallback quote error:", t, e)
+        for t, q in fetched.items():
+            QUOTE_CACHE[t] = (q, now_ts)
+            quotes[t] = dict(q)
+
+    # 🔥 스트림에 신선한 체결가 있으면 우선
+    for t, q in quotes.items():
+        live = get_stream_price(t)
+        if live is not None:
+            q["last"] = live
+    return quotes
+
 # =====================
+def get_sell_target(avg_price: float) -> float:
+    # 🔥 평단가 +10% 익절 목표가 (build_order_preview SELL 과 동일)
+    return round(float(avg_price) * SELL_TARGET_RATIO, 2)
+
 def build_order_preview(data: dict):
     side = data["side"]
     avg = float(data["avg_price"])
@@ -546,8 +1247,8 @@ def build_order_preview(data: dict):
     qty = None
 
     if side == "BUY_MARKET":
-        price = round(min(avg * 1.05, cur * 1.15), 2)
-        qty = int((seed / 80) // price)
+        price = round(min(avg * BUY_MARKET_AVG_RATIO, cur * BUY_MARKET_CUR_RATIO), 2)
+        qty = int((seed / BUY_SLICES) // price)
         price_type = "LOC"
         message = "큰 수 매수 (LOC)"
 
@@ -556,7 +1257,7 @@ def build_order_preview(data: dict):
 
     elif side == "BUY_AVG":
         price = round(avg, 2)
-        qty = int((seed / 80) // price)
+        qty = int((seed / BUY_SLICES) // price)
         price_type = "LOC"
         message = "평단가 매수 (LOC)"
 
@@ -564,7 +1265,7 @@ def build_order_preview(data: dict):
             raise ValueError("수량 0")
 
     elif side == "SELL":
-        target = round(avg * 1.10, 2)
+        target = get_sell_target(avg)
 
         if cur > target:
             price = round(cur, 2)
@@ -590,16 +1291,117 @@ def build_order_preview(data: dict):
         "message": message
     }
  
+def evaluate_reservations(
+    rows: list[dict],
+    snapshot: dict | None = None,
+    prices: dict | None = None,
+    deadline: Deadline | None = None,
+    priority: int = PRIORITY_POSITION
+) -> dict:
+    """
+    PENDING 예약을 잔고 스냅샷 1회 + 시세 1회로 일괄 평가
+    (cron 실행 시 build_order_preview 가 낼 가격/수량/필요 현금 미리 계산)
+    """
+    if not rows:
+        return {
+            "orders": [],
+            "total_required_amount": 0.0,
+            "total_proceeds": 0.0,
+            "by_ticker": {}
+        }
+
+    df = pd.DataFrame([
+        {
+            "id": r.get("id"),
+            "account_id": order_account(r),
+            "ticker": r["ticker"].upper(),
+            "side": r["side"],
+            "seed": r.get("seed"),
+            "execute_after": r.get("execute_after"),
+            "repeat_group": r.get("repeat_group"),
+            "repeat_index": r.get("repeat_index"),
+        }
+        for r in rows
+    ])
+
+    if prices is None:
+        prices = get_realtime_prices(df["ticker"].unique().tolist(), deadline)
+
+    # 🔥 계좌별 잔고 스냅샷 1회 (snapshot 을 넘기면 전 계좌 공통)
+    positions = {
+        account: (snapshot or broker.get_overseas_balance(
+            max_age=BALANCE_CACHE_TTL,
+            account=account,
+            priority=priority
+        ))["positions"]
+        for account in df["account_id"].unique()
+    }
+    position = [
+        positions[a].get(t, {}) for a, t in zip(df["account_id"], df["ticker"])
+    ]
+
+    df["avg_price"] = [p.get("avg_price", 0) for p in position]
+    df["current_price"] = df["ticker"].map(prices)
+    df["qty_owned"] = [p.get("sellable_qty", 0) for p in position]
+
+    # 🔥 같은 계좌/종목 SELL 이 여러 건이면 첫 건만 전량 매도 가능
+    sell_rank = df[df["side"] == "SELL"].groupby(["account_id", "ticker"]).cumcount()
+    df.loc[sell_rank[sell_rank > 0].index, "qty_owned"] = 0
+
+    ev = evaluate_orders(df)
+
+    by_ticker = (
+        ev.groupby("ticker")["required_amount"].sum().round(2).to_dict()
+    )
+    orders = ev.astype(object).where(ev.notna(), None).to_dict("records")
+
+    return {
+        "orders": orders,
+        "total_required_amount": round(float(ev["required_amount"].sum()), 2),
+        "total_proceeds": round(float(ev["proceeds"].sum()), 2),
+        "by_ticker": by_ticker
+    }
+
+def project_session_orders(user: str | None = None, base_date: date | None = None, priority: int = PRIORITY_POSITION):
+    """
+    다음 정규장 마감 전까지 실행될 PENDING 주문 일괄 평가 (주문 없음)
+    """
+    bounds = get_session_bounds(base_date)
+    if bounds is None:
+        raise HTTPException(400, "다음 정규장을 찾을 수 없습니다")
+    session_open, session_close = bounds
+
+    q = (
+        supabase_admin
+        .table("queued_orders")
+        .select("*")
+        .eq("status", "PENDING")
+        .lte("execute_after", session_close.isoformat())
+    )
+    if user:
+        q = q.eq("user_id", user)
+    rows = q.order("repeat_index").execute().data or []
+
+    result = evaluate_reservations(rows, priority=priority)
+
+    return {
+        "dry_run": True,
+        "session_open": session_open.isoformat(),
+        "session_close": session_close.isoformat(),
+        **result
+    }
+
 @app.post("/api/order/preview")
 def order_preview(
     data: dict,
     user: str = Depends(get_current_user)
 ):
     cleanup_order_cache()
+    account = resolve_account(data.get("account_id"))
 
     try:
         if data["side"] == "SELL":
-            pos = get_overseas_avg_price(data["ticker"])
+            pos = broker.get_overseas_avg_price(data["ticker"], account=account)
 
             if not pos or not pos.get("found"):
                 raise ValueError("보유 종목 없음")
@@ -619,6 +1421,7 @@ def order_preview(
             **preview,
             "side": data["side"],
             "ticker": data["ticker"],
+            "account_id": account,
             "created_at": datetime.now(UTC)
         }
 
@@ -638,8 +1441,9 @@ def execute_order(order_id: str, user: str = Depends(get_current_user)):
             "정규장에만 즉시 주문 가능합니다. 예약 주문을 사용하세요."
         )
     # 🔥 SELL은 실시간 수량 재조회 (cron과 동일 구조)
+    account = order_account(order)
     if order["side"] == "SELL":
-        pos = get_overseas_avg_price(order["ticker"])
+        pos = broker.get_overseas_avg_price(order["ticker"], account=account)
         sellable_qty = float(pos.get("sellable_qty", 0))
         if sellable_qty <= 0:
             raise HTTPException(400, "매도 가능 수량 없음")
@@ -649,13 +1453,25 @@ def execute_order(order_id: str, user: str = Depends(get_current_user)):
         if order_qty <= 0:
             raise HTTPException(400, "주문 수량 0")
     side = "buy" if order["side"].startswith("BUY") else "sell"
-    result = order_overseas_stock(
-        ticker=order["ticker"],
-        price=order["price"],
-        qty=order_qty,   # 🔥 수정된 수량 사용
-        side=side
-    )
+    try:
+        # 🔥 같은 preview 로 중복 클릭해도 1회만 접수
+        result = submit_order(
+            supabase_admin,
+            order_ref=f"manual:{order_id}",
+            ticker=order["ticker"],
+            price=order["price"],
+            qty=order_qty,   # 🔥 수정된 수량 사용
+            side=side,
+            account=account
+        )
+    except OrderPendingError as e:
+        # 🔥 같은 order_id 로 다시 요청하면 원장이 접수 여부 대조 후 처리
+        raise HTTPException(409, f"주문 확인 중 — 잠시 뒤 다시 시도: {e}")
+    except Exception as e:
+        raise HTTPException(502, f"주문 실패: {e}")
     ORDER_CACHE.pop(order_id, None)
+    broker.invalidate_balance_cache(account)
+    broker.invalidate_buying_power_cache(account)
     return {"status": "ok", "result": result}
 @app.post("/api/order/reserve")
 
@@ -704,6 +1520,7 @@ async def reserve_order(
     rows = [
         {
             "user_id": user,
+            "account_id": order_account(order),
             "ticker": order["ticker"],
             "side": order["side"],
             "seed": seed,
@@ -728,6 +1545,7 @@ async def reserve_order(
     except Exception as e:
         raise HTTPException(500, f"예약 저장 실패: {e}")
     ORDER_CACHE.pop(order_id, None)
+    refresh_stream_symbols()
     return {
         "status": "reserved",
         "repeat_days": repeat_days,
@@ -764,9 +1582,9 @@ def calculate_wilder_rsi_series(series: pd.Series, period: int = 14):
 # =====================
 # Finviz RSI (Cron용)
 # =====================
-def get_finviz_rsi(ticker: str):
+def get_finviz_rsi(ticker: str, deadline: Deadline | None = None):
     url = f"https://finviz.com/quote.ashx?t={ticker}"
-    r = requests.get(url, headers=HEADERS, timeout=10)
+    r = requests.get(url, headers=HEADERS, timeout=deadline.timeout(10) if deadline else 10)
     r.raise_for_status()
     soup = BeautifulSoup(r.text, "html.parser")
     table = soup.find("table", class_="snapshot-table2")
@@ -805,22 +1623,63 @@ def get_rsi_baseline(ticker: str, db):
 # =====================
 # Watchlist 화면용
 # =====================  
+def fetch_latest_rsi_rows(tickers: list[str]) -> dict[str, list[dict]]:
+    """
+    종목별 최근 2개 rsi_history (RPC 1회)
+    RPC 없으면 최근 구간 일괄 조회 1회로 대체
+    """
+    result = {t: [] for t in tickers}
+    if not tickers:
+        return result
+    try:
+        rows = supabase_admin.rpc("rsi_history_latest", {
+            "p_tickers": tickers,
+            "p_limit": 2
+        }).execute().data or []
+    except Exception as e:
+        print("rsi_history_latest RPC error:", e)
+        cutoff = (datetime.now(ny_tz).date() - timedelta(days=30)).isoformat()
+        rows = (
+            supabase_admin
+            .table("rsi_history")
+            .select("ticker, day, rsi, price")
+            .in_("ticker", tickers)
+            .gte("day", cutoff)
+            .order("day", desc=True)
+            .execute()
+        ).data or []
+    for r in rows:
+        t = r["ticker"].upper()
+        if t in result and len(result[t]) < 2:
+            result[t].append(r)
+    return result
+
+def get_latest_rsi_rows(tickers: list[str]) -> dict[str, list[dict]]:
+    """
+    rsi_history 최근 2행 메모리 캐시 (cron_save 가 새 행 쓰기 전까지 유지)
+    캐시에 없는 종목만 한 번에 추가 조회
+    2행 미만 (backfill 전 새 종목 등) 은 캐시하지 않음 → 다음 호출에서 다시 조회
+    """
+    tickers = [t.upper() for t in tickers]
+    if time.time() - RSI_HISTORY_CACHE["loaded_at"] > RSI_HISTORY_CACHE_TTL:
+        RSI_HISTORY_CACHE["rows"] = {}
+        RSI_HISTORY_CACHE["loaded_at"] = time.time()
+    cache = RSI_HISTORY_CACHE["rows"]
+    missing = [t for t in tickers if t not in cache]
+    fetched = fetch_latest_rsi_rows(missing) if missing else {}
+    cache.update({t: rows for t, rows in fetched.items() if len(rows) >= 2})
+    return {t: cache.get(t) or fetched.get(t, []) for t in tickers}
+
+def invalidate_rsi_history_cache():
+    RSI_HISTORY_CACHE["rows"] = {}
+    RSI_HISTORY_CACHE["loaded_at"] = 0
+
 def get_rsi_from_history(ticker: str):
     """
     rsi_history 기준
     항상 직전 거래일 RSI 반환
     """
-    res = (
-        supabase_admin
-        .table("rsi_history")
-        .select("day, rsi")
-        .eq("ticker", ticker.upper())
-        .order("day", desc=True)
-        .limit(2)
-        .execute()
-    )
-
-    rows = res.data or []
+    rows = get_latest_rsi_rows([ticker])[ticker.upper()]
 
     if len(rows) < 2:
         return None  # 데이터 부족
@@ -830,33 +1689,27 @@ def get_rsi_from_history(ticker: str):
     return float(rows[1]["rsi"])
 
     
-def get_watchlist_item(ticker: str):
+def get_watchlist_item(ticker: str, quote: dict | None = None, deadline: Deadline | None = None):
     # =====================
     # 가격
     # =====================
-    p = resolve_prices(ticker)
+    p = resolve_prices(ticker, quote, deadline)
     # =====================
     # 🔥 Finviz 실시간 RSI
     # =====================
     try:
-        realtime_rsi, _ = get_finviz_rsi(ticker)
+        realtime_rsi, _ = get_finviz_rsi(ticker, deadline)
         realtime_rsi = round(float(realtime_rsi), 2)
     except Exception as e:
         print("Finviz RSI error:", ticker, e)
         realtime_rsi = None
     # =====================
-    # 📉 전일 RSI (DB)
+    # 📉 전일 RSI (DB, watchlist 단위 일괄 캐시)
     # =====================
     prev_rsi = get_rsi_from_history(ticker)
-    # ✅ prev_rsi 안전 보정
-    try:
-        prev_rsi = float(prev_rsi)
-    except (TypeError, ValueError):
-        prev_rsi = 0.0  # ✅ None / NaN → 0
     # =====================
     # RSI 증감 계산 (절대 null 안 나오게)
     # =====================
-    prev_rsi = get_rsi_from_history(ticker)
 
     if prev_rsi is None or realtime_rsi is None:
         rsi_change = 0.0
@@ -894,6 +1747,8 @@ def cleanup_order_cache():
 # =====================
 # Cron 저장
 # =====================
+CRON_SAVE_DEADLINE = 120  # 초 (장 마감 후 저장 구간 안에서 끝나도록)
+
 @app.post("/cron/save")
 def cron_save(request: Request):
 
@@ -917,6 +1772,9 @@ def cron_save(request: Request):
             <= close_time + timedelta(minutes=8)):
         return {"status": "not close window"}
 
+    return run_exclusive("save", save_daily_rsi, today, Deadline(CRON_SAVE_DEADLINE))
+
+def save_daily_rsi(today: date, deadline: Deadline):
     # =====================
     # 📌 watchlist 조회
     # =====================
@@ -933,14 +1791,20 @@ def cron_save(request: Request):
         " ".join(tickers),
         period="1d",
         group_by="ticker",
-        progress=False
+        progress=False,
+        timeout=deadline.timeout(30)
     )
 
     rows = []
+    pending = []
 
     for t in tickers:
+        # 🔥 마감 지나면 남은 종목은 저장 안 하고 응답에 pending 으로 (다음 회차 / backfill)
+        if deadline.expired():
+            pending.append(t)
+            continue
         try:
-            rsi, _ = get_finviz_rsi(t)
+            rsi, _ = get_finviz_rsi(t, deadline)
             if rsi is None:
                 continue
 
@@ -960,25 +1824,313 @@ def cron_save(request: Request):
                 "price": round(price, 2),
             })
 
-            time.sleep(0.6)
+            time.sleep(min(0.6, deadline.remaining()))
 
+        except DeadlineExceeded:
+            pending.append(t)
         except Exception as e:
             print("cron_save error:", t, e)
 
     if not rows:
-        return {"status": "no data", "day": today.isoformat()}
+        return {"status": "no data", "day": today.isoformat(), "pending": pending}
 
     supabase_admin.table("rsi_history").upsert(
         rows,
         on_conflict="ticker,day"
     ).execute()
+    invalidate_rsi_history_cache()
 
     return {
         "saved": [r["ticker"] for r in rows],
         "day": today.isoformat(),
-        "rows_count": len(rows)
+        "rows_count": len(rows),
+        "pending": pending,
+        "elapsed": round(deadline.elapsed(), 3)
+    }
+
+# =====================
+# rsi_history 과거 구간 backfill
+# =====================
+class RsiBackfillRequest(BaseModel):
+    start: date
+    end: date | None = None
+    tickers: list[str] | None = None
+    overwrite: bool = False
+
+@app.post("/cron/rsi-backfill")
+def cron_rsi_backfill(body: RsiBackfillRequest, request: Request):
+    if request.headers.get("X-CRON-KEY") != os.getenv("CRON_SECRET"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    tickers = body.tickers
+    if not tickers:
+        res = supabase_admin.table("watchlist").select("ticker").execute()
+        tickers = [r["ticker"] for r in (res.data or [])]
+
+    try:
+        result = run_exclusive(
+            "rsi-backfill",
+            backfill_rsi_history,
+            supabase_admin,
+            tickers,
+            start=body.start,
+            end=body.end,
+            overwrite=body.overwrite
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    invalidate_rsi_history_cache()
+    return result
+
+# =====================
+# 🔥 끝난 예약 주문 → order_history 이관 (배치)
+# =====================
+ARCHIVE_BATCH = 1000
+ARCHIVE_TIME_BUDGET = 20  # 초
+ARCHIVE_MIN_AGE_HOURS = 24
+
+@app.post("/cron/archive-orders")
+def cron_archive_orders(
+    request: Request,
+    batch: int = Query(ARCHIVE_BATCH, ge=1, le=10000),
+    min_age_hours: int = Query(ARCHIVE_MIN_AGE_HOURS, ge=0)
+):
+    if request.headers.get("X-CRON-KEY") != os.getenv("CRON_SECRET"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    return run_exclusive("archive-orders", archive_finished_orders, batch, min_age_hours)
+
+def archive_finished_orders(batch: int, min_age_hours: int) -> dict:
+    started = time.time()
+    moved = 0
+    batches = 0
+    # 🔥 배치가 가득 차는 동안 시간 예산 안에서 반복 (나머지는 다음 스케줄)
+    while time.time() - started < ARCHIVE_TIME_BUDGET:
+        count = supabase_admin.rpc("archive_queued_orders", {
+            "p_batch": batch,
+            "p_min_age": f"{min_age_hours} hours"
+        }).execute().data or 0
+        moved += count
+        batches += 1
+        if count < batch:
+            break
+
+    return {
+        "status": "ok",
+        "moved": moved,
+        "batches": batches,
+        "elapsed": round(time.time() - started, 3),
+        "done": count < batch
+    }
+
+# =====================
+# 🔥 장 마감 후 체결 확인 (계좌별 주문체결내역 연속 조회 1회 → 일괄 기록)
+# =====================
+FILL_LOOKBACK_DAYS = 3   # 🔥 archive_queued_orders 의 미대조 보관 기간과 같게 (008)
+
+def fill_status(kis_order: dict) -> str:
+    if kis_order["filled_qty"] <= 0:
+        return "UNFILLED"
+    if kis_order["filled_qty"] < kis_order["qty"]:
+        return "PARTIAL"
+    return "FILLED"
+
+def record_fills(fills: list[dict]) -> int:
+    """record_order_fills RPC 1회 (없으면 행 단위 update 로 대체)"""
+    if not fills:
+        return 0
+    try:
+        return supabase_admin.rpc("record_order_fills", {"p_fills": fills}).execute().data or 0
+    except Exception as e:
+        print("record_order_fills RPC error:", e)
+    now_iso = datetime.now(timezone.utc).isoformat()
+    for f in fills:
+        supabase_admin.table("queued_orders").update({
+            "filled_qty": f["filled_qty"],
+            "filled_price": f["filled_price"],
+            "filled_amount": f["filled_amount"],
+            "fill_status": f["fill_status"],
+            "reconciled_at": now_iso
+        }).eq("account_id", f["account_id"]).eq("odno", f["odno"]).execute()
+    return len(fills)
+
+def format_fill_line(o: dict, f: dict) -> str:
+    icon = {"FILLED": "✅", "PARTIAL": "🟡", "UNFILLED": "⚪"}[f["fill_status"]]
+    side = "매수" if o["side"].startswith("BUY") else "매도"
+    line = f"{icon} {o['ticker']} {side} {f['filled_qty']}/{o.get('order_qty') or '?'}주"
+    if f["filled_qty"] > 0:
+        line += f" @ ${f['filled_price']:,.2f} (${f['filled_amount']:,.2f})"
+    elif o.get("order_price"):
+        line += f" 미체결 (지정가 ${float(o['order_price']):,.2f})"
+    return line
+
+def reconcile_fills() -> dict:
+    since = (datetime.now(timezone.utc) - timedelta(days=FILL_LOOKBACK_DAYS)).isoformat()
+
+    # 🔥 응답 불명 / 미확인 원장 주문 재대조 (KIS 주문내역 반영이 늦었던 주문)
+    recovered = recheck_unresolved(supabase_admin, since)
+    if recovered:
+        send_telegram_message(
+            "⚠ 미확인 주문 접수 확인 (중복 주문 여부 확인 필요)\n"
+            + "\n".join(f"{r['ticker']} {r['side']} {r['qty']}주 @ {r['price']} · #{r['order_ref']} · {r['odno']}" for r in recovered)
+        )
+
+    orders = (
+        supabase_admin
+        .table("queued_orders")
+        .select("id, account_id, ticker, side, odno, order_price, order_qty, executed_at")
+        .eq("status", "DONE")
+        .not_.is_("odno", "null")
+        .is_("reconciled_at", "null")
+        .gte("executed_at", since)
+        .execute()
+    ).data or []
+    if not orders:
+        return {"status": "no orders", "recovered": len(recovered)}
+
+    # 🔥 주문일 (한국 날짜) 범위 → 계좌별 전 종목 1회 조회 (연속 조회 페이지만큼)
+    kst = pytz.timezone("Asia/Seoul")
+    days = [datetime.fromisoformat(o["executed_at"]).astimezone(kst).date() for o in orders]
+    start = min(days).strftime("%Y%m%d")
+    end = max(max(days), datetime.now(kst).date()).strftime("%Y%m%d")
+
+    fills = []
+    lines = []
+    missing = []
+    errors = {}
+    for account, account_orders in group_orders_by_account(orders).items():
+        try:
+            kis_orders = broker.inquire_overseas_orders(
+                start_date=start,
+                end_date=end,
+                ticker="%",
+                account=account
+            )
+        except Exception as e:
+            print("fill reconcile error:", account, e)
+            errors[account] = str(e)
+            continue
+        by_odno = {k["odno"]: k for k in kis_orders if k["odno"]}
+
+        for o in account_orders:
+            k = by_odno.get(o["odno"])
+            if k is None:
+                missing.append(o["id"])
+                continue
+            f = {
+                "account_id": account,
+                "odno": o["odno"],
+                "filled_qty": k["filled_qty"],
+                "filled_price": (k["filled_price"] or round(k["filled_amount"] / k["filled_qty"], 4)) if k["filled_qty"] else None,
+                "filled_amount": k["filled_amount"],
+                "fill_status": fill_status(k),
+            }
+            fills.append(f)
+            lines.append(format_fill_line(o, f))
+
+        # 🔥 체결 반영 → 다음 주문 수량 계산용 잔고 / 매수 가능 금액 새로 조회
+        broker.invalidate_balance_cache(account)
+        broker.invalidate_buying_power_cache(account)
+
+    recorded = record_fills(fills)
+
+    counts = {s: sum(1 for f in fills if f["fill_status"] == s) for s in ("FILLED", "PARTIAL", "UNFILLED")}
+    if lines:
+        summary = f"체결 {counts['FILLED']} · 부분 {counts['PARTIAL']} · 미체결 {counts['UNFILLED']}"
+        send_telegram_message("📊 장 마감 체결 확인\n" + summary + "\n\n" + "\n".join(lines))
+
+    return {
+        "status": "ok",
+        "recorded": recorded,
+        **{k.lower(): v for k, v in counts.items()},
+        "missing": missing,
+        "errors": errors,
+        "recovered": len(recovered)
     }
 
+@app.post("/cron/reconcile-fills")
+def cron_reconcile_fills(request: Request):
+    if request.headers.get("X-CRON-KEY") != os.getenv("CRON_SECRET"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    # 🔥 LOC / 지정가 주문은 장 마감 후에야 체결 확정
+    if is_us_market_open():
+        return {"status": "market open"}
+    return run_exclusive("reconcile-fills", reconcile_fills)
+
+# =====================
+# 🧪 paper 모드 (BROKER_BACKEND=sim): 장 마감 후 미체결 주문 종가 체결
+# =====================
+@app.post("/cron/sim-settle")
+def cron_sim_settle(request: Request):
+    if request.headers.get("X-CRON-KEY") != os.getenv("CRON_SECRET"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if broker.name != "sim":
+        raise HTTPException(400, "BROKER_BACKEND=sim 에서만 사용")
+    if is_us_market_open():
+        return {"status": "market open"}
+
+    def settle():
+        tickers = broker.open_tickers()
+        if not tickers:
+            return {"status": "no orders"}
+        # 🔥 장 마감 후 최신 체결가 = 종가
+        closes = get_realtime_prices(tickers)
+        return {"status": "ok", **broker.settle_close(closes), "closes": closes}
+
+    return run_exclusive("sim-settle", settle)
+
+# =====================
+# 🔥 주문 이력 조회 API
+# =====================
+ORDER_HISTORY_LIMIT = 50
+ORDER_HISTORY_MAX = 200
+
+@app.get("/api/order-history")
+def order_history(
+    ticker: str | None = Query(None),
+    start: date | None = Query(None),
+    end: date | None = Query(None),
+    status: str | None = Query(None),
+    cursor: str | None = Query(None),
+    limit: int = Query(ORDER_HISTORY_LIMIT, ge=1, le=ORDER_HISTORY_MAX),
+    user: str = Depends(get_current_user)
+):
+    """최신순 (finished_at desc, id desc) keyset 페이지네이션"""
+    q = (
+        supabase_admin
+        .table("order_history")
+        .select("*")
+        .eq("user_id", user)
+    )
+    if ticker:
+        q = q.eq("ticker", ticker.upper())
+    if status:
+        q = q.eq("status", status.upper())
+    # 🔥 파티션 키 범위 조건 → 해당 월 파티션만 탐색
+    if start:
+        q = q.gte("finished_at", ny_tz.localize(datetime.combine(start, datetime.min.time())).isoformat())
+    if end:
+        q = q.lt("finished_at", ny_tz.localize(datetime.combine(end + timedelta(days=1), datetime.min.time())).isoformat())
+    if cursor:
+        finished_at, last_id = decode_cursor(cursor, 2)
+        q = q.or_(
+            f'finished_at.lt."{finished_at}",'
+            f'and(finished_at.eq."{finished_at}",id.lt.{int(last_id)})'
+        )
+    rows = (
+        q.order("finished_at", desc=True)
+        .order("id", desc=True)
+        .limit(limit)
+        .execute()
+    ).data or []
+
+    next_cursor = (
+        encode_cursor(rows[-1]["finished_at"], rows[-1]["id"])
+        if len(rows) == limit else None
+    )
+    return {"items": rows, "next_cursor": next_cursor}
+
 # =====================
 # 🔥 예약 주문 삭제 API
 # =====================
@@ -995,6 +2147,7 @@ def delete_reservation_group(
             .eq("repeat_group", repeat_group) \
             .eq("status", "PENDING") \
             .execute()
+        refresh_stream_symbols()
         return {"status": "deleted", "repeat_group": repeat_group}
     except Exception as e:
         raise HTTPException(500, f"삭제 실패: {e}")
@@ -1026,6 +2179,8 @@ def add_ticker(ticker: str = Query(...)):
     supabase_admin.table("watchlist").insert({
         "ticker": t
     }).execute()
+    refresh_stream_symbols()
+    invalidate_watchlist_snapshot()
     return {"added": t}
 @app.delete("/tickers/{ticker}")
 def delete_ticker(ticker: str):
@@ -1034,21 +2189,55 @@ def delete_ticker(ticker: str):
         .delete()\
         .eq("ticker", t)\
         .execute()
+    refresh_stream_symbols()
+    invalidate_watchlist_snapshot()
     return {"removed": t}
     
-@app.get("/watchlist")
-def watchlist():
-    try:
-        # 🔥 FIX: DB 조회 예외 보호
-        res = supabase_admin.table("watchlist").select("ticker").execute()
-        rows = res.data or []
-    except Exception as e:
-        print("watchlist DB error:", e)
-        return {
-            "market_open": False,
-            "next_open": None,
-            "items": []
-        }
+# =====================
+# 🔥 watchlist 스냅샷 (stale-while-revalidate)
+# =====================
+# 요청은 마지막 스냅샷을 바로 반환 + 나이가 장 단계별 기준을 넘으면 백그라운드 갱신
+# WATCHLIST_SNAPSHOT_PERSIST=1 → app_snapshots 에 저장 (재시작 직후에도 즉시 응답)
+WATCHLIST_SNAPSHOT = {"data": None, "built_at": 0, "refreshing": False, "error": None, "generation": 0}
+WATCHLIST_SNAPSHOT_LOCK = threading.Lock()
+WATCHLIST_SNAPSHOT_READY = threading.Event()
+WATCHLIST_FRESHNESS = {   # 장 단계 → 허용 나이 (초)
+    "REGULAR": 15,
+    "PRE": 60,
+    "POST": 60,
+    "CLOSE": 30 * 60,
+}
+WATCHLIST_DEADLINE = 6   # 🔥 스냅샷 1회 빌드 마감 (초) — 넘긴 종목은 stale / pending
+WATCHLIST_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="watchlist")
+WATCHLIST_COLD_WAIT = 8  # 🔥 스냅샷이 아예 없을 때만 첫 빌드를 기다리는 시간 (초)
+WATCHLIST_SNAPSHOT_PERSIST = os.getenv("WATCHLIST_SNAPSHOT_PERSIST") == "1"
+
+def pending_watchlist_item(ticker: str, previous: dict | None) -> dict:
+    """마감까지 못 받은 종목: 이전 스냅샷 값 (stale) 또는 빈 자리 (pending)"""
+    if previous and not previous.get("pending"):
+        return {**previous, "stale": True}
+    return {
+        "ticker": ticker,
+        "current_price": None,
+        "current_change": None,
+        "current_change_pct": None,
+        "display_price": None,
+        "after_change": None,
+        "after_change_pct": None,
+        "price_source": None,
+        "rsi": None,
+        "rsi_change": None,
+        "rsi_change_pct": None,
+        "pending": True,
+    }
+
+def build_watchlist_snapshot(deadline: Deadline | None = None) -> dict:
+    """watchlist 전 종목 upstream 조회 (백그라운드 refresh 에서만 호출)"""
+    deadline = deadline or Deadline(WATCHLIST_DEADLINE)
+    # 🔥 DB 조회 실패는 그대로 raise → refresh 가 이전 스냅샷 유지 + error 기록
+    #    (빈 목록을 새 스냅샷으로 저장하면 watchlist 가 통째로 사라짐)
+    res = supabase_admin.table("watchlist").select("ticker").execute()
+    rows = res.data or []
 
     # 🔥 FIX: market open 계산도 보호
     try:
@@ -1061,15 +2250,39 @@ def watchlist():
 
     result = []
 
+    # 🔥 전일 RSI 전 종목 1회 조회 (캐시)
+    try:
+        get_latest_rsi_rows([r["ticker"] for r in rows])
+    except Exception as e:
+        print("watchlist rsi_history error:", e)
+
+    # 🔥 시세 전 종목 snapshot 1회 (get_watchlist_item 에서 캐시 재사용)
+    try:
+        quotes = get_quotes([r["ticker"] for r in rows], deadline)
+    except Exception as e:
+        print("watchlist quote error:", e)
+        quotes = {}
+
+    # 🔥 종목별 병렬 + 마감 (느린 Finviz / yfinance 한 종목이 전체를 막지 않게)
+    items, late, errors = run_within(
+        deadline, WATCHLIST_EXECUTOR,
+        lambda t: get_watchlist_item(t, quotes.get(t.upper()), deadline),
+        [r["ticker"] for r in rows]
+    )
+    previous = {
+        i["ticker"]: i for i in (WATCHLIST_SNAPSHOT["data"] or {}).get("items", [])
+    }
     for r in rows:
         ticker = r["ticker"]
-        try:
-            # 🔥 FIX: 개별 종목 단위로 예외 보호
-            item = get_watchlist_item(ticker)
-            result.append(item)
-        except Exception as e:
-            print("watchlist item error:", ticker, e)
-            continue  # 하나 터져도 전체 안 죽게
+        if ticker in items:
+            result.append(items[ticker])
+        elif ticker in late:
+            result.append(pending_watchlist_item(ticker, previous.get(ticker)))
+        else:
+            # 🔥 FIX: 개별 종목 단위로 예외 보호 (이전 값 있으면 stale 로 유지)
+            print("watchlist item error:", ticker, errors.get(ticker))
+            if ticker in previous:
+                result.append(pending_watchlist_item(ticker, previous[ticker]))
 
     # 🔥 FIX: 정렬 시 None 안전 처리
     result.sort(
@@ -1079,14 +2292,361 @@ def watchlist():
     return {
         "market_open": is_open,
         "next_open": next_open.isoformat() if next_open else None,
-        "items": result
+        "items": result,
+        "partial": bool(late),
+        "pending_tickers": late
     }
 
     
+def load_persisted_watchlist_snapshot():
+    try:
+        rows = (
+            supabase_admin
+            .table("app_snapshots")
+            .select("data, built_at")
+            .eq("name", "watchlist")
+            .limit(1)
+            .execute()
+        ).data or []
+    except Exception as e:
+        print("watchlist snapshot load error:", e)
+        return
+    if not rows:
+        return
+    built_at = datetime.fromisoformat(rows[0]["built_at"]).timestamp()
+    with WATCHLIST_SNAPSHOT_LOCK:
+        if WATCHLIST_SNAPSHOT["data"] is None:
+            WATCHLIST_SNAPSHOT["data"] = rows[0]["data"]
+            WATCHLIST_SNAPSHOT["built_at"] = built_at
+
+def persist_watchlist_snapshot(data: dict, built_at: float):
+    try:
+        supabase_admin.table("app_snapshots").upsert({
+            "name": "watchlist",
+            "data": data,
+            "built_at": datetime.fromtimestamp(built_at, UTC).isoformat()
+        }, on_conflict="name").execute()
+    except Exception as e:
+        print("watchlist snapshot persist error:", e)
+
+def refresh_watchlist_snapshot():
+    generation = WATCHLIST_SNAPSHOT["generation"]
+    try:
+        started = time.time()
+        data = build_watchlist_snapshot()
+        with WATCHLIST_SNAPSHOT_LOCK:
+            WATCHLIST_SNAPSHOT["data"] = data
+            # 🔥 빌드 도중 종목이 바뀌었으면 바로 stale → 다음 요청에서 다시 갱신
+            fresh = generation == WATCHLIST_SNAPSHOT["generation"]
+            WATCHLIST_SNAPSHOT["built_at"] = started if fresh else 0
+            WATCHLIST_SNAPSHOT["error"] = None
+        if WATCHLIST_SNAPSHOT_PERSIST and fresh:
+            persist_watchlist_snapshot(data, started)
+        if fresh:
+            evaluate_alerts(data)
+    except Exception as e:
+        print("watchlist refresh error:", e)
+        WATCHLIST_SNAPSHOT["error"] = str(e)
+    finally:
+        WATCHLIST_SNAPSHOT["refreshing"] = False
+        WATCHLIST_SNAPSHOT_READY.set()
+
+def trigger_watchlist_refresh() -> bool:
+    """갱신 중이 아니면 백그라운드 갱신 시작 (동시 요청 1회로 합침)"""
+    with WATCHLIST_SNAPSHOT_LOCK:
+        if WATCHLIST_SNAPSHOT["refreshing"]:
+            return False
+        WATCHLIST_SNAPSHOT["refreshing"] = True
+        if WATCHLIST_SNAPSHOT["data"] is None:
+            WATCHLIST_SNAPSHOT_READY.clear()
+    threading.Thread(
+        target=refresh_watchlist_snapshot,
+        name="watchlist-refresh",
+        daemon=True
+    ).start()
+    return True
+
+def watchlist_max_age() -> float:
+    try:
+        phase = get_market_phase()
+    except Exception as e:
+        print("market phase error:", e)
+        phase = "REGULAR"
+    return WATCHLIST_FRESHNESS.get(phase, 60)
+
+def invalidate_watchlist_snapshot():
+    # 🔥 종목 추가/삭제 → 다음 요청이 아니라 지금 갱신 시작
+    with WATCHLIST_SNAPSHOT_LOCK:
+        WATCHLIST_SNAPSHOT["built_at"] = 0
+        WATCHLIST_SNAPSHOT["generation"] += 1
+    trigger_watchlist_refresh()
+
+@app.get("/watchlist")
+def watchlist():
+    if WATCHLIST_SNAPSHOT["data"] is None and WATCHLIST_SNAPSHOT_PERSIST:
+        load_persisted_watchlist_snapshot()
+
+    max_age = watchlist_max_age()
+    age = time.time() - WATCHLIST_SNAPSHOT["built_at"]
+    if age > max_age:
+        trigger_watchlist_refresh()
+
+    # 🔥 콜드 스타트만 첫 빌드를 잠깐 기다림 (이후는 항상 즉시 응답)
+    if WATCHLIST_SNAPSHOT["data"] is None:
+        WATCHLIST_SNAPSHOT_READY.wait(WATCHLIST_COLD_WAIT)
+
+    data = WATCHLIST_SNAPSHOT["data"]
+    if data is None:
+        return {
+            "market_open": False,
+            "next_open": None,
+            "items": [],
+            "pending": True,
+            "refreshing": WATCHLIST_SNAPSHOT["refreshing"],
+            "error": WATCHLIST_SNAPSHOT["error"]
+        }
+
+    age = time.time() - WATCHLIST_SNAPSHOT["built_at"]
+    return {
+        **data,
+        "snapshot_age": round(age, 1),
+        "max_age": max_age,
+        "stale": age > max_age,
+        "refreshing": WATCHLIST_SNAPSHOT["refreshing"],
+        "error": WATCHLIST_SNAPSHOT["error"]
+    }
+
+# =====================
+# 🔔 알림 규칙 — watchlist 스냅샷 갱신마다 평가 (별도 시세 조회 없음)
+# =====================
+# ALERTS_ENABLED=1 → 화면을 안 열어도 스냅샷을 주기적으로 갱신 (leader 노드만)
+ALERT_ENGINE = AlertEngine()
+ALERT_RULES_STATE = {"loaded_at": 0}
+ALERT_RULES_RELOAD = 60   # 초 (다른 replica 에서 바뀐 규칙 반영)
+ALERT_POLL = 10           # 초
+ALERTS_ENABLED = os.getenv("ALERTS_ENABLED") == "1"
+
+def load_alert_rules():
+    rows = (
+        supabase_admin
+        .table("alert_rules")
+        .select("*")
+        .eq("enabled", True)
+        .execute()
+    ).data or []
+    ALERT_ENGINE.load(rows)
+    ALERT_RULES_STATE["loaded_at"] = time.time()
+
+def cached_avg_prices(accounts: list[str]) -> dict[str, dict[str, float]]:
+    """잔고 캐시에 있는 평단가만 (KIS 호출 없음)"""
+    result = {}
+    for account in accounts:
+        try:
+            snapshot = broker.peek_overseas_balance(account=account)
+        except ValueError:
+            continue
+        if snapshot:
+            result[account] = {t: p["avg_price"] for t, p in snapshot["positions"].items()}
+    return result
+
+def evaluate_alerts(data: dict):
+    # 🔥 replica 여러 개면 leader 만 발송 (상태는 DB active_tickers 로 넘겨받음)
+    if leader is not None and not leader.is_leader():
+        if ALERT_ENGINE.rules:
+            ALERT_ENGINE.load([])
+            ALERT_RULES_STATE["loaded_at"] = 0
+        return
+    try:
+        if time.time() - ALERT_RULES_STATE["loaded_at"] > ALERT_RULES_RELOAD:
+            load_alert_rules()
+        fired, changed = ALERT_ENGINE.evaluate(
+            data.get("items") or [],
+            cached_avg_prices(ALERT_ENGINE.accounts)
+        )
+    except Exception as e:
+        print("alert evaluate error:", e)
+        return
+
+    fired_ids = {a["rule_id"] for a in fired}
+    now_iso = datetime.now(timezone.utc).isoformat()
+    for rule_id, active in changed.items():
+        values = {"active_tickers": active}
+        if rule_id in fired_ids:
+            values["last_fired_at"] = now_iso
+        try:
+            supabase_admin.table("alert_rules").update(values).eq("id", rule_id).execute()
+        except Exception as e:
+            print("alert state save error:", rule_id, e)
+
+    if fired:
+        send_telegram_message("🔔 알림\n\n" + "\n".join(format_alert(a) for a in fired))
+
+def alerts_loop():
+    while True:
+        time.sleep(ALERT_POLL)
+        if leader is not None and not leader.is_leader():
+            continue
+        if time.time() - WATCHLIST_SNAPSHOT["built_at"] > watchlist_max_age():
+            trigger_watchlist_refresh()
+
+@app.on_event("startup")
+def start_alerts_loop():
+    if not ALERTS_ENABLED:
+        return
+    threading.Thread(target=alerts_loop, name="alerts", daemon=True).start()
+
+class AlertRuleRequest(BaseModel):
+    kind: str
+    ticker: str | None = None
+    threshold: float | None = None
+    account_id: str | None = None
+
+@app.get("/api/alerts/rules")
+def list_alert_rules(user: str = Depends(get_current_user)):
+    rows = (
+        supabase_admin
+        .table("alert_rules")
+        .select("*")
+        .eq("user_id", user)
+        .order("id")
+        .execute()
+    ).data or []
+    return {"kinds": list(RULE_KINDS), "rules": rows}
+
+@app.post("/api/alerts/rules")
+def create_alert_rule(body: AlertRuleRequest, user: str = Depends(get_current_user)):
+    if body.kind not in RULE_KINDS:
+        raise HTTPException(400, f"알 수 없는 알림 종류: {body.kind}")
+    row = supabase_admin.table("alert_rules").insert({
+        "user_id": user,
+        "kind": body.kind,
+        "ticker": body.ticker.upper() if body.ticker else None,
+        "threshold": body.threshold,
+        "account_id": resolve_account(body.account_id),
+    }).execute().data
+    ALERT_RULES_STATE["loaded_at"] = 0
+    return {"rule": row[0] if row else None}
+
+@app.delete("/api/alerts/rules/{rule_id}")
+def delete_alert_rule(rule_id: int, user: str = Depends(get_current_user)):
+    supabase_admin.table("alert_rules").delete().eq("user_id", user).eq("id", rule_id).execute()
+    ALERT_RULES_STATE["loaded_at"] = 0
+    return {"status": "deleted", "id": rule_id}
+
 @app.get("/api/avg-price/{ticker}")
-def avg_price(ticker: str):
-    result = get_overseas_avg_price(ticker.upper())
+def avg_price(ticker: str, account: str | None = Query(None)):
+    # 🔥 잔고 스냅샷 재사용 (차트마다 inquire-balance 재호출 방지)
+    try:
+        result = broker.get_overseas_avg_price(
+            ticker.upper(),
+            max_age=BALANCE_CACHE_TTL,
+            account=resolve_account(account),
+            priority=PRIORITY_UI
+        )
+    except KISBusyError as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": "2"})
     return result
+
+def build_portfolio(account: str = DEFAULT_ACCOUNT):
+    snapshot = broker.get_overseas_balance(max_age=BALANCE_CACHE_TTL, account=account, priority=PRIORITY_UI)
+    positions = snapshot["positions"]
+    prices = get_realtime_prices(list(positions.keys()))
+
+    items = []
+    total_cost = 0.0
+    total_value = 0.0
+    priced_cost = 0.0
+    unpriced = []
+
+    for ticker, pos in positions.items():
+        avg = pos["avg_price"]
+        qty = pos["qty"]
+        # 🔥 실시간 가격 없으면 KIS 현재가 사용
+        cur = prices.get(ticker) or pos["kis_price"] or None
+
+        cost = pos["total_cost"] or avg * qty
+        value = cur * qty if cur else None
+        pnl = value - cost if value is not None else None
+        target = get_sell_target(avg) if avg > 0 else None
+
+        total_cost += cost
+        # 🔥 시세 없는 종목은 평가금액 / 손익 합계에서 제외 (원가로 채우면 손익 0% 로 보임)
+        if value is None:
+            unpriced.append(ticker)
+        else:
+            priced_cost += cost
+            total_value += value
+
+        items.append({
+            "ticker": ticker,
+            "name": pos["name"],
+            "excg": pos["excg"],
+            "qty": qty,
+            "sellable_qty": pos["sellable_qty"],
+            "avg_price": round(avg, 4),
+            "current_price": round(cur, 2) if cur else None,
+            "total_cost": round(cost, 2),
+            "market_value": round(value, 2) if value is not None else None,
+            "unrealized_pnl": round(pnl, 2) if pnl is not None else None,
+            "unrealized_pnl_pct": round(pnl / cost * 100, 2) if pnl is not None and cost else None,
+            # 🔥 +10% SELL 목표가까지 남은 거리
+            "sell_target": target,
+            "target_distance": round(target - cur, 2) if target and cur else None,
+            "target_distance_pct": round((target / cur - 1) * 100, 2) if target and cur else None,
+        })
+
+    items.sort(key=lambda x: x["ticker"])
+    total_pnl = total_value - priced_cost
+
+    return {
+        "positions": items,
+        "totals": {
+            "total_cost": round(total_cost, 2),
+            # market_value / 손익은 시세 있는 종목만 (partial=True 면 unpriced 종목 빠짐)
+            "market_value": round(total_value, 2),
+            "priced_cost": round(priced_cost, 2),
+            "unrealized_pnl": round(total_pnl, 2),
+            "unrealized_pnl_pct": round(total_pnl / priced_cost * 100, 2) if priced_cost else None,
+            "partial": bool(unpriced),
+            "unpriced": unpriced,
+            # 🔥 KIS output2 합계 그대로
+            "kis": snapshot["totals"],
+        },
+        "balance_fetched_at": datetime.fromtimestamp(snapshot["fetched_at"], UTC).isoformat(),
+    }
+
+@app.get("/api/portfolio")
+def portfolio(
+    account: str | None = Query(None),
+    user: str = Depends(get_current_user)
+):
+    account = resolve_account(account)
+    now = time.time()
+    cached = PORTFOLIO_CACHE.get(account)
+    if cached and now - cached["built_at"] < PORTFOLIO_CACHE_TTL:
+        return cached["data"]
+
+    try:
+        data = build_portfolio(account)
+    except KISBusyError as e:
+        # 🔥 주문 처리 중 + 캐시 없음 → 잠시 후 재시도
+        if cached:
+            return cached["data"]
+        raise HTTPException(503, str(e), headers={"Retry-After": "2"})
+    except Exception as e:
+        raise HTTPException(502, f"잔고 조회 실패: {e}")
+
+    PORTFOLIO_CACHE[account] = {"data": data, "built_at": now}
+    return data
+
+@app.get("/api/accounts")
+def accounts(user: str = Depends(get_current_user)):
+    return {
+        "default": DEFAULT_ACCOUNT,
+        "broker": broker.name,
+        "accounts": broker.list_accounts(),
+        "scheduler": broker.scheduler_status()
+    }
 # =====================
 # 프론트
 # =====================
@@ -1174,7 +2734,7 @@ def chart_data(ticker: str, user=Depends(get_current_user)):
         "price_source": p["price_source"],
     }
     
-def send_order_success_telegram(
+def format_order_success_message(
     order: dict,
     executed_price: float,
     executed_qty: int,
@@ -1185,7 +2745,7 @@ def send_order_success_telegram(
     # =========================
     # 🔥 반복 회차 총 개수 조회
     # =========================
-    total = get_repeat_total(db, order["repeat_group"])
+    total = get_repeat_total(db, order["repeat_group"], order.get("repeat_total"))
 
     # 🔥 실행 시각 문자열 변환
     executed_at_str = executed_at.astimezone().strftime("%Y-%m-%d %H:%M:%S")
@@ -1212,7 +2772,7 @@ def send_order_success_telegram(
     # 🔥 메시지 구성
     # =========================
     message = (
-        "✅ 예약 주문 성공\n\n"
+        "✅ 예약 주문 접수\n\n"
         f"종목: {order['ticker']}\n"
         f"구분: {side_label}\n"
         f"지정가: ${executed_price:,.2f}\n"
@@ -1226,10 +2786,10 @@ def send_order_success_telegram(
     if kis_msg:
         message += f"\nKIS: {kis_msg}"
 
-    send_telegram_message(message)
+    return message
 
 
-def send_order_fail_telegram(
+def format_order_fail_message(
     order: dict,
     error_msg: str,
     db,
@@ -1238,7 +2798,7 @@ def send_order_fail_telegram(
     # =========================
     # 🔥 반복 회차 총 개수 조회
     # =========================
-    total = get_repeat_total(db, order["repeat_group"])
+    total = get_repeat_total(db, order["repeat_group"], order.get("repeat_total"))
 
     # =========================
     # 🔥 execute_after 안전 처리
@@ -1278,10 +2838,80 @@ def send_order_fail_telegram(
     if kis_msg:
         message += f"\nKIS: {kis_msg}"
 
-    send_telegram_message(message)
-  
-@app.get("/reservations")
-def get_reservations(user: str = Depends(get_current_user)):
+    return message
+
+RESERVATION_PAGE_LIMIT = 50
+RESERVATION_PAGE_MAX = 200
+
+def encode_cursor(*values) -> str:
+    """keyset 페이지네이션 커서 (마지막 행의 정렬 키)"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str, size: int) -> tuple:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(400, "invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(400, "invalid cursor")
+    return tuple(values)
+
+def group_reservation_rows(rows: list[dict]) -> list[dict]:
+    """
+    RPC 없을 때: PENDING 전체 행 → repeat_group 당 1행 (reservation_groups 와 동일 형태)
+    """
+    groups = {}
+    for o in rows:
+        key = o.get("repeat_group") or f'id:{o["id"]}'
+        is_buy = o["side"].startswith("BUY")
+        amount = float(o["seed"]) / BUY_SLICES if is_buy else 0.0
+        g = groups.get(key)
+        if g is None:
+            g = groups[key] = {
+                **o,
+                "group_key": key,
+                "remaining": 0,
+                "remaining_required": 0.0,
+                "last_execute_after": o["execute_after"],
+            }
+        elif (o.get("repeat_index") or 0) < (g.get("repeat_index") or 0):
+            g.update(o)
+        g["remaining"] += 1
+        g["remaining_required"] += amount
+        g["last_execute_after"] = max(g["last_execute_after"], o["execute_after"])
+    result = []
+    for g in groups.values():
+        g["next_max_required"] = (
+            float(g["seed"]) / BUY_SLICES if g["side"].startswith("BUY") else 0.0
+        )
+        result.append(g)
+    result.sort(key=lambda g: (g["execute_after"], g["group_key"]))
+    return result
+
+def fetch_reservation_groups(user: str, after: tuple[str, str] | None, limit: int) -> tuple[list[dict], dict]:
+    """
+    repeat_group 당 1행 (다음 회차) + 남은 회차 수 / 남은 필요금액
+    Returns: (page rows, {"total_groups", "total_next_max_required"})
+    """
+    try:
+        rows = supabase_admin.rpc("reservation_groups", {
+            "p_user_id": user,
+            "p_after_execute": after[0] if after else None,
+            "p_after_group": after[1] if after else None,
+            "p_limit": limit,
+            "p_slices": BUY_SLICES,
+        }).execute().data or []
+        if rows:
+            totals = {
+                "total_groups": rows[0]["total_groups"],
+                "total_next_max_required": float(rows[0]["total_next_max_required"] or 0),
+            }
+        else:
+            totals = None
+        return rows, totals
+    except Exception as e:
+        print("reservation_groups RPC error:", e)
+
     res = (
         supabase_admin
         .table("queued_orders")
@@ -1291,53 +2921,122 @@ def get_reservations(user: str = Depends(get_current_user)):
         .order("repeat_index", desc=False)
         .execute()
     )
-    rows = res.data or []
-    # 🔥 같은 repeat_group 중 가장 작은 repeat_index만 남기기
-    grouped = {}
-    for o in rows:
-        group = o.get("repeat_group")
-        if not group:
-            grouped[id(o)] = o
-            continue
-        if group not in grouped:
-            grouped[group] = o
-        else:
-            if o.get("repeat_index", 0) < grouped[group].get("repeat_index", 0):
-                grouped[group] = o
-    rows = list(grouped.values())
-    # 🔥 수정: buying_power 한 번만 조회
-    raw_buying_power = get_overseas_buying_power()
+    groups = group_reservation_rows(res.data or [])
+    totals = {
+        "total_groups": len(groups),
+        "total_next_max_required": sum(g["next_max_required"] for g in groups),
+    }
+    if after:
+        groups = [g for g in groups if (g["execute_after"], g["group_key"]) > after]
+    return groups[:limit], totals
+
+RESERVATIONS_DEADLINE = 4  # 초
+
+@app.get("/reservations")
+def get_reservations(
+    cursor: str | None = Query(None),
+    limit: int = Query(RESERVATION_PAGE_LIMIT, ge=1, le=RESERVATION_PAGE_MAX),
+    user: str = Depends(get_current_user)
+):
+    after = decode_cursor(cursor, 2) if cursor else None
+    deadline = Deadline(RESERVATIONS_DEADLINE)
+    # 🔥 매수 가능 금액 (계좌별 KIS) 은 DB 조회와 동시에 (캐시 히트면 즉시)
+    buying_power_futures = {
+        account: API_EXECUTOR.submit(broker.get_buying_power, account=account, priority=PRIORITY_UI)
+        for account in broker.list_accounts()
+    }
+    rows, totals = fetch_reservation_groups(user, after, limit)
+    next_cursor = (
+        encode_cursor(rows[-1]["execute_after"], rows[-1]["group_key"])
+        if len(rows) == limit else None
+    )
+    # 🔥 다음 회차 주문 일괄 평가 (잔고 스냅샷 1회 + 시세 1회) — 마감 넘기면 상한 기준으로 응답
+    projection_future = API_EXECUTOR.submit(
+        evaluate_reservations, rows, deadline=deadline, priority=PRIORITY_UI
+    )
+    buying_power_by_account = {}
+    buying_power_pending = []
+    for account, future in buying_power_futures.items():
+        try:
+            buying_power_by_account[account] = future.result(timeout=deadline.remaining())
+        except FutureTimeout:
+            buying_power_pending.append(account)
+        except Exception as e:
+            print("buying power error:", account, e)
+    buying_power = sum(
+        float(info["buying_power"]) for info in buying_power_by_account.values()
+    )
+    projection_pending = False
     try:
-        if isinstance(raw_buying_power, dict):
-            buying_power = float(raw_buying_power.get("buying_power", 0))
-        else:
-            buying_power = float(raw_buying_power)
-    except:
-        buying_power = 0.0
+        projected = {
+            p["id"]: p for p in projection_future.result(timeout=deadline.remaining())["orders"]
+        }
+    except FutureTimeout:
+        projection_pending = True
+        projected = {}
+    except Exception as e:
+        print("reservation evaluate error:", e)
+        projected = {}
     total_required_amount = 0.0
+    page_max_required = 0.0
     enriched_rows = []
     for o in rows:
-        item = dict(o)
+        item = {
+            k: v for k, v in o.items()
+            if k not in ("total_groups", "total_next_max_required")
+        }
         # 🔥 repeat_label 생성
         if o.get("repeat_index") and o.get("repeat_total"):
             item["repeat_label"] = f'{o["repeat_index"]}/{o["repeat_total"]}'
-        # 🔥🔥 수정: 가격 조회 완전 제거 → seed/80 기준 계산
+        p = projected.get(o.get("id"))
+        if p:
+            item["projected_price"] = p["price"]
+            item["projected_qty"] = p["qty"]
+            item["projected_error"] = p["error"]
         if o["side"].startswith("BUY"):
-            required_amount = float(o["seed"]) / 80.0  # ✅ 최대 필요금액
+            max_amount = float(o["seed"]) / BUY_SLICES  # ✅ 최대 필요금액
+            # 🔥 예상 LOC 가격 기준, 평가 불가 시 seed/80 상한
+            if p and not p["error"]:
+                required_amount = float(p["required_amount"])
+            else:
+                required_amount = max_amount
             total_required_amount += required_amount
+            page_max_required += max_amount
             item["required_amount"] = required_amount
+            item["max_required_amount"] = max_amount
         else:
             item["required_amount"] = None
         enriched_rows.append(item)
+    # 🔥 이 페이지 밖 그룹은 seed/80 상한으로 합산 (전체 그룹 기준 합계)
+    if totals:
+        total_required_amount += max(0.0, totals["total_next_max_required"] - page_max_required)
     # 🔥 전체 부족 금액 계산
     total_shortage = max(0, total_required_amount - buying_power)
     return {
         "buying_power": buying_power,
+        "buying_power_by_account": {
+            account: {
+                "buying_power": info["buying_power"],
+                "by_exchange": info["by_exchange"],
+            }
+            for account, info in buying_power_by_account.items()
+        },
         "total_required_amount": total_required_amount,
         "total_shortage": total_shortage,
-        "reservations": enriched_rows
+        "total_groups": totals["total_groups"] if totals else len(enriched_rows),
+        "next_cursor": next_cursor,
+        "reservations": enriched_rows,
+        "buying_power_pending": buying_power_pending,
+        "projection_pending": projection_pending
     }
 
+@app.get("/reservations/projection")
+def get_reservations_projection(
+    session_date: date | None = Query(None),
+    user: str = Depends(get_current_user)
+):
+    return project_session_orders(user=user, base_date=session_date, priority=PRIORITY_UI)
+
 @app.get("/chart-page", response_class=HTMLResponse)
 def chart_page(request: Request):
     return templates.TemplateResponse("chart.html", {"request": request})
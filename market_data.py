@@ -0,0 +1,56 @@
+# market_data.py
+# =====================
+# 여러 종목 일봉 일괄 다운로드 (yfinance 1회 요청)
+# =====================
+from datetime import date, timedelta
+
+import pandas as pd
+import yfinance as yf
+
+FIELDS = ("Open", "High", "Low", "Close")
+
+
+def download_daily_bars(
+    tickers: list[str],
+    start: date | str,
+    end: date | str | None = None,
+    fields=FIELDS
+) -> dict[str, pd.DataFrame]:
+    """
+    Returns: {field: DataFrame(index=날짜, columns=종목)}
+    end 포함 (yfinance 는 end 미포함이라 +1일)
+    """
+    tickers = [t.upper() for t in tickers]
+    if isinstance(start, str):
+        start = date.fromisoformat(start)
+    if end is None:
+        end = date.today()
+    elif isinstance(end, str):
+        end = date.fromisoformat(end)
+
+    df = yf.download(
+        tickers,
+        start=start.isoformat(),
+        end=(end + timedelta(days=1)).isoformat(),
+        interval="1d",
+        group_by="column",
+        progress=False,
+        threads=True
+    )
+    if df is None or df.empty:
+        raise ValueError("No yfinance data")
+
+    bars = {}
+    for field in fields:
+        if isinstance(df.columns, pd.MultiIndex):
+            frame = df[field]
+        else:
+            # 🔥 단일 종목 + 단일 레벨 컬럼
+            frame = df[[field]].rename(columns={field: tickers[0]})
+        frame = frame.copy()
+        frame.columns = [str(c).upper() for c in frame.columns]
+        frame = frame.reindex(columns=tickers)
+        frame.index = pd.DatetimeIndex(frame.index).tz_localize(None).normalize()
+        bars[field] = frame.apply(pd.to_numeric, errors="coerce").astype(float)
+
+    return bars
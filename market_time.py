@@ -111,3 +111,47 @@ def get_next_n_trading_days(start_date, n):
     return days[:n]
 
 
+
+
+def get_session_bounds(base_date=None, now=None):
+    """
+    base_date 이후 아직 끝나지 않은 첫 정규장 (open, close)
+    (오늘 장이 이미 끝났으면 다음 거래일)
+    """
+    if now is None:
+        now = datetime.now(ny_tz)
+    if base_date is None:
+        base_date = now.date()
+    elif isinstance(base_date, datetime):
+        base_date = base_date.date()
+
+    schedule = nyse.schedule(
+        start_date=base_date,
+        end_date=base_date + timedelta(days=14)
+    )
+
+    for _, row in schedule.iterrows():
+        if row["market_close"] > now:
+            return row["market_open"], row["market_close"]
+
+    return None
+
+
+def get_last_completed_session(now=None):
+    """
+    now 기준 이미 끝난 마지막 정규장 날짜
+    (장 중 / 장 전이면 직전 거래일 — 진행 중 일봉 제외용)
+    """
+    if now is None:
+        now = datetime.now(ny_tz)
+
+    schedule = nyse.schedule(
+        start_date=now.date() - timedelta(days=14),
+        end_date=now.date()
+    )
+    done = schedule[schedule["market_close"] <= now]
+
+    if done.empty:
+        return None
+
+    return done.index[-1].date()
@@ -0,0 +1,125 @@
+-- 000_base_schema.sql
+-- 앱이 사용하는 기본 테이블 + 핫 쿼리용 인덱스 + cron RPC
+-- 🔥 소급 baseline: 001~ 보다 나중에 작성, 새 DB 에서 001 이전에 적용되도록 000 번호
+-- (기존 Supabase 프로젝트에 다시 실행해도 안전하도록 if not exists — 이후 마이그레이션이 정의한 함수는 건드리지 않음)
+-- cleanup_queued_orders 는 004_order_history (order_history 이관) 에서만 정의
+--
+-- 핫 쿼리
+--   cron  : queued_orders where status='PENDING' and execute_after <= now order by repeat_index
+--   cron  : queued_orders where repeat_group=? and repeat_index < ? and status in (PENDING, RUNNING)
+--   목록  : queued_orders where user_id=? and status='PENDING'            (003_reservation_groups)
+--   watch : rsi_history where ticker=? order by day desc limit 2           (002_rsi_history_latest)
+--
+-- 확인: python schema_check.py --dsn postgresql://localhost/mume_check
+
+-- =====================
+-- watchlist
+-- =====================
+create table if not exists watchlist (
+    ticker      text primary key,
+    created_at  timestamptz not null default now()
+);
+
+-- =====================
+-- rsi_history
+-- =====================
+-- 🔥 PK (ticker, day) = upsert on_conflict + 종목별 최근 N일 (역방향 index scan)
+create table if not exists rsi_history (
+    ticker      text not null,
+    day         date not null,
+    rsi         numeric(6, 2),
+    price       numeric(12, 2),
+    created_at  timestamptz not null default now(),
+    primary key (ticker, day)
+);
+
+-- =====================
+-- queued_orders
+-- =====================
+create table if not exists queued_orders (
+    id             bigint generated by default as identity primary key,
+    user_id        uuid not null,
+    ticker         text not null,
+    side           text not null,          -- BUY_MARKET | BUY_AVG | SELL
+    seed           numeric(14, 2),
+    execute_after  timestamptz not null,
+    status         text not null default 'PENDING',
+                   -- PENDING | RUNNING | DONE
+    repeat_group   uuid,
+    repeat_index   integer,
+    repeat_total   integer,
+    retry_count    integer not null default 0,
+    error          text,
+    executed_at    timestamptz,
+    created_at     timestamptz not null default now()
+);
+
+-- 🔥 cron 실행 대상: PENDING 만 인덱스에 남아 이력이 쌓여도 크기 일정
+create index if not exists queued_orders_pending_due_idx
+    on queued_orders (execute_after, repeat_index)
+    where status = 'PENDING';
+
+-- 🔥 그룹 순서 보장 / 회차 count / 그룹 삭제
+create index if not exists queued_orders_group_idx
+    on queued_orders (repeat_group, repeat_index, status);
+
+-- 🔥 완료 행 정리 (archive_queued_orders, 004)
+create index if not exists queued_orders_done_idx
+    on queued_orders (executed_at)
+    where status = 'DONE';
+
+-- =====================
+-- shift_group_forward
+-- =====================
+-- 운영 RPC 는 001 이전부터 Supabase 에 직접 만들어져 있음 → 이 본문은 main.py 호출 방식으로 역산한 것
+-- 🔥 없을 때만 생성 (운영 함수 덮어쓰지 않음 — create or replace 금지)
+--
+-- 회차 p_repeat_index 가 다음 거래일로 이월된 뒤 호출
+-- → 같은 그룹 이후 PENDING 회차를 한 칸씩 뒤로 (각자 다음 회차 시각으로)
+-- 마지막 회차: 뉴욕 현지 시각 기준 +1 평일 (서머타임 전환에도 같은 현지 시각)
+--   ⚠ 거래소 휴장일은 모름 (앱은 pandas_market_calendars / next_market_open 사용)
+do $do$
+begin
+    if to_regprocedure(format('%I.shift_group_forward(uuid, integer)', current_schema())) is not null then
+        return;
+    end if;
+
+    execute $fn$
+    create function shift_group_forward(
+        p_repeat_group uuid,
+        p_repeat_index integer
+    )
+    returns integer
+    language plpgsql
+    as $$
+    declare
+        v_count integer;
+    begin
+        with later as (
+            select q.id,
+                   q.execute_after at time zone 'America/New_York' as local_at,
+                   lead(q.execute_after) over (order by q.repeat_index) as next_execute
+            from queued_orders q
+            where q.repeat_group = p_repeat_group
+              and q.repeat_index > p_repeat_index
+              and q.status = 'PENDING'
+        )
+        update queued_orders q
+        set execute_after = coalesce(
+            l.next_execute,
+            (l.local_at + case extract(isodow from l.local_at)
+                when 5 then interval '3 days'      -- 금 → 월
+                when 6 then interval '2 days'      -- 토 → 월
+                else interval '1 day'
+            end) at time zone 'America/New_York'
+        )
+        from later l
+        where q.id = l.id;
+
+        get diagnostics v_count = row_count;
+        return v_count;
+    end;
+    $$
+    $fn$;
+end;
+$do$;
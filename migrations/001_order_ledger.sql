@@ -0,0 +1,26 @@
+-- 001_order_ledger.sql
+-- 주문 원장: order_ref(queued_order id / 수동 주문 id) + attempt 당 1회 전송
+create table if not exists order_ledger (
+    client_key   text primary key,              -- "{order_ref}:{attempt}"
+    order_ref    text not null,
+    attempt      integer not null default 0,
+    ticker       text not null,
+    side         text not null,                 -- buy | sell
+    price        numeric(12, 2) not null,
+    qty          integer not null,
+    status       text not null default 'SENDING',
+                 -- SENDING | ACCEPTED | REJECTED | UNKNOWN | NOT_FOUND
+    odno         text,                          -- KIS 주문번호
+    response     jsonb,
+    error        text,
+    created_at   timestamptz not null default now(),
+    updated_at   timestamptz not null default now()
+);
+
+create index if not exists order_ledger_order_ref_idx
+    on order_ledger (order_ref, attempt);
+
+-- 🔥 같은 KIS 주문번호를 두 원장 행이 가져가지 않도록
+create unique index if not exists order_ledger_odno_uidx
+    on order_ledger (odno)
+    where odno is not null;
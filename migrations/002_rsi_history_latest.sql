@@ -0,0 +1,25 @@
+-- 002_rsi_history_latest.sql
+-- watchlist 용: 종목별 최근 N개 rsi_history 를 RPC 1회로 조회
+-- (rsi_history (ticker, day desc) 인덱스를 종목마다 limit 으로 탐색)
+create or replace function rsi_history_latest(
+    p_tickers text[] default null,
+    p_limit   integer default 2
+)
+returns table (ticker text, day date, rsi numeric, price numeric, rn integer)
+language sql
+stable
+as $$
+    select t.ticker, h.day, h.rsi, h.price, h.rn
+    from unnest(
+        coalesce(p_tickers, array(select upper(w.ticker) from watchlist w))
+    ) as t(ticker)
+    cross join lateral (
+        select r.day, r.rsi, r.price,
+               (row_number() over (order by r.day desc))::integer as rn
+        from rsi_history r
+        where r.ticker = t.ticker
+        order by r.day desc
+        limit p_limit
+    ) h
+    order by t.ticker, h.rn;
+$$;
@@ -0,0 +1,81 @@
+-- 003_reservation_groups.sql
+-- /reservations 용: PENDING 예약을 repeat_group 당 1행으로 집계 + 커서 페이지네이션
+-- (전송량이 예약 일수가 아니라 그룹 수에 비례)
+--
+-- 커서 = 직전 페이지 마지막 행의 (next_execute_after, group_key)
+-- total_* 는 커서/limit 적용 전 전체 그룹 기준
+create index if not exists queued_orders_user_pending_idx
+    on queued_orders (user_id, repeat_group, repeat_index)
+    where status = 'PENDING';
+
+create or replace function reservation_groups(
+    p_user_id       uuid,
+    p_after_execute timestamptz default null,
+    p_after_group   text default null,
+    p_limit         integer default 50,
+    p_slices        numeric default 80
+)
+returns table (
+    id                      bigint,
+    user_id                 uuid,
+    ticker                  text,
+    side                    text,
+    seed                    numeric,
+    status                  text,
+    repeat_group            text,
+    group_key               text,
+    repeat_index            integer,
+    repeat_total            integer,
+    execute_after           timestamptz,
+    last_execute_after      timestamptz,
+    remaining               integer,
+    remaining_required      numeric,   -- 남은 BUY 회차 seed/p_slices 합
+    next_max_required       numeric,   -- 다음 회차 seed/p_slices (BUY 만)
+    total_groups            integer,
+    total_next_max_required numeric
+)
+language sql
+stable
+as $$
+    with pending as (
+        select q.*,
+               coalesce(q.repeat_group::text, 'id:' || q.id::text) as gkey
+        from queued_orders q
+        where q.user_id = p_user_id
+          and q.status = 'PENDING'
+    ),
+    agg as (
+        select gkey,
+               count(*)::integer as remaining,
+               max(execute_after) as last_execute_after,
+               coalesce(sum(seed / p_slices) filter (where side like 'BUY%'), 0) as remaining_required
+        from pending
+        group by gkey
+    ),
+    head as (
+        select distinct on (gkey) *
+        from pending
+        order by gkey, repeat_index, execute_after
+    ),
+    groups as (
+        select h.id, h.user_id, h.ticker, h.side, h.seed, h.status,
+               h.repeat_group::text as repeat_group, h.gkey as group_key,
+               h.repeat_index, h.repeat_total, h.execute_after,
+               a.last_execute_after, a.remaining, a.remaining_required,
+               case when h.side like 'BUY%' then h.seed / p_slices else 0 end as next_max_required
+        from head h
+        join agg a using (gkey)
+    ),
+    totals as (
+        select g.*,
+               (count(*) over ())::integer as total_groups,
+               sum(g.next_max_required) over () as total_next_max_required
+        from groups g
+    )
+    select *
+    from totals t
+    where p_after_execute is null
+       or (t.execute_after, t.group_key) > (p_after_execute, p_after_group)
+    order by t.execute_after, t.group_key
+    limit p_limit;
+$$;
@@ -0,0 +1,119 @@
+-- 004_order_history.sql
+-- 끝난 예약 주문 (DONE / FAILED / CANCELED) → order_history (월 단위 파티션, append-only)
+-- queued_orders 에는 PENDING / RUNNING 만 남도록 /cron/archive-orders 가 배치 단위로 이동
+create table if not exists order_history (
+    id             bigint not null,             -- queued_orders.id
+    user_id        uuid not null,
+    ticker         text not null,
+    side           text not null,
+    seed           numeric(14, 2),
+    execute_after  timestamptz,
+    status         text not null,
+    repeat_group   uuid,
+    repeat_index   integer,
+    repeat_total   integer,
+    retry_count    integer,
+    error          text,
+    executed_at    timestamptz,
+    created_at     timestamptz,
+    finished_at    timestamptz not null,        -- coalesce(executed_at, execute_after)
+    archived_at    timestamptz not null default now(),
+    primary key (id, finished_at)
+) partition by range (finished_at);
+
+create table if not exists order_history_default
+    partition of order_history default;
+
+-- 🔥 사용자별 최신순 조회 (/api/order-history)
+create index if not exists order_history_user_finished_idx
+    on order_history (user_id, finished_at desc, id desc);
+
+create index if not exists order_history_group_idx
+    on order_history (repeat_group, repeat_index);
+
+-- =====================
+-- 월 파티션 생성
+-- =====================
+create or replace function ensure_order_history_partition(p_month date)
+returns text
+language plpgsql
+as $$
+declare
+    v_start date := date_trunc('month', p_month)::date;
+    v_name  text := 'order_history_' || to_char(v_start, 'YYYYMM');
+begin
+    if to_regclass(v_name) is null then
+        execute format(
+            'create table %I partition of order_history for values from (%L) to (%L)',
+            v_name, v_start, (v_start + interval '1 month')::date
+        );
+    end if;
+    return v_name;
+end;
+$$;
+
+-- =====================
+-- 배치 이동
+-- =====================
+-- 끝난 지 p_min_age 지난 행을 최대 p_batch 개 이동, 이동한 행 수 반환
+-- (0 이 아니면 다시 호출 → 호출 측에서 시간 예산 안에서 반복)
+create or replace function archive_queued_orders(
+    p_batch   integer default 1000,
+    p_min_age interval default interval '1 day'
+)
+returns integer
+language plpgsql
+as $$
+declare
+    v_month date;
+    v_count integer;
+begin
+    create temp table if not exists _archive_batch (like queued_orders) on commit drop;
+    truncate _archive_batch;
+
+    insert into _archive_batch
+    select q.*
+    from queued_orders q
+    where q.status in ('DONE', 'FAILED', 'CANCELED')
+      and coalesce(q.executed_at, q.execute_after) < now() - p_min_age
+    order by q.id
+    limit p_batch
+    for update skip locked;
+
+    -- 🔥 default 파티션에 쌓이지 않도록 해당 월 파티션 먼저 생성
+    for v_month in
+        select distinct date_trunc('month', coalesce(executed_at, execute_after))::date
+        from _archive_batch
+    loop
+        perform ensure_order_history_partition(v_month);
+    end loop;
+
+    insert into order_history (
+        id, user_id, ticker, side, seed, execute_after, status,
+        repeat_group, repeat_index, repeat_total, retry_count, error,
+        executed_at, created_at, finished_at
+    )
+    select id, user_id, ticker, side, seed, execute_after, status,
+           repeat_group, repeat_index, repeat_total, retry_count, error,
+           executed_at, created_at, coalesce(executed_at, execute_after)
+    from _archive_batch
+    on conflict do nothing;
+
+    delete from queued_orders q
+    using _archive_batch b
+    where q.id = b.id;
+
+    get diagnostics v_count = row_count;
+    return v_count;
+end;
+$$;
+
+-- 🔥 이전 cron 의 매 실행 정리 호출 → 삭제 대신 이관 (호환용)
+create or replace function cleanup_queued_orders(
+    p_keep_days integer default 30
+)
+returns integer
+language sql
+as $$
+    select archive_queued_orders(1000, make_interval(days => p_keep_days));
+$$;
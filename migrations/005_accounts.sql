@@ -0,0 +1,143 @@
+-- 005_accounts.sql
+-- 다계좌: 주문/원장/이력에 KIS 계좌 id (kis_api.ACCOUNTS 키, 기본 'default')
+alter table queued_orders
+    add column if not exists account_id text not null default 'default';
+
+alter table order_ledger
+    add column if not exists account_id text not null default 'default';
+
+alter table order_history
+    add column if not exists account_id text not null default 'default';
+
+-- 🔥 KIS 주문번호는 계좌 단위로만 유일
+drop index if exists order_ledger_odno_uidx;
+create unique index if not exists order_ledger_account_odno_uidx
+    on order_ledger (account_id, odno)
+    where odno is not null;
+
+-- 🔥 이관 시 account_id 포함 (004 재정의)
+create or replace function archive_queued_orders(
+    p_batch   integer default 1000,
+    p_min_age interval default interval '1 day'
+)
+returns integer
+language plpgsql
+as $$
+declare
+    v_month date;
+    v_count integer;
+begin
+    create temp table if not exists _archive_batch (like queued_orders) on commit drop;
+    truncate _archive_batch;
+
+    insert into _archive_batch
+    select q.*
+    from queued_orders q
+    where q.status in ('DONE', 'FAILED', 'CANCELED')
+      and coalesce(q.executed_at, q.execute_after) < now() - p_min_age
+    order by q.id
+    limit p_batch
+    for update skip locked;
+
+    for v_month in
+        select distinct date_trunc('month', coalesce(executed_at, execute_after))::date
+        from _archive_batch
+    loop
+        perform ensure_order_history_partition(v_month);
+    end loop;
+
+    insert into order_history (
+        id, user_id, account_id, ticker, side, seed, execute_after, status,
+        repeat_group, repeat_index, repeat_total, retry_count, error,
+        executed_at, created_at, finished_at
+    )
+    select id, user_id, account_id, ticker, side, seed, execute_after, status,
+           repeat_group, repeat_index, repeat_total, retry_count, error,
+           executed_at, created_at, coalesce(executed_at, execute_after)
+    from _archive_batch
+    on conflict do nothing;
+
+    delete from queued_orders q
+    using _archive_batch b
+    where q.id = b.id;
+
+    get diagnostics v_count = row_count;
+    return v_count;
+end;
+$$;
+
+-- 🔥 /reservations 계좌별 잔고 평가용 account_id 포함 (003 재정의, 반환 형식 변경 → drop 후 생성)
+drop function if exists reservation_groups(uuid, timestamptz, text, integer, numeric);
+
+create function reservation_groups(
+    p_user_id       uuid,
+    p_after_execute timestamptz default null,
+    p_after_group   text default null,
+    p_limit         integer default 50,
+    p_slices        numeric default 80
+)
+returns table (
+    id                      bigint,
+    user_id                 uuid,
+    account_id              text,
+    ticker                  text,
+    side                    text,
+    seed                    numeric,
+    status                  text,
+    repeat_group            text,
+    group_key               text,
+    repeat_index            integer,
+    repeat_total            integer,
+    execute_after           timestamptz,
+    last_execute_after      timestamptz,
+    remaining               integer,
+    remaining_required      numeric,   -- 남은 BUY 회차 seed/p_slices 합
+    next_max_required       numeric,   -- 다음 회차 seed/p_slices (BUY 만)
+    total_groups            integer,
+    total_next_max_required numeric
+)
+language sql
+stable
+as $$
+    with pending as (
+        select q.*,
+               coalesce(q.repeat_group::text, 'id:' || q.id::text) as gkey
+        from queued_orders q
+        where q.user_id = p_user_id
+          and q.status = 'PENDING'
+    ),
+    agg as (
+        select gkey,
+               count(*)::integer as remaining,
+               max(execute_after) as last_execute_after,
+               coalesce(sum(seed / p_slices) filter (where side like 'BUY%'), 0) as remaining_required
+        from pending
+        group by gkey
+    ),
+    head as (
+        select distinct on (gkey) *
+        from pending
+        order by gkey, repeat_index, execute_after
+    ),
+    groups as (
+        select h.id, h.user_id, h.account_id, h.ticker, h.side, h.seed, h.status,
+               h.repeat_group::text as repeat_group, h.gkey as group_key,
+               h.repeat_index, h.repeat_total, h.execute_after,
+               a.last_execute_after, a.remaining, a.remaining_required,
+               case when h.side like 'BUY%' then h.seed / p_slices else 0 end as next_max_required
+        from head h
+        join agg a using (gkey)
+    ),
+    totals as (
+        select g.*,
+               (count(*) over ())::integer as total_groups,
+               sum(g.next_max_required) over () as total_next_max_required
+        from groups g
+    )
+    select *
+    from totals t
+    where p_after_execute is null
+       or (t.execute_after, t.group_key) > (p_after_execute, p_after_group)
+    order by t.execute_after, t.group_key
+    limit p_limit;
+$$;
@@ -0,0 +1,63 @@
+-- 006_app_leases.sql
+-- 여러 replica 중 한 곳만 cron 작업 실행: 이름 단위 lease (만료 시각 + fencing token)
+--   try_acquire_lease : 비었거나 만료됐거나 내가 가진 lease 면 획득/연장
+--   release_lease     : 내가 가진 lease 만 해제
+create table if not exists app_leases (
+    name         text primary key,
+    holder       text not null,
+    token        bigint not null default 1,     -- 🔥 holder 가 바뀔 때마다 증가 (fencing)
+    acquired_at  timestamptz not null default now(),
+    expires_at   timestamptz not null
+);
+
+create or replace function try_acquire_lease(
+    p_name        text,
+    p_holder      text,
+    p_ttl_seconds double precision default 30
+)
+returns table (acquired boolean, holder text, token bigint, expires_at timestamptz)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+    -- 🔥 clock_timestamp: 같은 트랜잭션 안에서도 실제 현재 시각
+    insert into app_leases as l (name, holder, token, acquired_at, expires_at)
+    values (
+        p_name, p_holder, 1, clock_timestamp(),
+        clock_timestamp() + make_interval(secs => p_ttl_seconds)
+    )
+    on conflict (name) do update
+    set holder      = excluded.holder,
+        token       = case when l.holder = excluded.holder then l.token else l.token + 1 end,
+        acquired_at = case when l.holder = excluded.holder then l.acquired_at else clock_timestamp() end,
+        expires_at  = excluded.expires_at
+    where l.holder = excluded.holder
+       or l.expires_at < clock_timestamp();
+
+    return query
+    select l.holder = p_holder, l.holder, l.token, l.expires_at
+    from app_leases l
+    where l.name = p_name;
+end;
+$$;
+
+create or replace function release_lease(
+    p_name   text,
+    p_holder text
+)
+returns boolean
+language plpgsql
+as $$
+declare
+    v_count integer;
+begin
+    -- 🔥 행은 남겨 token 유지 (다음 holder 는 token + 1)
+    update app_leases
+    set expires_at = clock_timestamp()
+    where name = p_name
+      and holder = p_holder;
+
+    get diagnostics v_count = row_count;
+    return v_count > 0;
+end;
+$$;
@@ -0,0 +1,8 @@
+-- 007_app_snapshots.sql
+-- 화면용 materialized 스냅샷 (WATCHLIST_SNAPSHOT_PERSIST=1)
+--   재시작 / 새 replica 도 upstream 조회 없이 마지막 스냅샷으로 즉시 응답
+create table if not exists app_snapshots (
+    name      text primary key,          -- 'watchlist'
+    data      jsonb not null,
+    built_at  timestamptz not null
+);
@@ -0,0 +1,136 @@
+-- 008_order_fills.sql
+-- 장 마감 후 체결 확인 (/cron/reconcile-fills)
+--   주문 접수 시 queued_orders.odno 저장 → KIS 주문체결내역과 (account_id, odno) 로 대조
+--   체결 수량 / 평균 체결가 / 상태를 record_order_fills 1회 호출로 일괄 기록
+alter table queued_orders
+    add column if not exists odno          text,
+    add column if not exists order_price   numeric(12, 2),
+    add column if not exists order_qty     integer,
+    add column if not exists filled_qty    integer,
+    add column if not exists filled_price  numeric(12, 4),
+    add column if not exists filled_amount numeric(14, 2),
+    add column if not exists fill_status   text,          -- FILLED | PARTIAL | UNFILLED
+    add column if not exists reconciled_at timestamptz;
+
+alter table order_history
+    add column if not exists odno          text,
+    add column if not exists order_price   numeric(12, 2),
+    add column if not exists order_qty     integer,
+    add column if not exists filled_qty    integer,
+    add column if not exists filled_price  numeric(12, 4),
+    add column if not exists filled_amount numeric(14, 2),
+    add column if not exists fill_status   text,
+    add column if not exists reconciled_at timestamptz;
+
+-- 🔥 확인 대상: 접수됐지만 아직 대조 안 된 주문만
+create index if not exists queued_orders_unreconciled_idx
+    on queued_orders (account_id, odno)
+    where odno is not null and reconciled_at is null;
+
+-- =====================
+-- 일괄 기록
+-- =====================
+-- p_fills: [{account_id, odno, filled_qty, filled_price, filled_amount, fill_status}]
+-- 이미 이관된 주문은 order_history 에 기록
+create or replace function record_order_fills(p_fills jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+    v_queued  integer;
+    v_history integer;
+begin
+    update queued_orders q
+    set filled_qty    = f.filled_qty,
+        filled_price  = f.filled_price,
+        filled_amount = f.filled_amount,
+        fill_status   = f.fill_status,
+        reconciled_at = now()
+    from jsonb_to_recordset(p_fills) as f(
+        account_id text, odno text, filled_qty integer,
+        filled_price numeric, filled_amount numeric, fill_status text
+    )
+    where q.account_id = f.account_id
+      and q.odno = f.odno;
+    get diagnostics v_queued = row_count;
+
+    update order_history h
+    set filled_qty    = f.filled_qty,
+        filled_price  = f.filled_price,
+        filled_amount = f.filled_amount,
+        fill_status   = f.fill_status,
+        reconciled_at = now()
+    from jsonb_to_recordset(p_fills) as f(
+        account_id text, odno text, filled_qty integer,
+        filled_price numeric, filled_amount numeric, fill_status text
+    )
+    where h.account_id = f.account_id
+      and h.odno = f.odno
+      and h.reconciled_at is null;
+    get diagnostics v_history = row_count;
+
+    return v_queued + v_history;
+end;
+$$;
+
+-- 🔥 이관 시 체결 컬럼 포함 (005 재정의)
+--   체결 대조 전 주문은 남겨 둠 (reconcile_fills 는 queued_orders 만 조회)
+--   대조 기간 (FILL_LOOKBACK_DAYS = 3일) 이 지나면 대조 못 했어도 이관
+create or replace function archive_queued_orders(
+    p_batch   integer default 1000,
+    p_min_age interval default interval '1 day'
+)
+returns integer
+language plpgsql
+as $$
+declare
+    v_month date;
+    v_count integer;
+begin
+    create temp table if not exists _archive_batch (like queued_orders) on commit drop;
+    truncate _archive_batch;
+
+    insert into _archive_batch
+    select q.*
+    from queued_orders q
+    where q.status in ('DONE', 'FAILED', 'CANCELED')
+      and coalesce(q.executed_at, q.execute_after) < now() - p_min_age
+      and (
+          q.odno is null
+          or q.reconciled_at is not null
+          or coalesce(q.executed_at, q.execute_after) < now() - interval '3 days'
+      )
+    order by q.id
+    limit p_batch
+    for update skip locked;
+
+    for v_month in
+        select distinct date_trunc('month', coalesce(executed_at, execute_after))::date
+        from _archive_batch
+    loop
+        perform ensure_order_history_partition(v_month);
+    end loop;
+
+    insert into order_history (
+        id, user_id, account_id, ticker, side, seed, execute_after, status,
+        repeat_group, repeat_index, repeat_total, retry_count, error,
+        executed_at, created_at, finished_at,
+        odno, order_price, order_qty, filled_qty, filled_price, filled_amount,
+        fill_status, reconciled_at
+    )
+    select id, user_id, account_id, ticker, side, seed, execute_after, status,
+           repeat_group, repeat_index, repeat_total, retry_count, error,
+           executed_at, created_at, coalesce(executed_at, execute_after),
+           odno, order_price, order_qty, filled_qty, filled_price, filled_amount,
+           fill_status, reconciled_at
+    from _archive_batch
+    on conflict do nothing;
+
+    delete from queued_orders q
+    using _archive_batch b
+    where q.id = b.id;
+
+    get diagnostics v_count = row_count;
+    return v_count;
+end;
+$$;
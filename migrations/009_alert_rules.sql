@@ -0,0 +1,20 @@
+-- 009_alert_rules.sql
+-- watchlist 알림 규칙 (alerts.AlertEngine)
+--   ticker null = watchlist 전 종목
+--   active_tickers = 지금 조건이 참인 종목 (edge-trigger 상태, 바뀔 때만 갱신)
+create table if not exists alert_rules (
+    id              bigint generated by default as identity primary key,
+    user_id         uuid not null,
+    account_id      text not null default 'default',   -- PRICE_OVER_AVG 평단가 계좌
+    ticker          text,
+    kind            text not null
+                    check (kind in ('RSI_BELOW', 'RSI_ABOVE', 'PRICE_OVER_AVG', 'CHANGE_PCT', 'RSI_DELTA')),
+    threshold       numeric(12, 4),                     -- null = 종류별 기본값
+    enabled         boolean not null default true,
+    active_tickers  text[] not null default '{}',
+    last_fired_at   timestamptz,
+    created_at      timestamptz not null default now()
+);
+
+create index if not exists alert_rules_user_idx
+    on alert_rules (user_id, id);
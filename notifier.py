@@ -0,0 +1,225 @@
+# notifier.py
+# =====================
+# 텔레그램 백그라운드 전송 큐
+# =====================
+# cron 루프는 메시지를 큐에 넣기만 하고 바로 다음 주문으로 넘어감
+# - 큐 크기 제한 (가득 차면 버리고 로그)
+# - 실행 1회분 메시지는 digest 1건으로 묶어서 전송
+# - 실패 시 지수 backoff 재시도 (429 는 retry_after 준수)
+import os
+import queue
+import threading
+import time
+
+import requests
+
+import tracing
+
+TELEGRAM_MAX_LEN = 4000   # 🔥 텔레그램 제한 4096 여유
+QUEUE_MAXSIZE = 200
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0        # 초 (1, 2, 4, 8 ...)
+
+
+class TelegramError(RuntimeError):
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def post_telegram_message(text: str):
+    """텔레그램 1건 전송 (실패 시 TelegramError)"""
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    chat_id = os.getenv("TELEGRAM_CHAT_ID")
+
+    if not token or not chat_id:
+        print("⚠️ Telegram env not set")
+        return
+
+    url = f"https://api.telegram.org/bot{token}/sendMessage"
+
+    payload = {
+        "chat_id": chat_id,
+        "text": text,
+        "parse_mode": "HTML"
+    }
+
+    try:
+        r = requests.post(url, json=payload, timeout=10)
+    except requests.exceptions.RequestException as e:
+        raise TelegramError(f"Telegram exception: {e}")
+
+    if r.status_code == 200:
+        return
+
+    retry_after = None
+    try:
+        retry_after = r.json().get("parameters", {}).get("retry_after")
+    except Exception:
+        pass
+
+    # 🔥 4xx (429 제외) 는 재시도해도 같은 결과
+    if 400 <= r.status_code < 500 and r.status_code != 429:
+        print("❌ Telegram send failed:", r.text)
+        return
+
+    raise TelegramError(f"Telegram send failed: {r.text}", retry_after)
+
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_LEN) -> list[str]:
+    """줄 단위로 limit 이하 조각으로 분할"""
+    chunks = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class NotificationBatch:
+    """
+    실행 1회분 메시지 모음 → flush() 시 digest 로 큐에 1건 등록
+    add() 에는 문자열 또는 문자열을 만드는 함수(DB 조회 등은 워커에서 실행)
+    """
+
+    def __init__(self, notifier: "TelegramNotifier", title: str):
+        self.notifier = notifier
+        self.title = title
+        self.parts = []
+
+    def add(self, part):
+        self.parts.append(part)
+
+    def flush(self) -> bool:
+        if not self.parts:
+            return True
+        parts, self.parts = self.parts, []
+        # 🔥 trace 중이면 전송이 끝날 때까지 run 파일 저장 보류
+        run = tracing.current_run()
+        if run is not None:
+            run.hold()
+        ok = self.notifier.enqueue({"title": self.title, "parts": parts, "trace": run})
+        if not ok and run is not None:
+            run.release()
+        return ok
+
+
+class TelegramNotifier:
+    def __init__(
+        self,
+        send_fn=post_telegram_message,
+        maxsize: int = QUEUE_MAXSIZE,
+        max_retries: int = MAX_RETRIES,
+        backoff: float = BACKOFF_BASE
+    ):
+        self.send_fn = send_fn
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    # =====================
+    # 등록 (절대 블로킹 안 함)
+    # =====================
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run,
+                name="telegram-notifier",
+                daemon=True
+            )
+            self._thread.start()
+
+    def enqueue(self, job: dict) -> bool:
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print("⚠ Telegram 큐 가득 참 → 메시지 버림:", job.get("title"))
+            return False
+
+    def send(self, part) -> bool:
+        return self.enqueue({"title": None, "parts": [part]})
+
+    def batch(self, title: str) -> NotificationBatch:
+        return NotificationBatch(self, title)
+
+    def join(self, timeout: float = 5.0):
+        """남은 메시지 전송 대기 (종료 시)"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+
+    # =====================
+    # 워커
+    # =====================
+    def _render(self, job: dict) -> list[str]:
+        texts = []
+        for part in job["parts"]:
+            try:
+                text = part() if callable(part) else part
+            except Exception as e:
+                print("⚠ Telegram 메시지 생성 실패:", e)
+                continue
+            if text:
+                texts.append(text)
+
+        if not texts:
+            return []
+
+        body = "\n\n────────\n\n".join(texts)
+        if job["title"] and len(texts) > 1:
+            body = f"{job['title']} ({len(texts)}건)\n\n{body}"
+        return split_message(body)
+
+    def _send_with_retry(self, text: str):
+        for i in range(self.max_retries + 1):
+            try:
+                self.send_fn(text)
+                return
+            except TelegramError as e:
+                if i == self.max_retries:
+                    print("❌ Telegram 재시도 초과:", e)
+                    return
+                wait = e.retry_after or self.backoff * (2 ** i)
+                time.sleep(wait)
+            except Exception as e:
+                print("❌ Telegram exception:", e)
+                return
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            run = job.get("trace")
+            try:
+                with tracing.activate(run):
+                    with tracing.span("render", "telegram", parts=len(job["parts"])):
+                        texts = self._render(job)
+                    for text in texts:
+                        with tracing.span("sendMessage", "telegram", chars=len(text)):
+                            self._send_with_retry(text)
+            finally:
+                self._queue.task_done()
+                if run is not None:
+                    run.release()
+
+
+notifier = TelegramNotifier()
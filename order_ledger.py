@@ -0,0 +1,302 @@
+# order_ledger.py
+# =====================
+# 주문 원장 (멱등 주문 전송)
+# =====================
+# order_ledger 테이블 (migrations/001_order_ledger.sql)
+#   client_key = "{order_ref}:{attempt}"  ← 같은 주문/회차는 한 번만 전송
+#   status: SENDING → ACCEPTED | REJECTED | UNKNOWN → (조회 후) ACCEPTED | NOT_FOUND
+#
+# 응답을 못 받은 주문(UNKNOWN)은 재전송 전에 KIS 주문내역에서
+# 원장 행 생성 이후 접수된 같은 종목/방향/수량/가격 주문을 찾아 ODNO 를 복구한다.
+#   - 응답 불명 직후 짧게 1회 대조 (RECONCILE_WAIT) → 못 찾으면 UNKNOWN 유지한 채
+#     OrderPendingError (cron 은 계좌 루프를 막지 않고 다음 tick 에 재시도)
+#   - KIS 주문내역 반영이 늦을 수 있어 UNKNOWN_WINDOW 가 지나도록 없을 때만 NOT_FOUND → 재전송
+#   - NOT_FOUND 도 이후 대조 (다음 submit_order / recheck_unresolved) 에서 다시 확인
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytz
+
+from kis_api import DEFAULT_ACCOUNT, KISOrderUnknownError
+from broker import broker
+
+kst_tz = pytz.timezone("Asia/Seoul")
+
+LEDGER_TABLE = "order_ledger"
+MAX_ATTEMPTS = 3
+RECONCILE_WAIT = 1.5                        # 🔥 응답 불명 직후 대조 전 대기 (초, cron 루프 안)
+UNKNOWN_WINDOW = timedelta(seconds=60)      # 🔥 이 시간 동안 주문내역에 없어야 미접수로 판단
+ORDER_TIME_SKEW = timedelta(seconds=5)   # KIS 주문시각 ↔ DB 시각 차이 여유
+UNRESOLVED_STATUSES = ["SENDING", "UNKNOWN", "NOT_FOUND"]
+
+
+class OrderPendingError(RuntimeError):
+    """응답 불명 주문 확인 중 (재전송하면 중복 위험) → 잠시 뒤 같은 order_ref 로 다시 호출"""
+
+
+def make_client_key(order_ref, attempt: int) -> str:
+    return f"{order_ref}:{attempt}"
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _update(db, client_key: str, values: dict):
+    db.table(LEDGER_TABLE).update({
+        **values,
+        "updated_at": _now_iso()
+    }).eq("client_key", client_key).execute()
+
+
+def _accepted_response(row: dict) -> dict:
+    # 🔥 order_overseas_stock 성공 응답과 같은 모양
+    return {
+        "rt_cd": "0",
+        "msg1": "접수 확인된 주문 (원장)",
+        "output": {"ODNO": row["odno"]},
+        "client_key": row["client_key"],
+        "duplicate": True,
+    }
+
+
+def _kis_order_at(k: dict) -> datetime | None:
+    """KIS 주문일시 (ord_dt / ord_tmd, 한국 시각)"""
+    try:
+        return kst_tz.localize(datetime.strptime(f"{k['order_date']}{k['order_time']}", "%Y%m%d%H%M%S"))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _find_kis_order(db, row: dict, kis_orders: list[dict]) -> dict | None:
+    """
+    원장 행과 같은 종목/방향/수량/가격의 KIS 주문 중
+    원장 행 생성 이후 접수됐고 아직 다른 원장 행이 차지하지 않은 주문 (먼저 접수된 것부터)
+    """
+    # 🔥 원장 행보다 먼저 들어간 주문 (같은 조건의 수동 주문 등) 은 우리 주문 아님
+    created_at = datetime.fromisoformat(row["created_at"]) - ORDER_TIME_SKEW if row.get("created_at") else None
+    candidates = []
+    for k in kis_orders:
+        if not (
+            k["odno"]
+            and k["ticker"] == row["ticker"].upper()
+            and k["side"] == row["side"]
+            and k["qty"] == int(row["qty"])
+            and abs(k["price"] - float(row["price"])) < 0.005
+        ):
+            continue
+        ordered_at = _kis_order_at(k)
+        if created_at is not None and (ordered_at is None or ordered_at < created_at):
+            continue
+        candidates.append((ordered_at, k))
+    if not candidates:
+        return None
+    candidates = [k for _, k in sorted(candidates, key=lambda c: c[0] or datetime.min.replace(tzinfo=timezone.utc))]
+
+    claimed = (
+        db.table(LEDGER_TABLE)
+        .select("odno")
+        .eq("account_id", row.get("account_id") or DEFAULT_ACCOUNT)
+        .in_("odno", [k["odno"] for k in candidates])
+        .execute()
+    ).data or []
+    claimed = {c["odno"] for c in claimed}
+
+    for k in candidates:
+        if k["odno"] not in claimed:
+            return k
+    return None
+
+
+def _expired(row: dict, now: datetime) -> bool:
+    # created_at 없으면 (알 수 없음) 만료로 봄
+    if not row.get("created_at"):
+        return True
+    return now - datetime.fromisoformat(row["created_at"]) >= UNKNOWN_WINDOW
+
+
+def reconcile(db, order_ref) -> dict | None:
+    """
+    응답 불명(SENDING/UNKNOWN) · 미확인(NOT_FOUND) 원장 행을 KIS 주문내역과 대조
+    못 찾은 행: UNKNOWN_WINDOW 지났으면 NOT_FOUND, 아니면 상태 유지 (주문내역 반영 전일 수 있음)
+    Returns: 접수 확인된 원장 행 | None
+    """
+    return _reconcile(db, order_ref)[0]
+
+
+def _reconcile(db, order_ref) -> tuple[dict | None, list[dict]]:
+    """Returns: (접수 확인된 원장 행 | None, 아직 판단 못 한 SENDING/UNKNOWN 행)"""
+    rows = (
+        db.table(LEDGER_TABLE)
+        .select("*")
+        .eq("order_ref", str(order_ref))
+        .in_("status", UNRESOLVED_STATUSES)
+        .order("attempt")
+        .execute()
+    ).data or []
+    if not rows:
+        return None, []
+
+    # 🔥 미국 장은 한국 날짜로 이틀에 걸침 → 첫 원장 행 전일~당일 조회
+    today = datetime.now(kst_tz).date()
+    first = min(
+        (datetime.fromisoformat(r["created_at"]).astimezone(kst_tz).date() for r in rows if r.get("created_at")),
+        default=today
+    )
+    kis_orders = broker.inquire_overseas_orders(
+        start_date=(min(first, today) - timedelta(days=1)).strftime("%Y%m%d"),
+        end_date=today.strftime("%Y%m%d"),
+        ticker=rows[0]["ticker"].upper(),
+        account=rows[0].get("account_id") or DEFAULT_ACCOUNT
+    )
+
+    now = datetime.now(timezone.utc)
+    found = None
+    waiting = []
+    for row in rows:
+        match = _find_kis_order(db, row, kis_orders)
+        if match:
+            if row["status"] == "NOT_FOUND":
+                # 🔥 미접수로 보고 재전송한 뒤 늦게 확인됨 → 중복 접수 가능
+                print(f"⚠ 미확인 주문 접수 확인: {row['client_key']} → {match['odno']}")
+            _update(db, row["client_key"], {
+                "status": "ACCEPTED",
+                "odno": match["odno"],
+                "error": None
+            })
+            found = found or {**row, "status": "ACCEPTED", "odno": match["odno"]}
+        elif row["status"] == "NOT_FOUND":
+            continue
+        elif _expired(row, now):
+            _update(db, row["client_key"], {"status": "NOT_FOUND"})
+        else:
+            waiting.append(row)
+    return found, waiting
+
+
+def recheck_unresolved(db, since: str, min_age: timedelta = timedelta(minutes=5)) -> list[dict]:
+    """
+    since 이후 원장 행 중 미확인 (UNKNOWN / NOT_FOUND / 오래된 SENDING) 주문 재대조
+    Returns: 늦게 접수 확인된 원장 행 목록
+    """
+    before = (datetime.now(timezone.utc) - min_age).isoformat()
+    rows = (
+        db.table(LEDGER_TABLE)
+        .select("order_ref")
+        .in_("status", UNRESOLVED_STATUSES)
+        .gte("created_at", since)
+        .lte("created_at", before)
+        .execute()
+    ).data or []
+
+    recovered = []
+    for order_ref in dict.fromkeys(r["order_ref"] for r in rows):
+        try:
+            found = reconcile(db, order_ref)
+        except Exception as e:
+            print("order recheck error:", order_ref, e)
+            continue
+        if found:
+            recovered.append(found)
+    return recovered
+
+
+def submit_order(
+    db,
+    order_ref,
+    ticker: str,
+    price: float,
+    qty: int,
+    side: str,
+    attempt: int = 0,
+    max_attempts: int = MAX_ATTEMPTS,
+    account: str | None = None
+) -> dict:
+    """
+    order_ref(queued_order id 등) 당 한 번만 접수되도록 주문 전송 (호출 1회당 최대 1회 전송)
+    응답 불명 / 확인 중이면 OrderPendingError → 호출 측이 잠시 뒤 다시 호출
+    (UNKNOWN_WINDOW 지나도록 주문내역에 없으면 다음 회차로 재전송, 총 max_attempts 회)
+    """
+    order_ref = str(order_ref)
+    account = account or DEFAULT_ACCOUNT
+
+    # =====================
+    # 1️⃣ 이미 접수된 주문이면 재전송 안 함
+    # =====================
+    existing = (
+        db.table(LEDGER_TABLE)
+        .select("*")
+        .eq("order_ref", order_ref)
+        .order("attempt")
+        .execute()
+    ).data or []
+
+    for row in existing:
+        if row["status"] == "ACCEPTED" and row.get("odno"):
+            return _accepted_response(row)
+
+    # =====================
+    # 2️⃣ 응답 불명 주문 대조
+    # =====================
+    if any(r["status"] in UNRESOLVED_STATUSES for r in existing):
+        found, waiting = _reconcile(db, order_ref)
+        if found:
+            return _accepted_response(found)
+        if waiting:
+            raise OrderPendingError(f"응답 불명 주문 확인 중: {waiting[-1]['client_key']}")
+
+    if existing:
+        attempt = max(attempt, max(r["attempt"] for r in existing) + 1)
+        unknown = sum(1 for r in existing if r["status"] in UNRESOLVED_STATUSES)
+        if unknown >= max_attempts:
+            raise RuntimeError(f"주문 접수 확인 실패 ({unknown}회 응답 불명)")
+
+    client_key = make_client_key(order_ref, attempt)
+
+    # 🔥 unique(client_key) → 같은 회차 동시 전송 차단
+    db.table(LEDGER_TABLE).insert({
+        "client_key": client_key,
+        "order_ref": order_ref,
+        "attempt": attempt,
+        "account_id": account,
+        "ticker": ticker.upper(),
+        "side": side,
+        "price": round(float(price), 2),
+        "qty": int(qty),
+        "status": "SENDING",
+    }).execute()
+
+    try:
+        resp = broker.order_overseas_stock(
+            ticker=ticker,
+            price=price,
+            qty=qty,
+            side=side,
+            account=account
+        )
+
+    except KISOrderUnknownError as e:
+        _update(db, client_key, {"status": "UNKNOWN", "error": str(e)})
+
+        # 🔥 짧게 1회만 대조 (계좌 루프 막지 않음) → 못 찾으면 UNKNOWN 그대로 다음 tick 에
+        time.sleep(RECONCILE_WAIT)
+        try:
+            found = reconcile(db, order_ref)
+        except Exception as re:
+            print("order reconcile error:", order_ref, re)
+            found = None
+        if found:
+            return _accepted_response(found)
+        raise OrderPendingError(f"응답 불명 주문 확인 중: {client_key} ({e})")
+
+    except Exception as e:
+        _update(db, client_key, {"status": "REJECTED", "error": str(e)})
+        raise
+
+    odno = (resp.get("output") or {}).get("ODNO")
+    _update(db, client_key, {
+        "status": "ACCEPTED",
+        "odno": odno,
+        "response": resp
+    })
+    return {**resp, "client_key": client_key}
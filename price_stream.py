@@ -0,0 +1,223 @@
+# price_stream.py
+# =====================
+# Alpaca 실시간 체결 스트림 → 메모리 최신 체결가 테이블
+# =====================
+# resolve_prices 는 get() 으로 O(1) 조회, 오래된 값이면 None → REST fallback
+#
+# 로컬 테스트:
+#   python price_stream.py --standin --port 8765          # 가짜 Alpaca 스트림 서버
+#   ALPACA_STREAM_URL=ws://localhost:8765 uvicorn main:app
+import asyncio
+import threading
+import time
+
+from alpaca.data.enums import DataFeed
+from alpaca.data.live import StockDataStream
+
+STALE_AFTER = 60  # 초
+
+
+class QuoteStream:
+    def __init__(
+        self,
+        api_key: str,
+        secret_key: str,
+        feed: str = "iex",
+        url_override: str | None = None,
+        stale_after: float = STALE_AFTER
+    ):
+        self._api_key = api_key
+        self._secret_key = secret_key
+        self._feed = DataFeed(feed)
+        self._url_override = url_override
+        self.stale_after = stale_after
+
+        self._prices: dict[str, tuple[float, float]] = {}   # symbol → (price, 수신 시각)
+        self._symbols: set[str] = set()
+        self._lock = threading.Lock()
+        self._stream = None
+        self._thread = None
+
+    # =====================
+    # 조회
+    # =====================
+    def get(self, symbol: str, max_age: float | None = None) -> float | None:
+        entry = self._prices.get(symbol.upper())
+        if entry is None:
+            return None
+        price, received_at = entry
+        if time.time() - received_at > (self.stale_after if max_age is None else max_age):
+            return None
+        return price
+
+    def status(self) -> dict:
+        now = time.time()
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "symbols": sorted(self._symbols),
+            "fresh": sorted(
+                s for s, (_, ts) in self._prices.items()
+                if now - ts <= self.stale_after
+            ),
+        }
+
+    # =====================
+    # 수신
+    # =====================
+    async def _on_trade(self, trade):
+        self._prices[trade.symbol.upper()] = (float(trade.price), time.time())
+
+    # =====================
+    # 구독 관리
+    # =====================
+    def _new_stream(self):
+        return StockDataStream(
+            self._api_key,
+            self._secret_key,
+            feed=self._feed,
+            url_override=self._url_override
+        )
+
+    def _run(self, stream):
+        # 🔥 스트림 전용 이벤트 루프 (run() 내부 asyncio.run)
+        try:
+            stream.run()
+        except Exception as e:
+            print("quote stream stopped:", e)
+
+    def set_symbols(self, symbols):
+        """
+        watchlist / 예약 종목 변경 시 호출 → 차이만 구독/해제
+        주기적으로 호출되므로 스트림이 죽어 있으면 (연결 끊김 등) 여기서 다시 시작
+        """
+        symbols = {s.upper() for s in symbols if s}
+
+        with self._lock:
+            added = symbols - self._symbols
+            removed = self._symbols - symbols
+            running = self._thread and self._thread.is_alive()
+            if not added and not removed and (running or not symbols):
+                return
+
+            # 🔥 구독 대상이 하나도 없으면 스트림 자체를 멈춤
+            if not symbols:
+                self._stop_locked()
+                self._symbols = set()
+                self._prices.clear()
+                return
+
+            if not running:
+                self._stream = self._new_stream()
+                self._stream.subscribe_trades(self._on_trade, *symbols)
+                self._thread = threading.Thread(
+                    target=self._run,
+                    args=(self._stream,),
+                    name="alpaca-quote-stream",
+                    daemon=True
+                )
+                self._thread.start()
+            else:
+                if added:
+                    self._stream.subscribe_trades(self._on_trade, *added)
+                if removed:
+                    self._stream.unsubscribe_trades(*removed)
+
+            for s in removed:
+                self._prices.pop(s, None)
+            self._symbols = symbols
+
+    def _stop_locked(self):
+        if self._stream and self._thread and self._thread.is_alive():
+            try:
+                self._stream.stop()
+            except Exception as e:
+                print("quote stream stop error:", e)
+        self._stream = None
+        self._thread = None
+
+    def stop(self):
+        with self._lock:
+            self._stop_locked()
+
+
+# =====================
+# 로컬 stand-in 서버 (Alpaca 스트림 프로토콜 최소 구현)
+# =====================
+async def run_standin_server(host: str = "localhost", port: int = 8765, interval: float = 1.0):
+    """
+    연결/인증 성공 응답 + 구독 종목마다 interval 초마다 가짜 체결 전송
+    """
+    import random
+    from datetime import datetime, timezone
+
+    import msgpack
+    import websockets
+
+    async def handler(ws):
+        subscribed = set()
+        await ws.send(msgpack.packb([{"T": "success", "msg": "connected"}]))
+        await ws.recv()
+        await ws.send(msgpack.packb([{"T": "success", "msg": "authenticated"}]))
+
+        async def reader():
+            async for raw in ws:
+                if isinstance(raw, str):
+                    raw = raw.encode()
+                msg = msgpack.unpackb(raw)
+                trades = set(msg.get("trades", []))
+                if msg.get("action") == "subscribe":
+                    subscribed.update(trades)
+                elif msg.get("action") == "unsubscribe":
+                    subscribed.difference_update(trades)
+                await ws.send(msgpack.packb([
+                    {"T": "subscription", "trades": sorted(subscribed)}
+                ]))
+
+        async def writer():
+            prices = {}
+            i = 0
+            while True:
+                await asyncio.sleep(interval)
+                for s in list(subscribed):
+                    prices[s] = prices.get(s, 100.0) * (1 + random.uniform(-0.002, 0.002))
+                    i += 1
+                    await ws.send(msgpack.packb([{
+                        "T": "t", "S": s, "i": i, "x": "V",
+                        "p": round(prices[s], 2), "s": 100, "c": ["@"], "z": "C",
+                        "t": msgpack.Timestamp.from_datetime(datetime.now(timezone.utc)),
+                    }], datetime=False))
+
+        try:
+            await asyncio.gather(reader(), writer())
+        except websockets.ConnectionClosed:
+            pass
+
+    async with websockets.serve(handler, host, port):
+        print(f"stand-in Alpaca stream on ws://{host}:{port}")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Alpaca quote stream")
+    parser.add_argument("--standin", action="store_true", help="로컬 stand-in 서버 실행")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="구독 테스트용 스트림 URL")
+    parser.add_argument("symbols", nargs="*")
+    args = parser.parse_args()
+
+    if args.standin:
+        asyncio.run(run_standin_server(port=args.port))
+    else:
+        import os
+
+        qs = QuoteStream(
+            os.environ["ALPACA_API_KEY"],
+            os.environ["ALPACA_SECRET_KEY"],
+            url_override=args.url
+        )
+        qs.set_symbols(args.symbols)
+        while True:
+            time.sleep(2)
+            print({s: qs.get(s) for s in args.symbols})
@@ -0,0 +1,153 @@
+# rsi_backfill.py
+# =====================
+# rsi_history 과거 구간 일괄 채우기
+# =====================
+# 여러 종목 일봉 1회 다운로드 → (날짜 × 종목) 행렬로 Wilder RSI 계산
+# → ticker,day 기준 chunk 단위 upsert
+#
+# 사용:
+#   python rsi_backfill.py --start 2020-01-01 [--end 2024-12-31] [--tickers TQQQ SOXL] [--overwrite]
+import argparse
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from market_data import download_daily_bars
+from market_time import get_last_completed_session
+
+RSI_PERIOD = 14
+WARMUP_DAYS = 365      # 🔥 RSI 수렴용 선행 구간 (달력일)
+UPSERT_CHUNK = 500
+
+
+def wilder_rsi_matrix(closes: np.ndarray, period: int = RSI_PERIOD) -> np.ndarray:
+    """
+    closes: (T, N) 종가 행렬 (NaN = 해당 종목 데이터 없음)
+    calculate_wilder_rsi_series 와 동일 (ewm alpha=1/period, adjust=False, min_periods=period)
+    종목별 NaN 은 건너뛰고 직전 유효 종가와 비교
+    """
+    closes = np.asarray(closes, dtype=float)
+    T, N = closes.shape
+    alpha = 1.0 / period
+
+    last = np.full(N, np.nan)
+    avg_gain = np.zeros(N)
+    avg_loss = np.zeros(N)
+    count = np.zeros(N, dtype=int)
+    out = np.full((T, N), np.nan)
+
+    for t in range(T):
+        c = closes[t]
+        valid = ~np.isnan(c)
+        step = valid & ~np.isnan(last)
+
+        delta = np.where(step, c - last, 0.0)
+        gain = np.maximum(delta, 0.0)
+        loss = np.maximum(-delta, 0.0)
+
+        first = step & (count == 0)
+        avg_gain = np.where(first, gain, np.where(step, avg_gain + alpha * (gain - avg_gain), avg_gain))
+        avg_loss = np.where(first, loss, np.where(step, avg_loss + alpha * (loss - avg_loss), avg_loss))
+        count += step
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+        out[t] = np.where(valid & (count >= period), rsi, np.nan)
+
+        last = np.where(valid, c, last)
+
+    return out
+
+
+def build_rsi_rows(
+    closes: pd.DataFrame,
+    start: date,
+    end: date,
+    period: int = RSI_PERIOD
+) -> list[dict]:
+    """(날짜 × 종목) 종가 → rsi_history 행 (start~end, RSI 있는 칸만)"""
+    rsi = wilder_rsi_matrix(closes.to_numpy(), period)
+    rsi = pd.DataFrame(rsi, index=closes.index, columns=closes.columns)
+
+    in_range = (closes.index.date >= start) & (closes.index.date <= end)
+    rsi = rsi[in_range].stack().rename("rsi")
+    price = closes[in_range].stack().rename("price")
+    df = pd.concat([rsi, price], axis=1, join="inner").dropna()
+
+    return [
+        {
+            "ticker": ticker,
+            "day": day.date().isoformat(),
+            "rsi": round(float(r), 2),
+            "price": round(float(p), 2),
+        }
+        for (day, ticker), r, p in zip(df.index, df["rsi"], df["price"])
+    ]
+
+
+def backfill_rsi_history(
+    db,
+    tickers: list[str],
+    start: date | str,
+    end: date | str | None = None,
+    overwrite: bool = False,
+    chunk_size: int = UPSERT_CHUNK
+) -> dict:
+    """
+    overwrite=False: 이미 있는 (ticker, day) 행은 유지 (빈 날짜만 채움)
+    end 는 마지막 완료 정규장까지 (진행 중 일봉 종가로 RSI 저장 방지)
+    """
+    if isinstance(start, str):
+        start = date.fromisoformat(start)
+    if isinstance(end, str):
+        end = date.fromisoformat(end)
+    last_session = get_last_completed_session()
+    if end is None or (last_session and end > last_session):
+        end = last_session or date.today() - timedelta(days=1)
+    tickers = sorted({t.upper() for t in tickers})
+    if not tickers:
+        return {"tickers": [], "rows_count": 0}
+
+    bars = download_daily_bars(
+        tickers,
+        start=start - timedelta(days=WARMUP_DAYS),
+        end=end,
+        fields=("Close",)
+    )
+    rows = build_rsi_rows(bars["Close"], start, end)
+
+    for i in range(0, len(rows), chunk_size):
+        db.table("rsi_history").upsert(
+            rows[i:i + chunk_size],
+            on_conflict="ticker,day",
+            ignore_duplicates=not overwrite
+        ).execute()
+
+    return {
+        "tickers": tickers,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "rows_count": len(rows),
+    }
+
+
+if __name__ == "__main__":
+    from supabase import create_client
+
+    parser = argparse.ArgumentParser(description="rsi_history backfill")
+    parser.add_argument("--start", required=True)
+    parser.add_argument("--end")
+    parser.add_argument("--tickers", nargs="*")
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    db = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_KEY"])
+
+    tickers = args.tickers
+    if not tickers:
+        res = db.table("watchlist").select("ticker").execute()
+        tickers = [r["ticker"] for r in (res.data or [])]
+
+    print(backfill_rsi_history(db, tickers, args.start, args.end, args.overwrite))
@@ -0,0 +1,211 @@
+# schema_check.py
+# =====================
+# migrations/*.sql 적용 + 핫 쿼리 EXPLAIN 확인 (로컬 Postgres)
+# =====================
+# 임시 스키마에 마이그레이션 적용 → 이력 행 수를 늘려가며 합성 데이터 채움
+# → 핫 쿼리마다 EXPLAIN (ANALYZE, BUFFERS) 로
+#   - 큰 테이블 Seq Scan 없음
+#   - 읽은 buffer 수가 이력 크기와 무관하게 일정 (max/min ≤ --max-growth)
+# 확인 후 스키마 삭제 (DB 는 비워 둔 로컬 DB 권장)
+#
+# 사용:
+#   pip install "psycopg[binary]"   (또는 psycopg2)
+#   python schema_check.py --dsn postgresql://localhost/mume_check --rows 20000 200000
+import argparse
+import glob
+import json
+import os
+import sys
+
+SCHEMA = "schema_check"
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+BIG_TABLES = ("queued_orders", "rsi_history")
+
+# 🔥 PENDING 은 고정, 이력(DONE / 과거 RSI)만 늘림
+PENDING_GROUPS = 50
+PENDING_PER_GROUP = 120
+TICKERS = 40
+USER_ID = "00000000-0000-0000-0000-000000000001"
+GROUP_ID = "00000000-0000-0000-0000-000000000100"
+
+HOT_QUERIES = {
+    "cron_due": """
+        select * from queued_orders
+        where status = 'PENDING' and execute_after <= now()
+        order by repeat_index
+    """,
+    "group_order": f"""
+        select id from queued_orders
+        where repeat_group = '{GROUP_ID}' and repeat_index < 60
+          and status in ('PENDING', 'RUNNING')
+    """,
+    "group_count": f"""
+        select count(*) from queued_orders where repeat_group = '{GROUP_ID}'
+    """,
+    "rsi_latest": """
+        select day, rsi, price from rsi_history
+        where ticker = 'T001' order by day desc limit 2
+    """,
+    "rsi_history_latest": """
+        select * from rsi_history_latest(null, 2)
+    """,
+    "reservation_groups": f"""
+        select * from reservation_groups('{USER_ID}', null, null, 50, 80)
+    """,
+}
+
+
+def connect(dsn: str):
+    try:
+        import psycopg
+        return psycopg.connect(dsn, autocommit=True)
+    except ImportError:
+        pass
+    try:
+        import psycopg2
+    except ImportError:
+        sys.exit("psycopg (v3) 또는 psycopg2 가 필요합니다: pip install \"psycopg[binary]\"")
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    return conn
+
+
+def apply_migrations(cur):
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql"))):
+        with open(path, encoding="utf-8") as f:
+            cur.execute(f.read())
+        print("applied", os.path.basename(path))
+
+
+def seed(cur, history_rows: int):
+    """
+    history_rows: DONE 주문 수 = RSI 이력 행 수
+    """
+    cur.execute("truncate queued_orders, rsi_history, watchlist")
+    cur.execute(
+        "insert into watchlist (ticker) "
+        "select 'T' || lpad(i::text, 3, '0') from generate_series(1, %s) i",
+        (TICKERS,)
+    )
+
+    # 지난 이력 (DONE)
+    cur.execute("""
+        insert into queued_orders
+            (user_id, ticker, side, seed, execute_after, status,
+             repeat_group, repeat_index, repeat_total, executed_at)
+        select %s::uuid,
+               'T' || lpad((i %% %s + 1)::text, 3, '0'),
+               case when i %% 3 = 0 then 'SELL' else 'BUY_MARKET' end,
+               8000,
+               now() - (i || ' minutes')::interval,
+               'DONE',
+               md5('done' || (i / 120))::uuid,
+               i %% 120 + 1,
+               120,
+               now() - (i || ' minutes')::interval
+        from generate_series(1, %s) i
+    """, (USER_ID, TICKERS, history_rows))
+
+    # 예약 (PENDING, 그룹마다 120 회차, 첫 회차만 실행 시각 도래)
+    cur.execute("""
+        insert into queued_orders
+            (user_id, ticker, side, seed, execute_after, status,
+             repeat_group, repeat_index, repeat_total)
+        select %s::uuid,
+               'T' || lpad((g %% %s + 1)::text, 3, '0'),
+               'BUY_MARKET',
+               8000,
+               now() + ((k - 1) || ' days')::interval - interval '1 minute',
+               'PENDING',
+               case when g = 1 then %s::uuid else md5('pending' || g)::uuid end,
+               k,
+               %s
+        from generate_series(1, %s) g, generate_series(1, %s) k
+    """, (USER_ID, TICKERS, GROUP_ID, PENDING_PER_GROUP, PENDING_GROUPS, PENDING_PER_GROUP))
+
+    # RSI 이력 (종목마다 history_rows / TICKERS 일)
+    cur.execute("""
+        insert into rsi_history (ticker, day, rsi, price)
+        select 'T' || lpad(t::text, 3, '0'),
+               current_date - d,
+               30 + random() * 40,
+               100 + random() * 10
+        from generate_series(1, %s) t, generate_series(1, %s) d
+    """, (TICKERS, max(2, history_rows // TICKERS)))
+
+    cur.execute("analyze queued_orders")
+    cur.execute("analyze rsi_history")
+    cur.execute("analyze watchlist")
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from walk(child)
+
+
+def explain(cur, sql: str) -> dict:
+    cur.execute(f"explain (analyze, buffers, format json) {sql}")
+    raw = cur.fetchone()[0]
+    doc = raw if isinstance(raw, list) else json.loads(raw)
+    root = doc[0]["Plan"]
+    nodes = list(walk(root))
+    return {
+        "buffers": root.get("Shared Hit Blocks", 0) + root.get("Shared Read Blocks", 0),
+        "ms": round(doc[0].get("Execution Time", 0.0), 3),
+        "seq_scans": sorted({
+            n["Relation Name"] for n in nodes
+            if n["Node Type"] == "Seq Scan" and n.get("Relation Name") in BIG_TABLES
+        }),
+        "indexes": sorted({n["Index Name"] for n in nodes if n.get("Index Name")}),
+    }
+
+
+def run(dsn: str, scales: list[int], max_growth: float) -> bool:
+    conn = connect(dsn)
+    cur = conn.cursor()
+    cur.execute(f"drop schema if exists {SCHEMA} cascade")
+    cur.execute(f"create schema {SCHEMA}")
+    cur.execute(f"set search_path = {SCHEMA}, public")
+
+    ok = True
+    try:
+        apply_migrations(cur)
+        results = {name: [] for name in HOT_QUERIES}
+
+        for rows in scales:
+            seed(cur, rows)
+            print(f"\n== history rows: {rows:,}")
+            for name, sql in HOT_QUERIES.items():
+                r = explain(cur, sql)
+                results[name].append(r)
+                print(
+                    f"  {name:<20} buffers={r['buffers']:<6} {r['ms']:>8} ms  "
+                    f"index={','.join(r['indexes']) or '-'}"
+                    + (f"  ⚠ seq scan: {','.join(r['seq_scans'])}" if r["seq_scans"] else "")
+                )
+
+        print()
+        for name, rs in results.items():
+            low = max(1, min(r["buffers"] for r in rs))
+            growth = max(r["buffers"] for r in rs) / low
+            seq = sorted({t for r in rs for t in r["seq_scans"]})
+            passed = not seq and growth <= max_growth
+            ok &= passed
+            print(f"{'PASS' if passed else 'FAIL'} {name:<20} buffer growth x{growth:.2f}"
+                  + (f" seq scan on {','.join(seq)}" if seq else ""))
+    finally:
+        cur.execute(f"drop schema if exists {SCHEMA} cascade")
+        conn.close()
+
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="migrations EXPLAIN check")
+    parser.add_argument("--dsn", default=os.getenv("CHECK_DATABASE_URL", "postgresql://localhost/mume_check"))
+    parser.add_argument("--rows", nargs="+", type=int, default=[20000, 200000])
+    parser.add_argument("--max-growth", type=float, default=2.0)
+    args = parser.parse_args()
+
+    sys.exit(0 if run(args.dsn, args.rows, args.max_growth) else 1)
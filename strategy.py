@@ -0,0 +1,108 @@
+# strategy.py
+# =====================
+# 반복 매수/매도 전략 규칙 (build_order_preview 와 동일)
+# =====================
+import numpy as np
+import pandas as pd
+
+BUY_SLICES = 80               # 🔥 seed / 80 = 1회 매수 금액
+BUY_MARKET_AVG_RATIO = 1.05   # 🔥 큰 수 매수 LOC 상한 (평단가 기준)
+BUY_MARKET_CUR_RATIO = 1.15   # 🔥 큰 수 매수 LOC 상한 (현재가 기준)
+SELL_TARGET_RATIO = 1.10      # 🔥 평단가 +10% 익절
+
+SIDES = ("BUY_MARKET", "BUY_AVG", "SELL")
+
+
+def _round2(a: np.ndarray) -> np.ndarray:
+    # 🔥 np.round(x, 2) 는 x*100 반올림 → 293.635 같은 값에서 round() 와 1센트 다름
+    #    주문 가격은 build_order_preview (round) 와 같아야 함 (주문 건수 규모라 느려도 됨)
+    return np.array([round(float(v), 2) for v in a], dtype=float)
+
+
+def evaluate_orders(
+    orders: pd.DataFrame,
+    slices: float = BUY_SLICES,
+    avg_ratio: float = BUY_MARKET_AVG_RATIO,
+    cur_ratio: float = BUY_MARKET_CUR_RATIO,
+    sell_ratio: float = SELL_TARGET_RATIO,
+) -> pd.DataFrame:
+    """
+    build_order_preview 규칙을 전체 주문에 한 번에 적용 (벡터 연산)
+
+    orders columns: side, avg_price, current_price, seed, qty_owned
+    추가 columns: price, qty, price_type, required_amount, proceeds, error
+    """
+    out = orders.copy()
+
+    side = out["side"].astype(str).to_numpy()
+    avg = pd.to_numeric(out["avg_price"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    cur = pd.to_numeric(out["current_price"], errors="coerce").to_numpy(dtype=float)
+    seed = pd.to_numeric(out["seed"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    owned = pd.to_numeric(
+        out["qty_owned"] if "qty_owned" in out else 0, errors="coerce"
+    )
+    owned = np.broadcast_to(np.nan_to_num(np.asarray(owned, dtype=float)), side.shape)
+
+    is_market = side == "BUY_MARKET"
+    is_avg = side == "BUY_AVG"
+    is_sell = side == "SELL"
+    is_buy = is_market | is_avg
+
+    # =====================
+    # 가격
+    # =====================
+    market_price = _round2(np.minimum(avg * avg_ratio, cur * cur_ratio))
+    avg_price = _round2(avg)
+    target = _round2(avg * sell_ratio)
+    better = cur > target
+
+    price = np.select(
+        [is_market, is_avg, is_sell & better, is_sell],
+        [market_price, avg_price, _round2(cur), target],
+        default=np.nan
+    )
+
+    # =====================
+    # 수량 (BUY: seed/80 // price, SELL: 매도 가능 수량 전량)
+    # =====================
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 🔥 floor(a / b) 는 반올림 오차로 a // b 와 1주 다를 수 있음 → 실행 경로와 같은 floor_divide
+        buy_qty = np.floor_divide(seed / slices, price)
+    buy_qty = np.where(np.isfinite(buy_qty), buy_qty, 0)
+    qty = np.where(is_buy, buy_qty, np.where(is_sell, np.floor(owned), 0)).astype(int)
+
+    price_type = np.select(
+        [is_buy, is_sell & better, is_sell],
+        ["LOC", "MARKET_BETTER", "TARGET"],
+        default=None
+    )
+
+    # =====================
+    # 오류 (cron 실행 시 실패 사유와 동일)
+    # =====================
+    error = np.select(
+        [
+            ~(is_buy | is_sell),
+            avg <= 0,
+            np.isnan(cur),
+            is_sell & (owned <= 0),
+            qty <= 0,
+        ],
+        [
+            "invalid side",
+            "보유 종목 없음",
+            "현재가 없음",
+            "매도 가능 수량 없음",
+            "수량 0",
+        ],
+        default=None
+    )
+    ok = pd.isna(error)
+
+    out["price"] = np.where(ok, price, np.nan)
+    out["qty"] = np.where(ok, qty, 0)
+    out["price_type"] = price_type
+    out["required_amount"] = np.where(ok & is_buy, price * qty, 0.0)
+    out["proceeds"] = np.where(ok & is_sell, price * qty, 0.0)
+    out["error"] = error
+    return out
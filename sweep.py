@@ -0,0 +1,228 @@
+# sweep.py
+# =====================
+# 전략 파라미터 sweep (ProcessPoolExecutor + 공유 메모리 가격 배열)
+# =====================
+# 가격 배열 (4, T, N) 은 SharedMemory 에 한 번만 올리고
+# 워커는 초기화 시 attach → 작업마다 시나리오 (종목 × 파라미터) 조각만 전달 (가격 pickle 없음)
+#
+# simulate 는 하루 단위 루프 (조각마다 고정 비용 ~0.23ms/일) + 시나리오 × 일 수에 비례하는 비용 (~0.11µs)
+#   → 고정 비용은 조각끼리 병렬로 겹치므로, 나눠서 줄어드는 건 시나리오 비례분뿐
+#   → 조각당 시나리오 비례 작업이 MIN_TASK_SECONDS 이상일 때만 나눔 (시나리오 수 × 일 수 기준)
+#   → 워커 수는 CPU 수 이하 (CPU 작업이라 초과분은 이득 없음)
+# 확장성 확인: python sweep.py --bench --bench-tickers 4000 --bench-days 3000
+#
+# 사용:
+#   python sweep.py --tickers TQQQ SOXL UPRO --start 2012-01-01 \
+#       --slices 40 60 80 --avg-ratio 1.0 1.05 --cur-ratio 1.1 1.15 \
+#       --sell-ratio 1.05 1.1 1.15 --out sweep.parquet
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from backtest import (
+    PARAM_COLUMNS, DEFAULT_SEED, build_param_grid, bars_to_arrays,
+    build_scenarios, scenario_frame, simulate
+)
+from market_data import download_daily_bars
+from strategy import (
+    BUY_SLICES, BUY_MARKET_AVG_RATIO, BUY_MARKET_CUR_RATIO, SELL_TARGET_RATIO
+)
+
+# 🔥 하루 단위 루프 오버헤드는 조각 수만큼 반복 → 워커당 큰 조각 1개가 유리
+TASKS_PER_WORKER = 1
+# 🔥 시나리오 1개 × 1일 비용 (초, simulate 실측: T=3000, 시나리오 36 → 18000 기울기)
+SCENARIO_DAY_SECONDS = 0.11e-6
+# 🔥 조각당 최소 시나리오 비례 작업 (초) — fork 워커 시작 ~15ms + 결과 pickle 보다 충분히 크게
+#    T=3000 일 → 조각당 ~600 시나리오, T=750 일 → ~2400 시나리오
+MIN_TASK_SECONDS = 0.2
+
+_worker = {}
+
+
+def _init_worker(shm_name: str, shape: tuple, dtype: str):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker["shm"] = shm   # 🔥 참조 유지 (GC 시 매핑 해제 방지)
+    _worker["prices"] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _run_chunk(tick_idx: np.ndarray, grid: dict, fee_rate: float) -> dict:
+    return simulate(_worker["prices"], tick_idx, grid, fee_rate)
+
+
+def _split(n_scenarios: int, n_days: int, n_chunks: int, min_task_seconds: float) -> list[slice]:
+    """
+    (종목 × 파라미터) 시나리오를 연속 구간으로 나눔
+    조각당 작업 (시나리오 수 × 일 수) 이 min_task_seconds 이상이 되도록 조각 수 제한
+    """
+    work = n_scenarios * n_days * SCENARIO_DAY_SECONDS
+    n_chunks = max(1, min(n_chunks, n_scenarios, int(work // max(min_task_seconds, 1e-9))))
+    bounds = np.linspace(0, n_scenarios, n_chunks + 1).astype(int)
+    return [slice(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def run_sweep(
+    bars: dict[str, pd.DataFrame],
+    params: pd.DataFrame,
+    workers: int | None = None,
+    fee_rate: float = 0.0,
+    min_task_seconds: float = MIN_TASK_SECONDS
+) -> pd.DataFrame:
+    prices, tickers, index = bars_to_arrays(bars)
+    return run_sweep_arrays(prices, tickers, index, params, workers, fee_rate, min_task_seconds)
+
+
+def run_sweep_arrays(
+    prices: np.ndarray,
+    tickers: list[str],
+    index: pd.DatetimeIndex,
+    params: pd.DataFrame,
+    workers: int | None = None,
+    fee_rate: float = 0.0,
+    min_task_seconds: float = MIN_TASK_SECONDS
+) -> pd.DataFrame:
+    prices = np.ascontiguousarray(prices)
+    cpus = os.cpu_count() or 1
+    workers = min(workers or cpus, cpus)
+
+    tick_idx, grid = build_scenarios(len(tickers), params)
+    chunks = _split(len(tick_idx), prices.shape[1], workers * TASKS_PER_WORKER, min_task_seconds)
+
+    if len(chunks) == 1:
+        # 🔥 프로세스 / 공유 메모리 비용 > 이득 → 현재 프로세스에서
+        metrics = simulate(prices, tick_idx, grid, fee_rate)
+        return scenario_frame(prices, tickers, index, tick_idx, grid, metrics)
+
+    shm = shared_memory.SharedMemory(create=True, size=prices.nbytes)
+    try:
+        np.ndarray(prices.shape, dtype=prices.dtype, buffer=shm.buf)[:] = prices
+
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(chunks)),
+            initializer=_init_worker,
+            initargs=(shm.name, prices.shape, prices.dtype.str)
+        ) as pool:
+            futures = [
+                pool.submit(_run_chunk, tick_idx[c], {k: v[c] for k, v in grid.items()}, fee_rate)
+                for c in chunks
+            ]
+            # 🔥 조각 순서대로 이어 붙임 (직렬 실행과 같은 행 순서)
+            parts = [f.result() for f in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    metrics = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    return scenario_frame(prices, tickers, index, tick_idx, grid, metrics)
+
+
+def bench(n_tickers: int, days: int, params: pd.DataFrame, workers_list: list[int]) -> pd.DataFrame:
+    """합성 가격 (random walk) 으로 워커 수별 실행 시간 / 직렬 대비 배속"""
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (days, n_tickers)), axis=0))
+    prices = np.stack([close * 0.999, close * 1.01, close * 0.99, close])
+    tickers = [f"T{i}" for i in range(n_tickers)]
+    index = pd.bdate_range("2000-01-03", periods=days)
+
+    rows = []
+    for w in workers_list:
+        t0 = time.perf_counter()
+        run_sweep_arrays(prices, tickers, index, params, workers=w)
+        rows.append({"workers": w, "seconds": time.perf_counter() - t0})
+    out = pd.DataFrame(rows)
+    out["speedup"] = out["seconds"].iloc[0] / out["seconds"]
+    return out
+
+
+def summarize(results: pd.DataFrame, rank_by: str = "median_cagr") -> pd.DataFrame:
+    """파라미터 조합별 종목 전체 요약 + 순위"""
+    summary = (
+        results
+        .groupby(list(PARAM_COLUMNS), as_index=False)
+        .agg(
+            tickers=("ticker", "nunique"),
+            mean_cagr=("cagr", "mean"),
+            median_cagr=("cagr", "median"),
+            worst_cagr=("cagr", "min"),
+            mean_return=("total_return", "mean"),
+            worst_drawdown=("max_drawdown", "max"),
+            mean_cycles=("cycles", "mean"),
+            mean_cycle_days=("avg_cycle_days", "mean"),
+            max_cash_usage=("max_cash_usage", "max"),
+            cash_short_days=("cash_short_days", "mean"),
+        )
+    )
+    summary["rank"] = summary[rank_by].rank(ascending=False, method="min").astype(int)
+    return summary.sort_values("rank").reset_index(drop=True)
+
+
+def write_table(df: pd.DataFrame, path: str) -> str:
+    """
+    .parquet → pyarrow/fastparquet 있으면 parquet, 없으면 .csv 로 대체
+    """
+    if path.endswith(".parquet"):
+        try:
+            df.to_parquet(path, index=False)
+            return path
+        except ImportError:
+            path = path[:-len(".parquet")] + ".csv"
+            print("⚠ parquet 엔진 없음 → CSV 저장")
+    df.to_csv(path, index=False)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="strategy parameter sweep")
+    parser.add_argument("--tickers", nargs="+")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--seed", nargs="+", type=float, default=[DEFAULT_SEED])
+    parser.add_argument("--slices", nargs="+", type=float, default=[BUY_SLICES])
+    parser.add_argument("--avg-ratio", nargs="+", type=float, default=[BUY_MARKET_AVG_RATIO])
+    parser.add_argument("--cur-ratio", nargs="+", type=float, default=[BUY_MARKET_CUR_RATIO])
+    parser.add_argument("--sell-ratio", nargs="+", type=float, default=[SELL_TARGET_RATIO])
+    parser.add_argument("--fee", type=float, default=0.0)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--rank-by", default="median_cagr")
+    parser.add_argument("--out", default="sweep.parquet")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--bench", action="store_true", help="합성 가격으로 워커 수별 확장성 측정")
+    parser.add_argument("--bench-tickers", type=int, default=4000)
+    parser.add_argument("--bench-days", type=int, default=3000)
+    args = parser.parse_args()
+
+    grid = build_param_grid(
+        slices=args.slices,
+        avg_ratio=args.avg_ratio,
+        cur_ratio=args.cur_ratio,
+        sell_ratio=args.sell_ratio,
+        seed=args.seed,
+    )
+
+    if args.bench:
+        cpus = os.cpu_count() or 1
+        workers_list = sorted({1, *[w for w in (2, 4, 8, 16, 32) if w <= cpus], cpus})
+        print(f"{args.bench_tickers} tickers × {len(grid)} params × {args.bench_days} days, {cpus} CPU")
+        print(bench(args.bench_tickers, args.bench_days, grid, workers_list).to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+        raise SystemExit
+
+    if not args.tickers or not args.start:
+        parser.error("--tickers / --start 필요 (또는 --bench)")
+    bars = download_daily_bars(args.tickers, args.start, args.end)
+
+    t0 = time.time()
+    results = run_sweep(bars, grid, workers=args.workers, fee_rate=args.fee)
+    elapsed = time.time() - t0
+
+    summary = summarize(results, rank_by=args.rank_by)
+    results_path = write_table(results, args.out)
+    base, _ = os.path.splitext(args.out)
+    summary_path = write_table(summary, f"{base}_summary.csv")
+
+    print(f"{len(results)} scenarios ({len(grid)} params × {len(args.tickers)} tickers) in {elapsed:.2f}s")
+    print(f"results → {results_path}, summary → {summary_path}")
+    print(summary.head(args.top).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
@@ -0,0 +1,108 @@
+# tests/test_alerts.py
+# 알림 엔진 edge-trigger: crossing 1회당 1번, 값 없는 종목 상태 유지, 종목 변경 / 재시작 후 상태 보존
+from alerts import AlertEngine
+
+
+def item(ticker, rsi=None, price=100.0, **extra):
+    return {"ticker": ticker, "rsi": rsi, "current_price": price, "current_change_pct": 0.0, "rsi_change": 0.0, **extra}
+
+
+def rule(rid, kind="RSI_BELOW", threshold=30, **extra):
+    return {"id": rid, "kind": kind, "threshold": threshold, "user_id": "u", **extra}
+
+
+def fired_pairs(fired):
+    return sorted((a["rule_id"], a["ticker"]) for a in fired)
+
+
+def test_fires_once_per_crossing_and_rearms():
+    engine = AlertEngine()
+    engine.load([rule(1)])
+
+    fired, changed = engine.evaluate([item("TQQQ", rsi=25)], {})
+    assert fired_pairs(fired) == [(1, "TQQQ")]
+    assert changed == {1: ["TQQQ"]}
+
+    # 조건 유지 → 다시 발송 안 함, 저장할 변경도 없음
+    fired, changed = engine.evaluate([item("TQQQ", rsi=20)], {})
+    assert fired == [] and changed == {}
+
+    # 조건 해제 → 재무장 (발송 없음, active_tickers 비움)
+    fired, changed = engine.evaluate([item("TQQQ", rsi=45)], {})
+    assert fired == [] and changed == {1: []}
+
+    # 다시 crossing → 1번 더
+    fired, _ = engine.evaluate([item("TQQQ", rsi=29)], {})
+    assert fired_pairs(fired) == [(1, "TQQQ")]
+
+
+def test_pending_and_stale_items_keep_state():
+    engine = AlertEngine()
+    engine.load([rule(1)])
+    engine.evaluate([item("TQQQ", rsi=25), item("SOXL", rsi=50)], {})
+
+    # 값 없음 (pending / stale / 조회 실패) → 이전 상태 그대로, 발송 / 변경 없음
+    fired, changed = engine.evaluate([
+        item("TQQQ", rsi=50, pending=True),
+        item("SOXL", rsi=10, stale=True),
+    ], {})
+    assert fired == [] and changed == {}
+    fired, changed = engine.evaluate([item("TQQQ", rsi=None), item("SOXL", rsi=None)], {})
+    assert fired == [] and changed == {}
+
+    # 값이 돌아오면 TQQQ 는 여전히 참 (재발송 없음), SOXL 은 새 crossing
+    fired, _ = engine.evaluate([item("TQQQ", rsi=25), item("SOXL", rsi=10)], {})
+    assert fired_pairs(fired) == [(1, "SOXL")]
+
+
+def test_state_follows_tickers_when_watchlist_changes():
+    engine = AlertEngine()
+    engine.load([rule(1)])
+    engine.evaluate([item("TQQQ", rsi=25), item("SOXL", rsi=25)], {})
+
+    # 종목 추가 / 순서 변경 → 기존 종목 상태는 이름 기준으로 유지
+    fired, _ = engine.evaluate([item("UPRO", rsi=25), item("SOXL", rsi=25), item("TQQQ", rsi=25)], {})
+    assert fired_pairs(fired) == [(1, "UPRO")]
+    assert engine.state.shape == (1, 3)
+
+    # 종목 삭제 → 행렬 축소, 남은 종목은 계속 참
+    fired, _ = engine.evaluate([item("TQQQ", rsi=25)], {})
+    assert fired == []
+    assert engine.state.shape == (1, 1) and engine.state.all()
+
+    # 삭제됐던 종목이 다시 들어오면 새 crossing
+    fired, _ = engine.evaluate([item("TQQQ", rsi=25), item("SOXL", rsi=25)], {})
+    assert fired_pairs(fired) == [(1, "SOXL")]
+
+
+def test_load_restores_persisted_active_tickers():
+    # 🔥 재시작: 메모리 상태 없음 → alert_rules.active_tickers 로 복원
+    engine = AlertEngine()
+    engine.load([rule(1, active_tickers=["TQQQ"]), rule(2, kind="RSI_ABOVE", threshold=70)])
+
+    fired, _ = engine.evaluate([item("TQQQ", rsi=25), item("SOXL", rsi=25)], {})
+    assert fired_pairs(fired) == [(1, "SOXL")]
+
+
+def test_reload_keeps_in_memory_state_over_persisted():
+    engine = AlertEngine()
+    engine.load([rule(1)])
+    engine.evaluate([item("TQQQ", rsi=25)], {})
+
+    # 규칙 수정 / 추가 후 재로드 → 저장값이 늦어도 메모리 상태 우선, 새 규칙은 저장값
+    engine.load([rule(1, active_tickers=[]), rule(2, kind="PRICE_OVER_AVG", threshold=None, active_tickers=["TQQQ"])])
+    fired, _ = engine.evaluate([item("TQQQ", rsi=25, price=120.0)], {"default": {"TQQQ": 100.0}})
+    assert fired == []
+
+
+def test_price_over_avg_uses_rule_account():
+    engine = AlertEngine()
+    engine.load([
+        rule(1, kind="PRICE_OVER_AVG", threshold=None, account_id="a"),
+        rule(2, kind="PRICE_OVER_AVG", threshold=None, account_id="b"),
+    ])
+    fired, _ = engine.evaluate(
+        [item("TQQQ", price=111.0)],
+        {"a": {"TQQQ": 100.0}, "b": {"TQQQ": 105.0}},
+    )
+    assert fired_pairs(fired) == [(1, "TQQQ")]
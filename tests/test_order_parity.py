@@ -0,0 +1,105 @@
+# tests/test_order_parity.py
+# strategy.evaluate_orders (벡터) ↔ main.build_order_preview (주문 1건) 결과 일치
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+for k, v in {
+    "SUPABASE_URL": "https://test.supabase.co",
+    "SUPABASE_ANON_KEY": "eyJhbGciOiJIUzI1NiJ9.e30.x",
+    "SUPABASE_SERVICE_KEY": "eyJhbGciOiJIUzI1NiJ9.e30.x",
+    "KIS_APP_KEY": "k", "KIS_APP_SECRET": "s", "KIS_ACCOUNT_NO": "12345678-01",
+    "ALPACA_API_KEY": "k", "ALPACA_SECRET_KEY": "s",
+    "JWT_SECRET": "j", "CRON_SECRET": "c",
+    "ADMIN_ID": "a", "ADMIN_PW": "p", "ADMIN_USER_UUID": "u",
+}.items():
+    os.environ.setdefault(k, v)
+
+import main  # noqa: E402
+from strategy import SIDES, evaluate_orders  # noqa: E402
+
+
+def make_orders() -> pd.DataFrame:
+    rows = []
+    # 🔥 경계값: 평단가 0, 현재가 > 목표가, 목표가 정확히 같음, 수량 0 (seed 부족 / 보유 0)
+    edge = [
+        (0.0, 50.0, 4000, 10),
+        (50.0, 60.0, 4000, 10),
+        (50.0, 55.0, 4000, 10),
+        (50.0, 40.0, 4000, 0),
+        (50.0, 40.0, 10, 3.7),
+        (33.33, 29.99, 8000, 1),
+        (0.07, 0.09, 80, 100),
+    ]
+    rng = np.random.default_rng(7)
+    random = [
+        (
+            round(float(rng.uniform(0.5, 300)), 4),
+            round(float(rng.uniform(0.5, 300)), 4),
+            float(rng.choice([0, 100, 4000, 12345.67, 80000])),
+            float(rng.choice([0, 1, 2.5, 40])),
+        )
+        for _ in range(300)
+    ]
+    for avg, cur, seed, owned in edge + random:
+        for side in SIDES:
+            rows.append({
+                "side": side,
+                "avg_price": avg,
+                "current_price": cur,
+                "seed": seed,
+                "qty_owned": owned,
+            })
+    return pd.DataFrame(rows)
+
+
+def preview(row: dict) -> dict | None:
+    try:
+        return main.build_order_preview(row)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def test_evaluate_orders_matches_build_order_preview():
+    orders = make_orders()
+    result = evaluate_orders(orders)
+
+    for row, out in zip(orders.to_dict("records"), result.to_dict("records")):
+        p = preview(row)
+        if pd.isna(out["error"]):
+            # 🔥 주문 가능 → 가격 / 수량 / 가격 유형 모두 같아야 함
+            assert p is not None, row
+            assert out["price"] == pytest.approx(p["price"], abs=1e-9), row
+            assert out["qty"] == p["qty"], row
+            assert out["price_type"] == p["price_type"], row
+        else:
+            # 🔥 evaluate 오류 = cron 이 주문하지 않는 경우
+            #    (preview 가 raise 하거나, SELL 수량 없음 / 평단가 0 → 실행 경로에서 거절)
+            assert p is None or not p["qty"] or row["avg_price"] <= 0, (row, out["error"])
+
+
+@pytest.mark.parametrize("side", SIDES)
+def test_zero_avg_price_is_rejected(side):
+    out = evaluate_orders(pd.DataFrame([{
+        "side": side, "avg_price": 0, "current_price": 50.0, "seed": 4000, "qty_owned": 5,
+    }])).iloc[0]
+    assert out["error"] == "보유 종목 없음"
+    assert out["qty"] == 0
+
+
+def test_sell_above_target_uses_current_price():
+    row = {"side": "SELL", "avg_price": 50.0, "current_price": 60.0, "seed": 0, "qty_owned": 3.9}
+    out = evaluate_orders(pd.DataFrame([row])).iloc[0]
+    p = main.build_order_preview(row)
+    assert (out["price"], out["qty"], out["price_type"]) == (60.0, 3, "MARKET_BETTER")
+    assert (p["price"], p["qty"], p["price_type"]) == (60.0, 3, "MARKET_BETTER")
+
+
+def test_buy_with_too_small_seed_is_zero_qty():
+    row = {"side": "BUY_AVG", "avg_price": 50.0, "current_price": 40.0, "seed": 10, "qty_owned": 0}
+    out = evaluate_orders(pd.DataFrame([row])).iloc[0]
+    assert out["error"] == "수량 0"
+    with pytest.raises(ValueError):
+        main.build_order_preview(row)
@@ -0,0 +1,64 @@
+# tests/test_price_breaker.py
+# 가격 조회 circuit breaker: open → half-open (시험 호출 1회) → closed
+import os
+import time
+
+for k, v in {
+    "SUPABASE_URL": "https://test.supabase.co",
+    "SUPABASE_ANON_KEY": "eyJhbGciOiJIUzI1NiJ9.e30.x",
+    "SUPABASE_SERVICE_KEY": "eyJhbGciOiJIUzI1NiJ9.e30.x",
+    "KIS_APP_KEY": "k", "KIS_APP_SECRET": "s", "KIS_ACCOUNT_NO": "12345678-01",
+    "ALPACA_API_KEY": "k", "ALPACA_SECRET_KEY": "s",
+    "JWT_SECRET": "j", "CRON_SECRET": "c",
+    "ADMIN_ID": "a", "ADMIN_PW": "p", "ADMIN_USER_UUID": "u",
+}.items():
+    os.environ.setdefault(k, v)
+
+import main  # noqa: E402
+
+
+def test_hedged_price_recovers_after_cooldown(monkeypatch):
+    alpaca = main.CircuitBreaker("alpaca", threshold=3, cooldown=0.2)
+    yahoo = main.CircuitBreaker("yahoo", threshold=3, cooldown=0.2)
+    monkeypatch.setitem(main.PRICE_BREAKERS, "alpaca", alpaca)
+    monkeypatch.setitem(main.PRICE_BREAKERS, "yahoo", yahoo)
+
+    calls = {"alpaca": 0, "yahoo": 0}
+    healthy = {"ok": False}
+
+    def fake_alpaca(ticker):
+        calls["alpaca"] += 1
+        if not healthy["ok"]:
+            raise RuntimeError("down")
+        return {"last": 10.0}
+
+    def fake_yahoo(ticker):
+        calls["yahoo"] += 1
+        raise RuntimeError("down")
+
+    monkeypatch.setattr(main, "fetch_alpaca_last_trade", fake_alpaca)
+    monkeypatch.setattr(main, "fetch_yahoo_last", fake_yahoo)
+
+    # 연속 실패 → 둘 다 open
+    for _ in range(3):
+        assert main.hedged_last_price("TQQQ") is None
+    assert alpaca.state() == "open"
+    assert yahoo.state() == "open"
+
+    # open 동안은 upstream 호출 없음
+    before = dict(calls)
+    assert main.hedged_last_price("TQQQ") is None
+    assert calls == before
+
+    # cooldown 후 half-open → 시험 호출이 실제로 나가고 성공하면 closed
+    healthy["ok"] = True
+    time.sleep(0.25)
+    assert alpaca.state() == "half-open"
+    result = main.hedged_last_price("TQQQ")
+    assert result == {"last": 10.0, "source": "alpaca"}
+    assert calls["alpaca"] == before["alpaca"] + 1
+    assert alpaca.state() == "closed"
+
+    # 복구 후 정상 조회
+    for _ in range(3):
+        assert main.hedged_last_price("TQQQ")["source"] == "alpaca"
@@ -0,0 +1,57 @@
+# tests/test_rsi_backfill.py
+# rsi_backfill.wilder_rsi_matrix (날짜 × 종목 일괄) ↔ main.calculate_wilder_rsi_series (종목 1개) 일치
+import os
+
+import numpy as np
+import pandas as pd
+
+for k, v in {
+    "SUPABASE_URL": "https://test.supabase.co",
+    "SUPABASE_ANON_KEY": "eyJhbGciOiJIUzI1NiJ9.e30.x",
+    "SUPABASE_SERVICE_KEY": "eyJhbGciOiJIUzI1NiJ9.e30.x",
+    "KIS_APP_KEY": "k", "KIS_APP_SECRET": "s", "KIS_ACCOUNT_NO": "12345678-01",
+    "ALPACA_API_KEY": "k", "ALPACA_SECRET_KEY": "s",
+    "JWT_SECRET": "j", "CRON_SECRET": "c",
+    "ADMIN_ID": "a", "ADMIN_PW": "p", "ADMIN_USER_UUID": "u",
+}.items():
+    os.environ.setdefault(k, v)
+
+import main  # noqa: E402
+from rsi_backfill import wilder_rsi_matrix  # noqa: E402
+
+
+def make_closes() -> pd.DataFrame:
+    rng = np.random.default_rng(32)
+    days = pd.bdate_range("2023-01-02", periods=400)
+    walk = 50 * np.exp(np.cumsum(rng.normal(0, 0.03, (len(days), 4)), axis=0))
+    closes = pd.DataFrame(walk, index=days, columns=["TQQQ", "SOXL", "UPRO", "NEW"])
+    # 🔥 NaN 구간: 상장 전 (앞부분), 중간 결측, 연속 결측, 보합 (loss 0)
+    closes.iloc[:120, 3] = np.nan
+    closes.iloc[[50, 51, 200, 333], 0] = np.nan
+    closes.iloc[10:40, 1] = np.nan
+    closes.iloc[300:330, 2] = closes.iloc[299, 2]
+    return closes
+
+
+def test_matrix_matches_series():
+    closes = make_closes()
+    rsi = wilder_rsi_matrix(closes.to_numpy())
+
+    for j, ticker in enumerate(closes.columns):
+        expected = main.calculate_wilder_rsi_series(closes[ticker])
+        got = pd.Series(rsi[:, j], index=closes.index)
+
+        # 종가 없는 날은 RSI 도 없음
+        assert got[closes[ticker].isna()].isna().all(), ticker
+        got = got[closes[ticker].notna()]
+
+        assert got.isna().equals(expected.isna()), ticker
+        np.testing.assert_allclose(got.dropna(), expected.dropna(), rtol=0, atol=1e-13, err_msg=ticker)
+
+
+def test_first_rsi_after_period_steps():
+    closes = make_closes()
+    rsi = wilder_rsi_matrix(closes.to_numpy(), period=14)
+    # 🔥 상장 후 종가 15개 (변화 14번) 째부터 RSI
+    first = np.flatnonzero(~np.isnan(rsi[:, 3]))[0]
+    assert first == 120 + 14
@@ -0,0 +1,246 @@
+# tracing.py
+# =====================
+# cron 실행 1회분 timeline (Chrome trace-event JSON)
+# =====================
+# 실행마다 파일 1개 → https://ui.perfetto.dev 또는 chrome://tracing 에서 열기
+#   - span("이름", "분류") : 중첩 구간 (스레드별 줄, 시작/길이 μs)
+#   - 실행 중이 아니면 (trace 꺼짐) span 은 아무것도 안 함
+#   - 스레드풀로 넘길 때는 bind(fn) (contextvar 는 새 스레드로 안 넘어감)
+#   - 텔레그램 워커처럼 실행 뒤에 끝나는 작업은 hold() / release() → 끝난 뒤 파일 저장
+#
+# CRON_TRACE=1 → 모든 cron 실행 기록 (또는 ?trace=true 로 1회)
+# CRON_TRACE_DIR=/tmp/mume_traces  CRON_TRACE_KEEP=50 (오래된 파일부터 삭제)
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from uuid import uuid4
+
+TRACE_ENABLED = os.getenv("CRON_TRACE") == "1"
+TRACE_DIR = os.getenv("CRON_TRACE_DIR", "/tmp/mume_traces")
+TRACE_KEEP = int(os.getenv("CRON_TRACE_KEEP", "50"))
+
+PHASE = "phase"   # 🔥 요약의 단계별 시간 = 이 분류 span 을 이름별로 합산
+
+_current = contextvars.ContextVar("trace_run", default=None)
+
+# 파일 → 요약 (파일은 쓴 뒤 안 바뀜)
+SUMMARY_CACHE = {}
+
+
+class TraceRun:
+    def __init__(self, name: str, directory: str = TRACE_DIR, keep: int = TRACE_KEEP):
+        self.name = name
+        self.started_at = datetime.now(timezone.utc)
+        # 🔥 ms 까지 → 파일명 정렬 = 시작 순서
+        self.id = f"{self.started_at:%Y%m%dT%H%M%S}{self.started_at.microsecond // 1000:03d}-{name}-{uuid4().hex[:6]}"
+        self.directory = directory
+        self.keep = keep
+        self.args = {}
+        self.total = None
+        self._t0 = time.perf_counter()
+        self._events = []
+        self._threads = {}
+        self._holds = 0
+        self._ended = False
+        self._lock = threading.Lock()
+
+    def add(self, name: str, cat: str, start: float, end: float, args: dict | None = None):
+        tid = threading.get_ident()
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": round((start - self._t0) * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": tid,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self._events.append(event)
+            self._threads.setdefault(tid, threading.current_thread().name)
+
+    # ---------------------
+    # 종료 / 저장
+    # ---------------------
+    def hold(self):
+        with self._lock:
+            self._holds += 1
+
+    def release(self):
+        with self._lock:
+            self._holds -= 1
+            ready = self._ended and self._holds == 0
+        if ready:
+            self._write()
+
+    def end(self):
+        with self._lock:
+            self.total = time.perf_counter() - self._t0
+            self._ended = True
+            ready = self._holds == 0
+        if ready:
+            self._write()
+
+    def summary(self) -> dict:
+        phases = {}
+        upstream = {}
+        orders = 0
+        for e in self._events:
+            ms = e["dur"] / 1000
+            if e["cat"] == PHASE:
+                phases[e["name"]] = round(phases.get(e["name"], 0) + ms, 1)
+            elif e["cat"] == "order":
+                orders += 1
+            else:
+                u = upstream.setdefault(e["cat"], {"count": 0, "ms": 0})
+                u["count"] += 1
+                u["ms"] = round(u["ms"] + ms, 1)
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "total_ms": round((self.total or 0) * 1000, 1),
+            "orders": orders,
+            "phases": phases,
+            "upstream": upstream,
+            **self.args,
+        }
+
+    def _write(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._lock:
+                events = list(self._events)
+                threads = dict(self._threads)
+            pid = os.getpid()
+            meta = [
+                {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": f"cron {self.name}"}}
+            ] + [
+                {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": n}}
+                for tid, n in threads.items()
+            ]
+            path = os.path.join(self.directory, f"{self.id}.json")
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({
+                    "traceEvents": meta + events,
+                    "displayTimeUnit": "ms",
+                    "otherData": self.summary(),
+                }, f)
+            os.replace(tmp, path)
+            prune(self.directory, self.keep)
+        except Exception as e:
+            print("trace write error:", self.id, e)
+
+
+# =====================
+# span
+# =====================
+def current_run() -> TraceRun | None:
+    return _current.get()
+
+
+@contextmanager
+def trace_run(name: str, enabled: bool | None = None):
+    """
+    with trace_run("execute-reservations", enabled=trace) as run:
+        ...   # run 은 trace 꺼져 있으면 None
+    """
+    if not (TRACE_ENABLED if enabled is None else enabled):
+        yield None
+        return
+    run = TraceRun(name)
+    token = _current.set(run)
+    try:
+        yield run
+    finally:
+        _current.reset(token)
+        run.end()
+
+
+@contextmanager
+def activate(run: TraceRun | None):
+    """다른 스레드에서 run 이어서 기록"""
+    if run is None:
+        yield None
+        return
+    token = _current.set(run)
+    try:
+        yield run
+    finally:
+        _current.reset(token)
+
+
+def bind(fn):
+    """스레드풀 submit 용: 현재 run 을 붙여서 실행"""
+    run = _current.get()
+    if run is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        with activate(run):
+            return fn(*args, **kwargs)
+    return bound
+
+
+@contextmanager
+def span(name: str, cat: str = PHASE, **args):
+    run = _current.get()
+    if run is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        args["error"] = str(e)[:200]
+        raise
+    finally:
+        run.add(name, cat, start, time.perf_counter(), args)
+
+
+# =====================
+# 보관 / 조회
+# =====================
+def _trace_files(directory: str) -> list[str]:
+    # 🔥 파일명이 시작 시각으로 시작 → 이름순 = 시간순
+    return sorted(glob.glob(os.path.join(directory, "*.json")))
+
+
+def prune(directory: str = TRACE_DIR, keep: int = TRACE_KEEP):
+    files = _trace_files(directory)
+    for path in files[:max(0, len(files) - keep)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        SUMMARY_CACHE.pop(path, None)
+
+
+def list_runs(limit: int = 20, directory: str = TRACE_DIR) -> list[dict]:
+    runs = []
+    for path in reversed(_trace_files(directory)[-limit:]):
+        summary = SUMMARY_CACHE.get(path)
+        if summary is None:
+            try:
+                with open(path) as f:
+                    summary = json.load(f).get("otherData") or {}
+            except (OSError, ValueError) as e:
+                print("trace read error:", path, e)
+                continue
+            SUMMARY_CACHE[path] = summary
+        runs.append(summary)
+    return runs
+
+
+def trace_path(run_id: str, directory: str = TRACE_DIR) -> str | None:
+    # 🔥 경로 조작 방지: 목록에 있는 파일만
+    path = os.path.join(directory, f"{run_id}.json")
+    return path if path in _trace_files(directory) else None